@@ -0,0 +1,228 @@
+from array import array
+from bisect import bisect_left
+
+from CatalogParserClass import is_valid_ean13
+from CushionClass import Cushion
+from ItemTableClass import ItemTable
+
+
+class Resolution:
+    """The result of resolving a scanned barcode: the item it points to and the kind of correction applied."""
+    EXACT = "exact"
+    REPLACED = "replaced"
+    MULTIPLE = "multiple"
+    UNKNOWN = "unknown"
+
+    def __init__(self, correction: str, item: Cushion = None, candidates: list = None):
+        self.correction = correction
+        # The resolved item; None if the barcode is unknown or if the user has to choose between several items.
+        self.item = item
+        # The possible items if the scanned barcode has been put on several item types.
+        self.candidates = candidates if candidates is not None else []
+
+
+class CorrectionGraph:
+    """
+    The correction rules of the corrections file, compiled into the final result of every barcode that has a rule.
+    "erstat" rules are followed to the end of the chain, so a barcode replaced by a barcode that is itself replaced
+    resolves to the last one, and the items of "flere" rules are looked up once, here, instead of on every scan.
+    Chains that loop or end in an unknown barcode are described in self.errors instead of being followed.
+    """
+    def __init__(self, index: "BarcodeIndex", replacements: dict, multiple_choice_replacements: dict):
+        # Barcodes with a rule as keys; the Resolution that a scan of them gets as values.
+        self.resolutions = {}
+        self.errors = []
+        for barcode, candidates in multiple_choice_replacements.items():
+            items = []
+            for candidate in candidates:
+                # Unknown barcodes are left out; the wrong barcode itself is often listed, in case it is a real item.
+                if not index.contains(candidate) and candidate not in replacements:
+                    continue
+                item = self.follow(candidate, index, replacements, multiple_choice_replacements, barcode)
+                if isinstance(item, Cushion) and item not in items:
+                    items.append(item)
+            self.resolutions[barcode] = Resolution(Resolution.MULTIPLE, candidates=items)
+        for barcode in replacements:
+            # A correct barcode is never replaced, and barcodes used for several items are handled above.
+            if index.contains(barcode) or barcode in multiple_choice_replacements:
+                continue
+            target = self.follow(barcode, index, replacements, multiple_choice_replacements, barcode)
+            if isinstance(target, Cushion):
+                self.resolutions[barcode] = Resolution(Resolution.REPLACED, target)
+            elif target is not None:
+                self.resolutions[barcode] = self.resolutions[target]
+
+    def follow(self, barcode: str, index: "BarcodeIndex", replacements: dict, multiple_choice_replacements: dict,
+               rule_barcode: str):
+        """
+        Follows the "erstat" rules from the barcode to an item, or to a barcode used for several items. Returns the
+        item, the barcode used for several items, or None if the chain can't be followed; the reason is recorded.
+        """
+        visited = [barcode]
+        while not index.contains(barcode):
+            if barcode != rule_barcode and barcode in multiple_choice_replacements:
+                return barcode
+            if barcode not in replacements:
+                self.errors.append(f"Rettelsen for {rule_barcode} peger på den ukendte stregkode {barcode}.")
+                return None
+            barcode = replacements[barcode]
+            if barcode in visited:
+                self.errors.append(f"Rettelserne for {rule_barcode} danner en løkke: "
+                                   + " -> ".join(visited + [barcode]) + ".")
+                return None
+            visited.append(barcode)
+        return index.get(barcode)
+
+
+class BarcodeIndex:
+    """
+    Finds the items of an ItemTable by EAN-13 barcode, old item number or new item number, and resolves scanned
+    barcodes through the compiled correction rules. Each lookup is a binary search over the table's rows sorted by
+    the key, kept in arrays, so that the index costs a few bytes per item instead of a dict entry per key. The index
+    is built once per table; a reloaded catalog gets a new index.
+    """
+    def __init__(self, items: ItemTable, replacements: dict, multiple_choice_replacements: dict):
+        self.items = items
+        self.replacements = replacements
+        self.multiple_choice_replacements = multiple_choice_replacements
+        # The table's barcodes in ascending order, and the row of each.
+        self.barcode_rows = array("I", sorted(range(len(items)), key=items.barcodes.__getitem__))
+        self.sorted_barcodes = array("q", (items.barcodes[row] for row in self.barcode_rows))
+        # The rows ordered by old and by new item number. The sort is stable, so rows sharing a number stay in table
+        # order, and the last of them is found, as when the numbers were dict keys.
+        self.old_number_rows = array("I", sorted(range(len(items)), key=items.old_numbers.__getitem__))
+        self.new_number_rows = array("I", sorted(range(len(items)), key=items.new_numbers.__getitem__))
+        self.corrections = None
+        self.compile_corrections()
+
+    @classmethod
+    def from_columns(cls, items: ItemTable, replacements: dict, multiple_choice_replacements: dict,
+                     columns: dict) -> "BarcodeIndex":
+        """Returns the index of the items stored by columns(), without sorting the rows again."""
+        index = cls.__new__(cls)
+        index.items = items
+        index.replacements = replacements
+        index.multiple_choice_replacements = multiple_choice_replacements
+        index.barcode_rows = columns["barcode_rows"]
+        index.sorted_barcodes = columns["sorted_barcodes"]
+        index.old_number_rows = columns["old_number_rows"]
+        index.new_number_rows = columns["new_number_rows"]
+        index.corrections = None
+        index.compile_corrections()
+        return index
+
+    def columns(self) -> dict:
+        """Returns the sorted arrays of the index, by name, for storing it in a catalog snapshot."""
+        return {
+            "barcode_rows": self.barcode_rows,
+            "sorted_barcodes": self.sorted_barcodes,
+            "old_number_rows": self.old_number_rows,
+            "new_number_rows": self.new_number_rows
+        }
+
+    def compile_corrections(self) -> None:
+        """Compiles the correction rules against the items."""
+        self.corrections = CorrectionGraph(self, self.replacements, self.multiple_choice_replacements)
+
+    def duplicate_rows(self) -> list:
+        """
+        Returns the rows whose barcode is also in an earlier row, in table order. Rows sharing a barcode are next to
+        each other in sorted_barcodes, earliest first, and the earliest one is the one lookups find.
+        """
+        return sorted(self.barcode_rows[i] for i in range(1, len(self.sorted_barcodes))
+                      if self.sorted_barcodes[i] == self.sorted_barcodes[i - 1])
+
+    def find_row(self, barcode: str) -> int:
+        """Returns the table row of the item with the given barcode, or None if it is unknown."""
+        if not isinstance(barcode, str) or len(barcode) != 13 or not (barcode.isascii() and barcode.isdigit()):
+            return None
+        value = int(barcode)
+        i = bisect_left(self.sorted_barcodes, value)
+        if i < len(self.sorted_barcodes) and self.sorted_barcodes[i] == value:
+            return self.barcode_rows[i]
+        return None
+
+    @staticmethod
+    def find_number_row(rows: array, numbers, item_number: str) -> int:
+        """Returns the last row, in table order, whose number is item_number, or None; rows is ordered by number."""
+        low, high = 0, len(rows)
+        while low < high:
+            middle = (low + high) // 2
+            if item_number < numbers[rows[middle]]:
+                high = middle
+            else:
+                low = middle + 1
+        if low > 0 and numbers[rows[low - 1]] == item_number:
+            return rows[low - 1]
+        return None
+
+    def contains(self, barcode: str) -> bool:
+        """Returns True if an item has the given barcode."""
+        return self.find_row(barcode) is not None
+
+    def get(self, barcode: str) -> Cushion:
+        """Returns the item with the given barcode, or None if it is unknown."""
+        row = self.find_row(barcode)
+        return self.items[row] if row is not None else None
+
+    def get_by_item_number(self, item_number: str, number_type: str = None) -> Cushion:
+        """
+        Returns the item with the given item number, or None if it is unknown. number_type is "old" or "new" to look
+        among the old or the new item numbers only; if it's None, old numbers are tried first, then new ones.
+        """
+        row = None
+        if number_type != "new":
+            row = self.find_number_row(self.old_number_rows, self.items.old_numbers, item_number)
+        if row is None and number_type != "old":
+            row = self.find_number_row(self.new_number_rows, self.items.new_numbers, item_number)
+        return self.items[row] if row is not None else None
+
+    def resolve(self, barcode: str) -> Resolution:
+        """
+        Resolves a scanned barcode. Barcodes known to be used for several item types take precedence, then correct
+        barcodes, then barcodes that must be replaced with another one, directly or through a chain of replacements.
+        """
+        resolution = self.corrections.resolutions.get(barcode)
+        if resolution is not None:
+            return resolution
+        item = self.get(barcode)
+        if item is not None:
+            return Resolution(Resolution.EXACT, item)
+        return Resolution(Resolution.UNKNOWN)
+
+    def find_misread(self, barcode: str) -> str:
+        """
+        Returns the one known barcode - of an item or with a correction rule - that the scanned barcode could be a
+        misreading of, with a single wrong digit or two neighbouring digits swapped. Returns None if there is no such
+        barcode, or more than one.
+        """
+        matches = {
+            neighbour for neighbour in self.neighbours(barcode)
+            if self.contains(neighbour) or neighbour in self.corrections.resolutions
+        }
+        if len(matches) == 1:
+            return matches.pop()
+        return None
+
+    @staticmethod
+    def neighbours(barcode: str) -> list:
+        """
+        Returns the barcodes with a correct check digit that differ from the 13-digit barcode by one digit or by two
+        swapped neighbouring digits. Since the check digit catches every single wrong digit, only one digit fits at
+        each position, so there are at most 25 of them and they are computed instead of stored for every item.
+        """
+        digits = [int(digit) for digit in barcode]
+        # The weighted sum, including the check digit, is a multiple of 10 for a correct barcode.
+        remainder = (sum(digits[0::2]) + 3 * sum(digits[1::2])) % 10
+        neighbours = []
+        for i, digit in enumerate(digits):
+            # Multiplying by 7 undoes the weight of 3, since 3 * 7 = 21.
+            fitting_digit = (digit - remainder) % 10 if i % 2 == 0 else (digit - 7 * remainder) % 10
+            if fitting_digit != digit:
+                neighbours.append(f"{barcode[:i]}{fitting_digit}{barcode[i + 1:]}")
+        for i in range(12):
+            if barcode[i] != barcode[i + 1]:
+                swapped = f"{barcode[:i]}{barcode[i + 1]}{barcode[i]}{barcode[i + 2:]}"
+                if is_valid_ean13(swapped):
+                    neighbours.append(swapped)
+        return neighbours
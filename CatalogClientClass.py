@@ -0,0 +1,165 @@
+import http.client
+import json
+import select
+import socket
+import threading
+from urllib.parse import urlencode, urlsplit
+from PyQt6.QtGui import QImage
+
+from BarcodeIndexClass import Resolution
+from CushionClass import Cushion
+from ServerErrorClass import ServerError
+
+
+class CatalogClient:
+    """
+    Looks up items and prints labels through a catalog server instead of loading the catalog itself. Each thread
+    keeps one connection open to the server and reuses it for all its requests.
+    """
+    def __init__(self, url: str = "http://127.0.0.1:8765", timeout: float = 10, station: str = None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.station = station if station is not None else socket.gethostname()
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, parameters: dict = None, body: dict = None) -> bytes:
+        """
+        Sends a request and returns the body of the response. If the kept-open connection has been closed by the
+        server in the meantime, connects again once. A POST is only sent again if it failed before it was sent, as the
+        server may already have acted on it, e.g. queued a print job. Raises ServerError if that fails or the server
+        reports an error.
+        """
+        if parameters:
+            path += "?" + urlencode({key: value for key, value in parameters.items() if value is not None})
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            if connection is not None and method != "GET" and self.closed_by_server(connection):
+                # Found out now rather than after sending, when it's too late to send the request again.
+                connection.close()
+                connection = None
+            reused = connection is not None
+            if connection is None:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                self._local.connection = connection
+            sent = False
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                content = response.read()
+                break
+            except (OSError, http.client.HTTPException) as error:
+                connection.close()
+                self._local.connection = None
+                if method != "GET" and sent:
+                    raise ServerError(f"Serveren {self.host}:{self.port} svarede ikke ({error}). Forespørgslen kan "
+                                      f"være modtaget alligevel; tjek printkøen, før du prøver igen.")
+                if attempt == 1 or (method != "GET" and not reused):
+                    raise ServerError(f"Serveren {self.host}:{self.port} kan ikke nås ({error}).")
+        if response.status != 200:
+            try:
+                message = json.loads(content)["error"]
+            except (ValueError, KeyError):
+                message = response.reason
+            raise ServerError(f"Serveren svarede med en fejl: {message}", response.status)
+        return content
+
+    @staticmethod
+    def closed_by_server(connection: http.client.HTTPConnection) -> bool:
+        """Returns True if the server has closed the kept-open connection, which then reads as ready with no data."""
+        if connection.sock is None:
+            return True
+        return bool(select.select([connection.sock], [], [], 0)[0])
+
+    def get_json(self, path: str, **parameters) -> dict:
+        return json.loads(self.request("GET", path, parameters))
+
+    def close(self) -> None:
+        """Closes the calling thread's connection."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    @staticmethod
+    def item_from_json(fields: list) -> Cushion:
+        return Cushion.from_fields(*fields) if fields is not None else None
+
+    def status(self) -> dict:
+        return self.get_json("/status")
+
+    def get_catalog(self) -> dict:
+        """
+        Returns the server's catalog version, every item as a Cushion and the Manual tab's combobox entries, using old
+        and new item numbers.
+        """
+        data = self.get_json("/catalog")
+        data["items"] = [self.item_from_json(fields) for fields in data["items"]]
+        return data
+
+    def resolve(self, barcode: str) -> Resolution:
+        """Resolves a scanned barcode to an item, applying the correction rules, as DataLoader.resolve() does."""
+        data = self.get_json("/resolve", barcode=barcode)
+        return Resolution(data["correction"], self.item_from_json(data["item"]),
+                          [self.item_from_json(fields) for fields in data["candidates"]])
+
+    def find_misread(self, barcode: str) -> str:
+        """Returns the one known barcode that the scanned 13-digit barcode is probably a misreading of, or None."""
+        return self.get_json("/misread", barcode=barcode)["barcode"]
+
+    def get_item(self, **parameters) -> Cushion:
+        """Returns the item found by the /item request, or None if it is unknown. Other errors raise ServerError."""
+        try:
+            return self.item_from_json(self.get_json("/item", **parameters)["item"])
+        except ServerError as error:
+            if error.status == 404:
+                return None
+            raise
+
+    def get_item_by_barcode(self, barcode: str) -> Cushion:
+        """Returns the item with the given barcode, or None if it is unknown."""
+        return self.get_item(barcode=barcode)
+
+    def get_item_by_item_number(self, item_number: str, number_type: str = None) -> Cushion:
+        """Returns the item with the given old or new item number, or None if it is unknown."""
+        return self.get_item(number=item_number, number_type=number_type)
+
+    def get_entries(self, number_type: str = "old") -> list:
+        """Returns the Manual tab's combobox entries, using either old or new item numbers."""
+        return self.get_json("/entries", number_type=number_type)["entries"]
+
+    def search(self, query: str, number_type: str = "old") -> list:
+        """Returns the combobox entries matching all the words of the query."""
+        return self.get_json("/search", query=query, number_type=number_type)["entries"]
+
+    def get_preview(self, barcode: str, width: int, height: int) -> QImage:
+        """Returns the item's label scaled down to fit the given size, or a null image if there is no label."""
+        try:
+            return QImage.fromData(self.request("GET", "/preview",
+                                                {"barcode": barcode, "width": width, "height": height}))
+        except ServerError as error:
+            if error.status == 404:
+                return QImage()
+            raise
+
+    def submit_print(self, barcode: str, copy_count: int, mode: str, scanned_barcode: str = None) -> dict:
+        """Adds a print job to the server's print queue. Returns the job's id, status and error."""
+        return json.loads(self.request("POST", "/print", body={
+            "barcode": barcode,
+            "copies": copy_count,
+            "mode": mode,
+            "scanned_barcode": scanned_barcode,
+            "station": self.station
+        }))
+
+    def get_job(self, job_id: int) -> dict:
+        """Returns the print job's id, status and error."""
+        return self.get_json("/job", job_id=job_id)
+
+    def reload(self) -> dict:
+        """Makes the server reload the catalog files. Returns the changes, as DataLoader.reload() does."""
+        return json.loads(self.request("POST", "/reload"))
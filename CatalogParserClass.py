@@ -0,0 +1,102 @@
+import csv
+from array import array
+
+from CushionClass import Cushion
+
+
+class CatalogError(Exception):
+    """Raised when the BarTender file or the corrections file can't be read. The message is shown to the user."""
+
+
+def is_valid_ean13(barcode: str) -> bool:
+    """Returns True if the barcode is 13 digits long and its last digit is the correct check digit."""
+    if len(barcode) != 13 or not (barcode.isascii() and barcode.isdigit()):
+        return False
+    # With the check digit counted at weight 1, the weighted sum of a correct barcode is a multiple of 10. The digits
+    # are summed as character codes; the 13 offsets of ord("0") add up to 1200, which doesn't change the remainder.
+    codes = barcode.encode("ascii")
+    return (sum(codes[0::2]) + 3 * sum(codes[1::2])) % 10 == 0
+
+
+class CatalogParser:
+    """
+    Reads the BarTender file one line at a time and yields a Cushion for each valid line, so that the file is never
+    held in memory as a whole. Invalid lines are skipped and described in self.errors, as (line number, message),
+    instead of stopping the program.
+    Barcodes used on more than one line aren't caught here, since that would mean keeping every barcode seen; they
+    are found once the items are indexed and passed to skip_duplicates().
+    """
+    column_names = ("gammelt varenummer", "varenavn", "farve", "stregkode", "nyt varenummer")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.errors = []
+        # The line number of each yielded item, in the order they were yielded.
+        self.line_numbers = array("I")
+
+    def __iter__(self):
+        """
+        Yields the valid items. Raises CatalogError if the file can't be read or a column is missing from the header;
+        problems with single lines are only recorded in self.errors.
+        """
+        self.errors = []
+        self.line_numbers = array("I")
+        try:
+            with open(self.path, "r", encoding="utf-8-sig", newline="") as bartender_file:
+                # The file isn't quoted, so quote characters in item names are read as they are.
+                reader = csv.reader(bartender_file, delimiter=";", quoting=csv.QUOTE_NONE)
+                indices = self.read_header(next(reader, []))
+                row_length = max(indices) + 1
+                old_number_index, item_name_index, color_index, ean_13_index, new_number_index = indices
+                for row in reader:
+                    if not any(row):
+                        continue
+                    if len(row) < row_length:
+                        missing = [name for name, index in zip(self.column_names, indices) if index >= len(row)]
+                        self.errors.append((reader.line_num, f"Mangler kolonnen \"{missing[0]}\"."))
+                        continue
+                    cushion = self.validate(reader.line_num, row[old_number_index].strip(),
+                                            row[item_name_index].strip(), row[color_index].strip(),
+                                            row[ean_13_index].strip(), row[new_number_index].strip())
+                    if cushion is not None:
+                        self.line_numbers.append(reader.line_num)
+                        yield cushion
+        except FileNotFoundError:
+            raise CatalogError("Kan ikke finde BarTender filen.")
+        except UnicodeDecodeError:
+            raise CatalogError("HyndeData.txt kan ikke læses.\n"
+                               "Sørg venligst for, at filen er i UTF-8 format med BOM.")
+
+    def read_header(self, header: list) -> list:
+        """Returns the position of each needed column. Raises CatalogError if any of them is missing."""
+        header = [column_name.strip().lower() for column_name in header]
+        missing = [column_name for column_name in self.column_names if column_name not in header]
+        if missing:
+            raise CatalogError("HyndeData.txt er ugyldig: kolonnen \"" + "\", \"".join(missing) + "\" mangler.\n"
+                               "Se venligst brugervejledningen.")
+        return [header.index(column_name) for column_name in self.column_names]
+
+    def validate(self, line_number: int, old_number: str, item_name: str, color: str, ean_13: str,
+                 new_number: str) -> Cushion:
+        """Returns the line's item, or None if the line is invalid, in which case the reason is recorded."""
+        if not ean_13:
+            self.errors.append((line_number, "Stregkoden mangler."))
+            return None
+        if not is_valid_ean13(ean_13):
+            if len(ean_13) == 13 and ean_13.isdigit():
+                self.errors.append((line_number, f"Stregkoden {ean_13} har et forkert kontrolciffer."))
+            else:
+                self.errors.append((line_number, f"Stregkoden {ean_13} er ikke 13 cifre."))
+            return None
+        # If there is no old number, uses the new number instead.
+        return Cushion.from_fields(old_number or new_number, item_name, color, ean_13, new_number)
+
+    def skip_duplicates(self, duplicates: list) -> None:
+        """
+        Records the items whose barcode is already used further up the file as skipped lines. duplicates holds the
+        position of each such item among the yielded ones, and its barcode.
+        """
+        for position, ean_13 in duplicates:
+            self.errors.append((self.line_numbers[position],
+                                f"Stregkoden {ean_13} findes allerede længere oppe i filen."))
+        self.errors.sort(key=lambda error: error[0])
@@ -0,0 +1,315 @@
+import inspect
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from PyQt6.QtCore import QBuffer, QIODevice, Qt
+
+from CushionClass import Cushion
+from DataLoaderClass import CatalogError, DataLoader
+from PrintSpoolClass import PrintJob, PrintSpool
+
+
+class RequestError(Exception):
+    """Raised by the request handlers to answer with an error status; the message is sent to the client."""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def int_parameter(value, name: str) -> int:
+    """Returns the parameter as a whole number. Raises RequestError if it isn't one."""
+    if isinstance(value, bool):
+        raise RequestError(400, f"{name} must be a whole number.")
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        raise RequestError(400, f"{name} must be a whole number.")
+
+
+def item_to_json(item: Cushion) -> list:
+    """Returns the item's fields as a JSON list, or None if there is no item."""
+    return list(item.to_fields()) if item is not None else None
+
+
+class CatalogRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers the requests of a single station connection. The connection is kept open between requests (HTTP/1.1),
+    so a station only connects once instead of once per scan.
+    """
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are sent separately; without this, the body would wait for the client's delayed ACK.
+    disable_nagle_algorithm = True
+    server: "CatalogServer"
+
+    def do_GET(self) -> None:
+        self.handle_request(self.server.get_routes)
+
+    def do_POST(self) -> None:
+        self.handle_request(self.server.post_routes)
+
+    def handle_request(self, routes: dict) -> None:
+        """Calls the route's method on the server with the query parameters and sends its result."""
+        url = urlsplit(self.path)
+        parameters = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            # The body is always read, even for a request that fails, since the next request on the connection
+            # starts right after it.
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                # Where the body ends is unknown, so the connection can't be used for another request.
+                self.close_connection = True
+                raise RequestError(400, "Invalid Content-Length.")
+            body = self.rfile.read(length)
+            route = routes.get(url.path)
+            if route is None:
+                raise RequestError(404, f"Unknown path: {url.path}")
+            if body:
+                try:
+                    body_parameters = json.loads(body)
+                except ValueError:
+                    body_parameters = None
+                if not isinstance(body_parameters, dict):
+                    raise RequestError(400, "The request body is not a JSON object.")
+                parameters.update(body_parameters)
+            try:
+                inspect.signature(route).bind(**parameters)
+            except TypeError as error:
+                raise RequestError(400, f"Invalid parameters: {error}")
+            result = route(**parameters)
+        except RequestError as error:
+            self.send_json({"error": str(error)}, error.status)
+        except Exception as error:
+            # The client is still waiting for an answer; the error is a bug in the server.
+            self.log_error("Error handling %s: %r", self.path, error)
+            self.send_json({"error": f"Internal server error: {error!r}"}, 500)
+        else:
+            if isinstance(result, bytes):
+                self.send_body(result, "image/png")
+            else:
+                self.send_json(result)
+
+    def send_json(self, data, status: int = 200) -> None:
+        self.send_body(json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json", status)
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200) -> None:
+        # The length must always be sent, since the client reads the next response from the same connection.
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class CatalogServer(ThreadingHTTPServer):
+    """
+    Serves one loaded catalog, its correction rules and its labels to the scanning stations, so that the catalog is
+    parsed, and the labels rendered and decoded, once on the server instead of on every station. Offers barcode
+    resolution, item lookups and searches, preview images and print submission as a small JSON API; each connection
+    is handled on its own thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, item_data: DataLoader, print_spool: PrintSpool = None,
+                 max_previews: int = 256, max_jobs: int = 1000, verbose: bool = False):
+        super().__init__(address, CatalogRequestHandler)
+        self.item_data = item_data
+        self.print_spool = print_spool
+        self.verbose = verbose
+        # Held while the catalog is read or reloaded, since requests come in on several threads.
+        self.lock = threading.RLock()
+        # PNG encoded previews by (barcode, width, height), least recently used first.
+        self.max_previews = max_previews
+        self.previews = OrderedDict()
+        self._previews_lock = threading.Lock()
+        # Raised by every reload, as in PreviewCache. A preview scaled while the catalog was reloaded isn't stored,
+        # since it may have been scaled from the old label.
+        self._previews_generation = 0
+        # The most recent print jobs by id, so that stations can follow them.
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        # Counts the reloads, so that stations can tell when to fetch the catalog again.
+        self.catalog_version = 1
+        self.get_routes = {
+            "/status": self.status,
+            "/catalog": self.get_catalog,
+            "/resolve": self.resolve,
+            "/misread": self.find_misread,
+            "/item": self.get_item,
+            "/entries": self.get_entries,
+            "/search": self.search,
+            "/preview": self.get_preview,
+            "/job": self.get_job
+        }
+        self.post_routes = {
+            "/print": self.submit_print,
+            "/reload": self.reload
+        }
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "version": self.catalog_version,
+                "items": len(self.item_data.cushions),
+                "catalog_errors": len(self.item_data.catalog_errors),
+                "correction_errors": len(self.item_data.correction_errors),
+                "printing": self.print_spool is not None,
+                "printer": self.print_spool.printers.target_name if self.print_spool is not None else None,
+                "pending_jobs": self.print_spool.pending_count() if self.print_spool is not None else 0
+            }
+
+    def get_catalog(self) -> dict:
+        """Returns every item and the combobox entries of the Manual tab, for the stations' own copy."""
+        with self.lock:
+            return {
+                "version": self.catalog_version,
+                "items": [item_to_json(item) for item in self.item_data.cushions],
+                "old_number_entries": list(self.item_data.old_number_combobox_entry_list),
+                "new_number_entries": list(self.item_data.new_number_combobox_entry_list)
+            }
+
+    def resolve(self, barcode: str) -> dict:
+        with self.lock:
+            resolution = self.item_data.resolve(barcode)
+        return {
+            "correction": resolution.correction,
+            "item": item_to_json(resolution.item),
+            "candidates": [item_to_json(item) for item in resolution.candidates]
+        }
+
+    def find_misread(self, barcode: str) -> dict:
+        if not (barcode.isdigit() and len(barcode) == 13):
+            raise RequestError(400, "The barcode must be 13 digits.")
+        with self.lock:
+            return {"barcode": self.item_data.find_misread(barcode)}
+
+    def get_item(self, barcode: str = None, number: str = None, number_type: str = None) -> dict:
+        """
+        Returns the item with the given barcode, or with the given item number; number_type limits the search to
+        the "old" or the "new" numbers.
+        """
+        if number_type not in (None, "old", "new"):
+            raise RequestError(400, "number_type must be \"old\" or \"new\".")
+        with self.lock:
+            if barcode is not None:
+                item = self.item_data.get_item_by_barcode(barcode)
+            elif number is not None:
+                item = self.item_data.get_item_by_item_number(number, number_type)
+            else:
+                raise RequestError(400, "Either barcode or number must be given.")
+        if item is None:
+            raise RequestError(404, "Unknown item.")
+        return {"item": item_to_json(item)}
+
+    def get_entries(self, number_type: str = "old") -> dict:
+        """Returns the combobox entries of the Manual tab, using either old or new item numbers."""
+        with self.lock:
+            if number_type == "old":
+                return {"entries": list(self.item_data.old_number_combobox_entry_list)}
+            return {"entries": list(self.item_data.new_number_combobox_entry_list)}
+
+    def search(self, query: str, number_type: str = "old") -> dict:
+        """Returns the combobox entries matching all the words of the query."""
+        with self.lock:
+            entries = (self.item_data.old_number_combobox_entry_list if number_type == "old"
+                       else self.item_data.new_number_combobox_entry_list)
+            positions = self.item_data.get_search_index(number_type).search(query)
+            return {"entries": [entries[position] for position in positions]}
+
+    def get_preview(self, barcode: str, width: str, height: str) -> bytes:
+        """Returns the item's label scaled down to fit the given size, as a PNG file."""
+        key = (barcode, int_parameter(width, "width"), int_parameter(height, "height"))
+        if key[1] < 1 or key[2] < 1:
+            raise RequestError(400, "The preview size must be positive.")
+        with self._previews_lock:
+            preview = self.previews.get(key)
+            if preview is not None:
+                self.previews.move_to_end(key)
+                return preview
+            generation = self._previews_generation
+        label_image = self.item_data.labels.get_image(barcode)
+        if label_image.isNull():
+            raise RequestError(404, f"There is no label for {barcode}.")
+        scaled_image = label_image.scaled(key[1], key[2], Qt.AspectRatioMode.KeepAspectRatio,
+                                          Qt.TransformationMode.SmoothTransformation)
+        buffer = QBuffer()
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        scaled_image.save(buffer, "PNG")
+        preview = bytes(buffer.data())
+        with self._previews_lock:
+            if self._previews_generation != generation:
+                return preview
+            self.previews[key] = preview
+            while len(self.previews) > self.max_previews:
+                self.previews.popitem(last=False)
+        return preview
+
+    def submit_print(self, barcode: str, copies: int, mode: str, scanned_barcode: str = None,
+                     station: str = None) -> dict:
+        """Adds a print job for the item with the given (already resolved) barcode to the server's print queue."""
+        if self.print_spool is None:
+            raise RequestError(503, "The server doesn't print.")
+        if not all(isinstance(value, str) for value in (barcode, mode)):
+            raise RequestError(400, "The barcode and the mode must be strings.")
+        if not isinstance(copies, int) or isinstance(copies, bool) or copies < 1:
+            raise RequestError(400, "The number of copies must be a positive whole number.")
+        with self.lock:
+            item = self.item_data.get_item_by_barcode(barcode)
+        if item is None:
+            raise RequestError(404, f"Unknown barcode: {barcode}")
+        job = self.print_spool.submit(item, copies, mode, scanned_barcode, station)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        return self.job_to_json(job)
+
+    def get_job(self, job_id: str) -> dict:
+        with self.lock:
+            job = self.jobs.get(int_parameter(job_id, "job_id"))
+        if job is None:
+            raise RequestError(404, f"Unknown print job: {job_id}")
+        return self.job_to_json(job)
+
+    @staticmethod
+    def job_to_json(job: PrintJob) -> dict:
+        return {"job_id": job.job_id, "status": job.status, "error": job.error}
+
+    def reload(self) -> dict:
+        """Reloads the catalog files, as when they are edited; the loaded catalog stays in use if that fails."""
+        try:
+            # The files are read without the lock, so that other requests are only held up while the result is
+            # swapped in. If the file watcher swapped in its own reload in the meantime, the files are read again.
+            changes = None
+            while changes is None:
+                update = self.item_data.prepare_reload()
+                with self.lock:
+                    changes = self.item_data.apply_reload(update)
+        except CatalogError as error:
+            raise RequestError(500, str(error))
+        self.on_catalog_reloaded(changes)
+        return changes
+
+    def on_catalog_reloaded(self, changes: dict) -> None:
+        """
+        Drops the previews and ZPL graphics of the changed items and labels, and lets the stations know that the
+        catalog has changed.
+        """
+        barcodes = set(changes["updated"] + changes["removed"] + changes["changed_labels"])
+        with self._previews_lock:
+            self._previews_generation += 1
+            for key in [key for key in self.previews if key[0] in barcodes]:
+                del self.previews[key]
+        if self.print_spool is not None and self.print_spool.printers.zpl_printer is not None:
+            for barcode in barcodes:
+                self.print_spool.printers.zpl_printer.invalidate(barcode)
+        with self.lock:
+            self.catalog_version += 1
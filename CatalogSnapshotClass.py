@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import pickle
+import socket
+import struct
+import sys
+
+
+class CatalogSnapshot:
+    """
+    A compiled, binary copy of the parsed catalog: the item table, the barcode index, the combobox display strings and
+    their search indices, stored as the flat arrays they are made of, and the correction maps. The snapshot is keyed
+    on the size, modification time and hash of its source files and is only used if the sources haven't changed since
+    it was written.
+
+    File layout: an 8-byte magic string, the format version and the length of the key (two unsigned 32-bit ints), the
+    key as JSON, the length of the table of contents (an unsigned 32-bit int) and the table of contents as JSON. The
+    table gives the byte order and, for each array, its name, type code, offset and length; the offsets count from the
+    first multiple of 8 bytes after the table of contents, and each array starts at a multiple of 8. The small objects,
+    like the correction maps, are pickled into one more section.
+    The arrays are read in one go and used in place, as memoryviews into the file's contents, so loading costs about
+    as much as reading the file. The file isn't memory-mapped: on Windows, a mapped file can't be replaced, and
+    another station could then never write a new snapshot to the shared folder.
+    """
+    magic = b"HYNDSNAP"
+    # Raised whenever the stored data changes, e.g. because the catalog is parsed or validated differently, so that
+    # snapshots written by an older version are parsed again. 2: skipped lines are kept as catalog errors. 3: the
+    # items are an ItemTable. 4: arrays stored in place of the pickled catalog, with the indices.
+    version = 4
+    header = struct.Struct("<8sII")
+    contents_header = struct.Struct("<I")
+    alignment = 8
+
+    def __init__(self, snapshot_path: str, source_paths: list):
+        self.snapshot_path = snapshot_path
+        self.source_paths = source_paths
+        # Set when the snapshot was usable, but a source file's modification time changed without its contents
+        # changing; the snapshot should then be rewritten to avoid hashing the sources on every load.
+        self.key_outdated = False
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        """Returns the SHA-256 hash of the file's contents."""
+        with open(path, "rb") as in_file:
+            return hashlib.sha256(in_file.read()).hexdigest()
+
+    def build_key(self) -> list:
+        """Returns the size, modification time and content hash of each source file."""
+        key = []
+        for path in self.source_paths:
+            stat = os.stat(path)
+            key.append({"path": path, "size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": self.file_hash(path)})
+        return key
+
+    def key_matches(self, key: list) -> bool:
+        """
+        Returns True if the stored key describes the current source files. The sources are only hashed if their
+        size matches but their modification time doesn't, e.g. after a file was saved without changes.
+        """
+        if [entry["path"] for entry in key] != self.source_paths:
+            return False
+        self.key_outdated = False
+        for entry in key:
+            stat = os.stat(entry["path"])
+            if stat.st_size != entry["size"]:
+                return False
+            if stat.st_mtime_ns != entry["mtime"]:
+                if self.file_hash(entry["path"]) != entry["sha256"]:
+                    return False
+                self.key_outdated = True
+        return True
+
+    @classmethod
+    def aligned(cls, offset: int) -> int:
+        """Returns the first multiple of the alignment that isn't less than the offset."""
+        return -(-offset // cls.alignment) * cls.alignment
+
+    def load(self):
+        """
+        Returns the snapshot's arrays, as a dict of memoryviews by name, and its objects, or None if there is no usable
+        snapshot for the current source files.
+        """
+        try:
+            with open(self.snapshot_path, "rb") as snapshot_file:
+                magic, version, key_length = self.header.unpack(snapshot_file.read(self.header.size))
+                if magic != self.magic or version != self.version:
+                    return None
+                key = json.loads(snapshot_file.read(key_length))
+                if not self.key_matches(key):
+                    return None
+                (contents_length,) = self.contents_header.unpack(snapshot_file.read(self.contents_header.size))
+                contents = json.loads(snapshot_file.read(contents_length))
+                if contents["byteorder"] != sys.byteorder:
+                    return None
+                snapshot_file.seek(self.aligned(snapshot_file.tell()))
+                data = memoryview(snapshot_file.read())
+            if len(data) != contents["size"]:
+                return None
+            columns = {
+                name: data[offset:offset + length].cast(typecode)
+                for name, (typecode, offset, length) in contents["columns"].items()
+            }
+            offset, length = contents["objects"]
+            objects = pickle.loads(data[offset:offset + length])
+            return columns, objects
+        except (OSError, ValueError, KeyError, TypeError, struct.error, pickle.UnpicklingError, EOFError):
+            return None
+
+    def save(self, columns: dict, objects) -> None:
+        """
+        Writes the arrays, given as a dict of arrays or other buffers by name, and the picklable objects to the
+        snapshot file, keyed on the current source files.
+        """
+        key = json.dumps(self.build_key()).encode("utf-8")
+        sections = []
+        contents = {"byteorder": sys.byteorder, "columns": {}}
+        offset = 0
+        for name, column in columns.items():
+            view = memoryview(column)
+            offset = self.aligned(offset)
+            contents["columns"][name] = (view.format, offset, view.nbytes)
+            sections.append((offset, view.cast("B")))
+            offset += view.nbytes
+        pickled_objects = pickle.dumps(objects, protocol=pickle.HIGHEST_PROTOCOL)
+        offset = self.aligned(offset)
+        contents["objects"] = (offset, len(pickled_objects))
+        sections.append((offset, pickled_objects))
+        contents["size"] = offset + len(pickled_objects)
+        contents = json.dumps(contents).encode("utf-8")
+        # Every station writes the snapshot to the same shared folder, so each writes its own temporary file.
+        temp_path = f"{self.snapshot_path}.{socket.gethostname()}-{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as snapshot_file:
+                snapshot_file.write(self.header.pack(self.magic, self.version, len(key)))
+                snapshot_file.write(key)
+                snapshot_file.write(self.contents_header.pack(len(contents)))
+                snapshot_file.write(contents)
+                data_start = self.aligned(snapshot_file.tell())
+                for offset, section in sections:
+                    snapshot_file.write(bytes(data_start + offset - snapshot_file.tell()))
+                    snapshot_file.write(section)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
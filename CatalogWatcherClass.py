@@ -0,0 +1,88 @@
+import threading
+from contextlib import nullcontext
+from PyQt6.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+from DataLoaderClass import CatalogError, DataLoader
+
+
+class CatalogWatcher(QObject):
+    """
+    Watches the BarTender file and the corrections file and reloads the catalog when either one changes, so that
+    edits take effect without restarting the program. The files are read, and changed labels rendered, on a worker
+    thread; only swapping in the result happens on the watcher's thread.
+    """
+    # Emitted with the dict returned by DataLoader.reload() after a successful reload.
+    catalog_reloaded = pyqtSignal(dict)
+    # Emitted with an error message if a changed file can't be read; the previously loaded data stays in use.
+    reload_failed = pyqtSignal(str)
+    # Emitted from the worker thread with the update from DataLoader.prepare_reload(), or None and an error message.
+    update_prepared = pyqtSignal(object, str)
+
+    def __init__(self, item_data: DataLoader, delay_ms: int = 500, lock=None):
+        super().__init__()
+        self.item_data = item_data
+        # Held while reloading, if the catalog is also read from other threads, as in the catalog server.
+        self.lock = lock if lock is not None else nullcontext()
+        self.paths = [item_data.bartender_file_path, item_data.corrections_file_path]
+        self.watcher = QFileSystemWatcher(self.paths)
+        self.watcher.fileChanged.connect(self.schedule_reload)
+        # Editors often write a file in several steps; waits for the changes to settle before reloading.
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.reload)
+        self.update_prepared.connect(self.apply_update)
+        self.worker = None
+        # Set if the files changed again while a reload was running; another reload follows it.
+        self.reload_pending = False
+
+    def schedule_reload(self) -> None:
+        """(Re)starts the reload timer."""
+        self.timer.start()
+
+    def reload(self) -> None:
+        """
+        Starts reloading the catalog on a worker thread and re-adds the watched files, which some editors replace
+        rather than overwrite.
+        """
+        for path in self.paths:
+            if path not in self.watcher.files():
+                self.watcher.addPath(path)
+        if self.worker is not None:
+            self.reload_pending = True
+            return
+        self.worker = threading.Thread(target=self.prepare_update, name="catalog-reload", daemon=True)
+        self.worker.start()
+
+    def prepare_update(self) -> None:
+        """Reads the changed files. Runs on the worker thread."""
+        try:
+            update = self.item_data.prepare_reload()
+        except CatalogError as error:
+            self.update_prepared.emit(None, str(error))
+            return
+        except Exception as error:
+            self.update_prepared.emit(None, f"Varedata kunne ikke genindlæses:\n{error!r}")
+            return
+        self.update_prepared.emit(update, "")
+
+    def apply_update(self, update, error_message: str) -> None:
+        """Swaps the reloaded catalog in, or reports why it couldn't be reloaded."""
+        self.worker = None
+        if update is None:
+            self.reload_failed.emit(error_message)
+        else:
+            try:
+                with self.lock:
+                    changes = self.item_data.apply_reload(update)
+            except CatalogError as error:
+                self.reload_failed.emit(str(error))
+            else:
+                if changes is None:
+                    # Another reload, e.g. by the catalog server, got in first; the files are read again.
+                    self.reload_pending = True
+                else:
+                    self.catalog_reloaded.emit(changes)
+        if self.reload_pending:
+            self.reload_pending = False
+            self.reload()
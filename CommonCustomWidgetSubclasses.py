@@ -4,6 +4,7 @@ from PyQt6.QtWidgets import QWidget, QLabel, QPushButton, QHBoxLayout, QSpinBox
 
 from DataLoaderClass import DataLoader
 from FontsSizesClass import Fonts, Sizes
+from TracerClass import tracer
 
 
 class Button(QPushButton):
@@ -79,17 +80,44 @@ class LabelPreview(QLabel):
         self.setFixedSize(*sizes.label_preview)
         self.setFont(fonts.prompt)
         self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # The barcode of the label waiting to be scaled, if any.
+        self.pending_barcode = None
+        self.item_data.previews.preview_ready.connect(self.show_ready_preview)
         self.reset()
 
     def update_image_preview(self, barcode: str) -> None:
-        """Displays the label for the item with the passed barcode number."""
-        label_pixmap = self.item_data.label_pixmaps[barcode]
-        label_preview_pixmap = label_pixmap.scaled(
-            self.size(),
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation)
-        self.setPixmap(label_preview_pixmap)
+        """
+        Displays the label for the item with the passed barcode number. The label is scaled to the preview's size
+        only once; if that hasn't happened yet, it's done in the background and the label is displayed once ready.
+        """
+        with tracer.span("preview.lookup", barcode=barcode):
+            preview = self.item_data.previews.peek(barcode, self.size())
+        if preview is None:
+            self.pending_barcode = barcode
+            self.setText("Indlæser...")
+            self.item_data.previews.request(barcode, self.size())
+            return
+        self.pending_barcode = None
+        with tracer.span("preview.show", barcode=barcode):
+            self.setPixmap(QPixmap.fromImage(preview))
+
+    def prefetch(self, barcodes: list) -> None:
+        """Prepares the previews of labels likely to be displayed next."""
+        self.item_data.previews.prefetch(barcodes, self.size())
+
+    def show_ready_preview(self, barcode: str) -> None:
+        """Displays a label that has finished scaling, if it is still the one waiting to be shown."""
+        if barcode != self.pending_barcode:
+            return
+        self.pending_barcode = None
+        preview = self.item_data.previews.peek(barcode, self.size())
+        if preview is None:
+            self.setText("Etiketten mangler")
+        else:
+            with tracer.span("preview.show", barcode=barcode):
+                self.setPixmap(QPixmap.fromImage(preview))
 
     def reset(self) -> None:
         """Clears the preview display."""
+        self.pending_barcode = None
         self.setText("Forhåndsvisning")
@@ -1,13 +1,30 @@
 class Cushion:
-    """Describes a single item and all its properties."""
-    def __init__(self, csv_line: str, column_name_indices: dict):
-        csv_data = csv_line.split(";")
-        self.old_number = csv_data[column_name_indices["gammelt varenummer"]]
-        self.item_name = csv_data[column_name_indices["varenavn"]]
-        self.color = csv_data[column_name_indices["farve"]]
-        self.ean_13 = csv_data[column_name_indices["stregkode"]]
-        self.new_number = csv_data[column_name_indices["nyt varenummer"]]
-
-        # if there is no old number, uses the new number instead.
-        if self.old_number == "":
-            self.old_number = self.new_number
+    """
+    Describes a single item and all its properties. The loaded catalog is kept in an ItemTable, which hands out a new
+    Cushion each time an item is looked up, so two Cushions are equal if their fields are, not only if they are the
+    same object.
+    """
+    __slots__ = ("old_number", "item_name", "color", "ean_13", "new_number")
+
+    @classmethod
+    def from_fields(cls, old_number: str, item_name: str, color: str, ean_13: str, new_number: str):
+        """Constructs a Cushion from already parsed fields, e.g. from the catalog parser or the item table."""
+        cushion = cls.__new__(cls)
+        cushion.old_number = old_number
+        cushion.item_name = item_name
+        cushion.color = color
+        cushion.ean_13 = ean_13
+        cushion.new_number = new_number
+        return cushion
+
+    def to_fields(self) -> tuple:
+        """Returns the item's fields as a tuple, in the order expected by from_fields."""
+        return self.old_number, self.item_name, self.color, self.ean_13, self.new_number
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Cushion):
+            return NotImplemented
+        return self.to_fields() == other.to_fields()
+
+    def __hash__(self) -> int:
+        return hash(self.ean_13)
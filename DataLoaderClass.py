@@ -1,8 +1,19 @@
 import os
-import pymupdf
-from PyQt6.QtGui import QPixmap
+import threading
+from PyQt6.QtGui import QImage
 
+from BarcodeIndexClass import BarcodeIndex, Resolution
+from CatalogParserClass import CatalogError, CatalogParser
+from CatalogSnapshotClass import CatalogSnapshot
 from CushionClass import Cushion
+from ItemTableClass import ItemTable, PackedStrings, prefix_columns, prefixed_columns
+from LabelArchiveClass import LabelArchive
+from LabelCacheClass import LabelCache
+from LabelRasterizerClass import LabelRasterizer
+from LabelRendererClass import LabelRenderer
+from PreviewCacheClass import PreviewCache
+from SearchIndexClass import SearchIndex
+from TracerClass import tracer
 from warning_messagebox import show_warning
 
 
@@ -11,115 +22,358 @@ class DataLoader:
     Loads all the relevant data: the item info, the correction data, the labels. Generates label previews
     and combobox contents.
     """
-    def __init__(self, bartender_file_path: str, corrections_file_path: str):
+    def __init__(self, bartender_file_path: str, corrections_file_path: str,
+                 label_cache_size: int = 32, label_cache_bytes: int = None,
+                 snapshot_path: str = "Data/catalog.snapshot", archive_path: str = "Data/labels.pack",
+                 legacy_png_folder: str = "Data/PNG", load_now: bool = True):
         self.bartender_file_path = bartender_file_path
         self.corrections_file_path = corrections_file_path
         self.manual_file_path = "Brugervejledning.html"
-        # A list of Cushion class objects - one for each known item.
-        self.cushions = []
+        # Every known item, in a column-wise table; indexing it gives a Cushion.
+        self.cushions = ItemTable()
+        # The lines of the BarTender file that were skipped because they are invalid, as (line number, message).
+        self.catalog_errors = []
         # A list of ean-13 numbers that must be directly replaced with another number, without user input.
         self.replacements = {}
         # A list of ean-13 numbers that are potentially incorrect and have more than one potential replacement.
         # User input is necessary to find the correct replacement.
         self.multiple_choice_replacements = {}
-        # A dictionary with barcode numbers as keys and label graphics as QPixmaps as values.
-        self.label_pixmaps = {}
-        # Reads the BarTender file and constructs a Cushion object from each line; appends them to self.cushions
-        try:
-            with open(bartender_file_path, "r", encoding="utf-8-sig") as bartender_file:
-                csv_header = bartender_file.readline().lower()
-                csv_column_names = csv_header.strip().split(";")
-                column_name_indices = {
-                    "gammelt varenummer": None,
-                    "varenavn": None,
-                    "farve": None,
-                    "stregkode": None,
-                    "nyt varenummer": None
-                }
-                for i, column_name in enumerate(csv_column_names):
-                    if column_name in column_name_indices:
-                        column_name_indices[column_name] = i
-                try:
-                    for line in bartender_file:
-                        self.cushions.append(Cushion(line.strip(), column_name_indices))
-                # Catches the case where of one the column names is missing and the dict value is still None.
-                except TypeError:
-                    show_warning("Fejl", "HyndeData.txt er ugyldig.\n"
-                                         "Se venligst brugervejledningen.")
-                    raise SystemExit
-        except FileNotFoundError:
-            show_warning("Fejl", "Kan ikke finde BarTender filen.")
-            raise SystemExit
-        except UnicodeDecodeError:
-            show_warning("Fejl", "HyndeData.txt kan ikke læses.\n"
-                                 "Sørg venligst for, at filen er i UTF-8 format med BOM.")
-            raise SystemExit
-        # Reads the corrections file and saves the wrong and correct barcodes as a key - value pair in self.corrections
+        # Two lists of text entries for the Combobox in the Manual tab - one each for old and new numbers - packed,
+        # like the item numbers in the item table.
+        self.old_number_combobox_entry_list = PackedStrings()
+        self.new_number_combobox_entry_list = PackedStrings()
+        # Maps barcodes and item numbers directly to items, so that scans are resolved without walking the item list.
+        self.index = BarcodeIndex(self.cushions, self.replacements, self.multiple_choice_replacements)
+        # Search indices over the combobox entries, by number type. Built with the rest of the catalog, on the loading
+        # thread, so that the first keystroke in the Manual tab doesn't have to wait for them.
+        self.search_indices = self.build_search_indices(self.old_number_combobox_entry_list,
+                                                        self.new_number_combobox_entry_list)
+        # All the rendered PDF labels, in a single memory-mapped file.
+        self.archive = LabelArchive(archive_path)
+        # Where the labels were kept as separate PNG files before the label archive, or None. They are imported into
+        # an empty archive.
+        self.legacy_png_folder = legacy_png_folder
+        # Decodes label graphics on first use and keeps the most recently used ones in memory.
+        self.labels = LabelCache(max_labels=label_cache_size, max_bytes=label_cache_bytes, archive=self.archive)
+        # Items without a PDF label get their label drawn from the layout template instead.
+        self.renderer = LabelRenderer()
+        self.labels.render_missing = self.render_label
+        # Labels scaled down to preview size, so that switching previews costs only a lookup.
+        self.previews = PreviewCache(self.labels)
+        self.snapshot = CatalogSnapshot(snapshot_path, [bartender_file_path, corrections_file_path])
+        self.rasterizer = LabelRasterizer(archive=self.archive)
+        self._reload_lock = threading.Lock()
+        # Set once load() has finished; until then, the catalog is empty.
+        self.is_loaded = False
+        if load_now:
+            try:
+                self.load()
+            except CatalogError as error:
+                show_warning("Fejl", str(error))
+                raise SystemExit
+
+    def load(self, progress=None) -> None:
+        """
+        Loads the catalog and prepares the labels. Doesn't use any widgets, so it can run on a worker thread; the
+        loaded data is only made visible once it's complete. Calls progress(message, done, total) as it goes.
+        Raises CatalogError if the BarTender file or the corrections file can't be read.
+        """
+        if progress is None:
+            progress = lambda message, done, total: None
+        progress("Indlæser varedata...", 0, 0)
+        # Loads the parsed catalog from the compiled snapshot if the source files haven't changed since it was
+        # written; otherwise parses the source files and rewrites the snapshot.
+        with tracer.span("catalog.snapshot_load"):
+            snapshot_data = self.snapshot.load()
+        if snapshot_data is None:
+            with tracer.span("catalog.parse"):
+                replacements, multiple_choice_replacements = self.read_corrections_file()
+                cushions, index, catalog_errors = self.read_bartender_file(replacements, multiple_choice_replacements)
+                old_number_entries = PackedStrings.from_strings(self.build_combobox_entry(cushion, "old")
+                                                                for cushion in cushions)
+                new_number_entries = PackedStrings.from_strings(self.build_combobox_entry(cushion, "new")
+                                                                for cushion in cushions)
+            progress("Opbygger indeks...", 0, 0)
+            with tracer.span("catalog.search_index", items=len(cushions)):
+                search_indices = self.build_search_indices(old_number_entries, new_number_entries)
+            save_snapshot = True
+        else:
+            # The snapshot holds the indices as well, so nothing needs to be sorted or tokenized.
+            columns, objects = snapshot_data
+            replacements = objects["replacements"]
+            multiple_choice_replacements = objects["multiple_choice_replacements"]
+            catalog_errors = objects["catalog_errors"]
+            cushions = ItemTable.from_columns(prefixed_columns(columns, "items"))
+            old_number_entries = PackedStrings.from_columns(prefixed_columns(columns, "old_number_entries"))
+            new_number_entries = PackedStrings.from_columns(prefixed_columns(columns, "new_number_entries"))
+            index = BarcodeIndex.from_columns(cushions, replacements, multiple_choice_replacements,
+                                              prefixed_columns(columns, "index"))
+            search_indices = {
+                number_type: SearchIndex.from_columns(entries, prefixed_columns(columns, f"{number_type}_search"))
+                for number_type, entries in (("old", old_number_entries), ("new", new_number_entries))
+            }
+            save_snapshot = self.snapshot.key_outdated
+
+        self.cushions = cushions
+        self.catalog_errors = catalog_errors
+        self.replacements = replacements
+        self.multiple_choice_replacements = multiple_choice_replacements
+        self.old_number_combobox_entry_list = old_number_entries
+        self.new_number_combobox_entry_list = new_number_entries
+        self.search_indices = search_indices
+        self.index = index
+        if save_snapshot:
+            with tracer.span("catalog.save_snapshot"):
+                self.save_snapshot()
+
+        if len(self.archive) == 0 and self.legacy_png_folder is not None and os.path.isdir(self.legacy_png_folder):
+            with tracer.span("catalog.import_png_labels"):
+                progress("Flytter etiketter til arkivet...", 0, 0)
+                self.archive.import_png_folder(self.legacy_png_folder)
+        # Renders every .pdf file that isn't in the label archive yet, or has been replaced since it was rendered.
+        # The archived labels are decoded later, by self.labels, when they are first needed. PDF labels are
+        # optional: they override the label drawn from the layout template.
+        with tracer.span("catalog.find_outdated_labels"):
+            outdated_barcodes = self.rasterizer.find_outdated(self.cushions.iter_barcodes())
+        with tracer.span("catalog.rasterize", labels=len(outdated_barcodes)):
+            self.rasterizer.render(
+                outdated_barcodes,
+                lambda done, total, barcode: progress("Konverterer etiketter...", done, total))
+        self.is_loaded = True
+
+    def read_bartender_file(self, replacements: dict, multiple_choice_replacements: dict) -> tuple:
+        """
+        Reads the BarTender file into an ItemTable, one valid line at a time, and indexes it with the given correction
+        rules. Returns the table, its index and the skipped lines as (line number, message). Lines whose barcode is
+        already used further up the file are skipped too; they are found in the index's sorted barcodes rather than
+        while parsing. Raises CatalogError if the file can't be read at all.
+        """
+        parser = CatalogParser(self.bartender_file_path)
+        items = ItemTable.from_items(parser)
+        with tracer.span("catalog.index", items=len(items)):
+            index = BarcodeIndex(items, replacements, multiple_choice_replacements)
+            duplicate_rows = index.duplicate_rows()
+            if duplicate_rows:
+                parser.skip_duplicates([(row, items.barcode(row)) for row in duplicate_rows])
+                items = items.without_rows(duplicate_rows)
+                index = BarcodeIndex(items, replacements, multiple_choice_replacements)
+        return items, index, parser.errors
+
+    def render_label(self, barcode: str) -> QImage:
+        """Draws the label of the item with the given barcode from the layout template; a null image if it's unknown."""
+        item = self.index.get(barcode)
+        if item is None:
+            return QImage()
+        return self.renderer.render(item)
+
+    def catalog_error_report(self, max_lines: int = 10) -> str:
+        """Returns the skipped lines of the BarTender file as text, at most max_lines of them."""
+        lines = [f"Linje {line_number}: {message}" for line_number, message in self.catalog_errors[:max_lines]]
+        if len(self.catalog_errors) > max_lines:
+            lines.append(f"... og {len(self.catalog_errors) - max_lines} mere.")
+        return "\n".join(lines)
+
+    def read_corrections_file(self) -> tuple:
+        """
+        Reads the corrections file. Returns a dict of barcodes to be replaced directly and a dict of barcodes with
+        several possible replacements.
+        """
+        replacements = {}
+        multiple_choice_replacements = {}
         try:
-            with open(corrections_file_path, "r") as corrections_file:
+            with open(self.corrections_file_path, "r") as corrections_file:
                 next(corrections_file)
                 for line in corrections_file:
                     line = line.strip().split(";")
                     if line[0] == "erstat":
                         wrong_barcode = line[1]
                         correct_barcode = line[2]
-                        self.replacements[wrong_barcode] = correct_barcode
+                        replacements[wrong_barcode] = correct_barcode
                     elif line[0] == "flere":
-                        self.multiple_choice_replacements[line[1]] = line[1:]
+                        multiple_choice_replacements[line[1]] = line[1:]
         except FileNotFoundError:
-            show_warning("Fejl", "Filen \"Rettelser.txt\" findes ikke.")
-            raise SystemExit
-
-        # Builds two lists of text entries for the Combobox in the Manual tab - one each for old and new numbers.
-        self.old_number_combobox_entry_list = self.build_combobox_elements("old")
-        self.new_number_combobox_entry_list = self.build_combobox_elements("new")
-
-        # Checks if there exists a .png file for every .pdf file; converts the pdf into .png if not.
-        # Converts the .png file into a QPixmap and adds it to the self.label_pixmaps dictionary.
-        for cushion in self.cushions:
-            barcode = cushion.ean_13
-            path = f"Data/PNG/{barcode}.png"
-            if not os.path.isfile(path):
-                self.convert_pdf_to_png(barcode, dpi=300)
-            self.label_pixmaps[barcode] = QPixmap(path)
-
-    def build_combobox_elements(self, number_type: str) -> list:
-        """Builds a list of item data for the combobox in manual mode, using either old or new item numbers."""
-        combobox_element_list = []
-        for cushion in self.cushions:
-            if number_type == "old":
-                combobox_entry = f"{cushion.old_number} - {cushion.item_name} - {cushion.color}"
-            else:
-                combobox_entry = f"{cushion.new_number} - {cushion.item_name} - {cushion.color}"
-            combobox_entry = combobox_entry.replace(" FR", "")
-            combobox_entry = combobox_entry.replace("Palissade ", "")
-            combobox_entry = combobox_entry.replace(" textile", "")
-            combobox_entry = combobox_entry.replace(" foam", "")
-            combobox_entry = combobox_entry.replace(" for Palissade", "")
-            combobox_entry = combobox_entry.replace(" Interliner", "")
-            combobox_element_list.append(combobox_entry)
-        return combobox_element_list
+            raise CatalogError("Filen \"Rettelser.txt\" findes ikke.")
+        return replacements, multiple_choice_replacements
+
+    def save_snapshot(self) -> None:
+        """Writes the parsed catalog, the combobox entries and their indices to the snapshot file."""
+        self.write_snapshot(self.cushions, self.index, self.catalog_errors, self.old_number_combobox_entry_list,
+                            self.new_number_combobox_entry_list, self.search_indices)
+
+    def write_snapshot(self, cushions: ItemTable, index: BarcodeIndex, catalog_errors: list,
+                       old_number_entries: PackedStrings, new_number_entries: PackedStrings,
+                       search_indices: dict) -> None:
+        """Writes the given catalog to the snapshot file, e.g. a reloaded catalog before it's swapped in."""
+        columns = {}
+        for prefix, part in (("items", cushions), ("index", index), ("old_number_entries", old_number_entries),
+                             ("new_number_entries", new_number_entries), ("old_search", search_indices["old"]),
+                             ("new_search", search_indices["new"])):
+            columns.update(prefix_columns(part.columns(), prefix))
+        self.snapshot.save(columns, {
+            "catalog_errors": catalog_errors,
+            "replacements": index.replacements,
+            "multiple_choice_replacements": index.multiple_choice_replacements
+        })
 
     @staticmethod
-    def convert_pdf_to_png(barcode: str, dpi: int = 300) -> None:
-        """Converts PDF into PNG."""
-        label_pdf = pymupdf.open(f"Data/PDF/{barcode}.pdf")
-        label = label_pdf.load_page(0)
-        label_pix = label.get_pixmap(dpi=dpi)
-        label_pix.save(f"Data/PNG/{barcode}.png")
+    def build_combobox_entry(cushion: Cushion, number_type: str) -> str:
+        """Builds the combobox text for a single item, using either its old or its new item number."""
+        if number_type == "old":
+            combobox_entry = f"{cushion.old_number} - {cushion.item_name} - {cushion.color}"
+        else:
+            combobox_entry = f"{cushion.new_number} - {cushion.item_name} - {cushion.color}"
+        combobox_entry = combobox_entry.replace(" FR", "")
+        combobox_entry = combobox_entry.replace("Palissade ", "")
+        combobox_entry = combobox_entry.replace(" textile", "")
+        combobox_entry = combobox_entry.replace(" foam", "")
+        combobox_entry = combobox_entry.replace(" for Palissade", "")
+        combobox_entry = combobox_entry.replace(" Interliner", "")
+        return combobox_entry
+
+    @staticmethod
+    def build_search_indices(old_number_entries: PackedStrings, new_number_entries: PackedStrings) -> dict:
+        """Builds the search indices over the combobox entries using old and new item numbers, by number type."""
+        return {"old": SearchIndex(old_number_entries), "new": SearchIndex(new_number_entries)}
+
+    def get_search_index(self, number_type: str) -> SearchIndex:
+        """Returns the search index over the combobox entries using either old or new item numbers."""
+        return self.search_indices["new" if number_type == "new" else "old"]
+
+    def reload(self) -> dict:
+        """
+        Re-reads the BarTender file and the corrections file and swaps in the new catalog: unchanged items keep their
+        combobox entries, and changed and new items get their labels re-rendered if needed and dropped from the label
+        cache.
+        Returns the barcodes of the added, updated and removed items, the barcodes of the labels that changed in the
+        archive, e.g. re-rendered for an unchanged item, and whether the correction rules changed.
+        Raises CatalogError, leaving the loaded data untouched, if one of the files can't be read.
+        """
+        changes = None
+        while changes is None:
+            changes = self.apply_reload(self.prepare_reload())
+        return changes
+
+    def prepare_reload(self) -> dict:
+        """
+        Does the slow part of reload(): reads the files, works out the differences, renders the labels of the changed
+        items and writes the snapshot. Doesn't change the loaded data, so it can run on a worker thread while the
+        loaded data is in use. Returns the update to pass to apply_reload(). Raises CatalogError like reload().
+        """
+        # Two reloads, e.g. from the file watcher and the catalog server, mustn't render the same labels at once.
+        with self._reload_lock:
+            return self._prepare_reload()
+
+    def _prepare_reload(self) -> dict:
+        base_cushions, base_index = self.cushions, self.index
+        base_old_number_entries = self.old_number_combobox_entry_list
+        base_new_number_entries = self.new_number_combobox_entry_list
+        new_replacements, new_multiple_choice_replacements = self.read_corrections_file()
+        cushions, index, catalog_errors = self.read_bartender_file(new_replacements, new_multiple_choice_replacements)
+
+        added, updated = [], []
+        # Set for each row of the loaded table whose item is still in the catalog.
+        kept_rows = bytearray(len(base_cushions))
+        old_number_entries, new_number_entries = PackedStrings(), PackedStrings()
+        for cushion in cushions:
+            old_row = base_index.find_row(cushion.ean_13)
+            if old_row is not None:
+                kept_rows[old_row] = 1
+            if old_row is not None and base_cushions[old_row] == cushion:
+                old_entry = base_old_number_entries[old_row]
+                new_entry = base_new_number_entries[old_row]
+            else:
+                if old_row is None:
+                    added.append(cushion.ean_13)
+                else:
+                    updated.append(cushion.ean_13)
+                old_entry = self.build_combobox_entry(cushion, "old")
+                new_entry = self.build_combobox_entry(cushion, "new")
+            old_number_entries.append(old_entry)
+            new_number_entries.append(new_entry)
+        removed = [base_cushions.barcode(row) for row, kept in enumerate(kept_rows) if not kept]
+
+        # Labels added to the archive by another station since the last reload are read in as well.
+        archived = self.archive.refresh()
+        rendered = self.rasterizer.update(added + updated)
+        with tracer.span("catalog.search_index", items=len(cushions)):
+            search_indices = self.build_search_indices(old_number_entries, new_number_entries)
+        self.write_snapshot(cushions, index, catalog_errors, old_number_entries, new_number_entries, search_indices)
+        return {
+            "base_cushions": base_cushions,
+            "cushions": cushions,
+            "index": index,
+            "catalog_errors": catalog_errors,
+            "old_number_entries": old_number_entries,
+            "new_number_entries": new_number_entries,
+            "search_indices": search_indices,
+            "replacements": new_replacements,
+            "multiple_choice_replacements": new_multiple_choice_replacements,
+            "added": added,
+            "updated": updated,
+            "removed": removed,
+            "changed_labels": archived + rendered
+        }
+
+    def apply_reload(self, update: dict) -> dict:
+        """
+        Swaps an update from prepare_reload() into the loaded data. Only replaces references, so it's quick; must run
+        on the thread using the loaded data. Returns the same as reload(), or None if the update is stale because
+        another reload has replaced the data it was worked out against; prepare_reload() must then be run again, on
+        the worker thread.
+        """
+        if update["base_cushions"] is not self.cushions:
+            # The labels the stale update rendered are already in the archive, so the next update won't see them
+            # as changed.
+            for barcode in update["updated"] + update["changed_labels"]:
+                self.labels.invalidate(barcode)
+                self.previews.invalidate(barcode)
+            return None
+        corrections_changed = (update["replacements"] != self.replacements
+                               or update["multiple_choice_replacements"] != self.multiple_choice_replacements)
+        self.cushions = update["cushions"]
+        self.index = update["index"]
+        self.catalog_errors = update["catalog_errors"]
+        self.old_number_combobox_entry_list = update["old_number_entries"]
+        self.new_number_combobox_entry_list = update["new_number_entries"]
+        self.search_indices = update["search_indices"]
+        self.replacements = update["replacements"]
+        self.multiple_choice_replacements = update["multiple_choice_replacements"]
+
+        for barcode in update["updated"] + update["removed"] + update["changed_labels"]:
+            self.labels.invalidate(barcode)
+            self.previews.invalidate(barcode)
+        return {"added": update["added"], "updated": update["updated"], "removed": update["removed"],
+                "changed_labels": update["changed_labels"], "corrections_changed": corrections_changed}
+
+    @property
+    def label_template_error(self) -> str:
+        """Why Data/label_template.json can't be used, or None; the default layout is used instead."""
+        return self.renderer.template_error
+
+    @property
+    def correction_errors(self) -> list:
+        """The correction rules that can't be followed, because they loop or end in an unknown barcode."""
+        return self.index.corrections.errors
 
     def item_exists(self, barcode: str) -> bool:
         """Returns True if the barcode exists and is correct."""
-        for item in self.cushions:
-            if item.ean_13 == barcode:
-                return True
-        return False
+        return self.index.contains(barcode)
 
     def get_item_by_barcode(self, barcode: str) -> Cushion:
         """Returns the Cushion class object with the .ean_13 property equal to barcode."""
-        for item in self.cushions:
-            if item.ean_13 == barcode:
-                return item
+        return self.index.get(barcode)
+
+    def get_item_by_item_number(self, item_number: str, number_type: str = None) -> Cushion:
+        """Returns the Cushion class object with the given old or new item number, as in BarcodeIndex."""
+        return self.index.get_by_item_number(item_number, number_type)
+
+    def resolve(self, barcode: str) -> Resolution:
+        """Resolves a scanned barcode to an item, applying the correction rules."""
+        return self.index.resolve(barcode)
+
+    def find_misread(self, barcode: str) -> str:
+        """Returns the one known barcode that the scanned 13-digit barcode is probably a misreading of, or None."""
+        return self.index.find_misread(barcode)
 
     def barcode_must_be_replaced(self, barcode: str) -> bool:
         """Returns true if the barcode exists and is known to be incorrect."""
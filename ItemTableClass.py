@@ -0,0 +1,153 @@
+from array import array
+
+from CushionClass import Cushion
+
+
+def prefix_columns(columns: dict, prefix: str) -> dict:
+    """Returns the columns with "prefix." put before their names, so several objects' columns can be kept together."""
+    return {f"{prefix}.{name}": column for name, column in columns.items()}
+
+
+def prefixed_columns(columns: dict, prefix: str) -> dict:
+    """Returns the columns whose names start with "prefix.", without the prefix; the reverse of prefix_columns()."""
+    start = len(prefix) + 1
+    return {name[start:]: column for name, column in columns.items() if name.startswith(prefix + ".")}
+
+
+class PackedStrings:
+    """
+    A read-only list of strings kept as one block of UTF-8 data and the offset of each string in it, so that a string
+    costs its length plus four bytes instead of a separate str object. Strings are decoded when they are indexed.
+    """
+    def __init__(self, offsets=None, data=None):
+        # len(self) + 1 offsets; string i is data[offsets[i]:offsets[i + 1]].
+        self.offsets = offsets if offsets is not None else array("I", [0])
+        self.data = data if data is not None else bytearray()
+
+    @classmethod
+    def from_strings(cls, strings) -> "PackedStrings":
+        packed = cls()
+        for string in strings:
+            packed.append(string)
+        return packed
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "PackedStrings":
+        """Returns the list stored by columns(), e.g. as memoryviews into a catalog snapshot."""
+        return cls(columns["offsets"], columns["data"])
+
+    def columns(self) -> dict:
+        """Returns the arrays the list is made of, by name, for storing it in a catalog snapshot."""
+        return {"offsets": self.offsets, "data": self.data}
+
+    def append(self, string: str) -> None:
+        """Adds a string to the end. Only used while building the list."""
+        self.data += string.encode("utf-8")
+        self.offsets.append(len(self.data))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ItemTable:
+    """
+    The catalog's items, held column by column instead of as one object per item. Barcodes are stored as 64-bit
+    numbers, the old and new item numbers as packed strings, and item names and colors, which repeat across many items,
+    as a list of the distinct values and a small code per item. Indexing the table gives a Cushion with the item's
+    fields, so the rest of the program keeps using Cushion attributes; the table itself never holds Cushion objects.
+    The table isn't changed once it has been built; a reloaded catalog gets a new table.
+    """
+    def __init__(self):
+        self.barcodes = array("q")
+        self.old_numbers = PackedStrings()
+        self.new_numbers = PackedStrings()
+        # The distinct item names and colors; item_name_codes[row] is the position of the row's name in item_names.
+        self.item_names = []
+        self.item_name_codes = array("I")
+        self.colors = []
+        self.color_codes = array("I")
+
+    @classmethod
+    def from_items(cls, items) -> "ItemTable":
+        """Builds a table from Cushion objects, e.g. those yielded by the catalog parser. Barcodes must be EAN-13."""
+        table = cls()
+        item_name_codes = {}
+        color_codes = {}
+        for item in items:
+            table.barcodes.append(int(item.ean_13))
+            table.old_numbers.append(item.old_number)
+            table.new_numbers.append(item.new_number)
+            table.item_name_codes.append(cls.encode(item.item_name, item_name_codes, table.item_names))
+            table.color_codes.append(cls.encode(item.color, color_codes, table.colors))
+        return table
+
+    def without_rows(self, rows) -> "ItemTable":
+        """Returns a new table without the given rows, e.g. the duplicates of a parsed catalog."""
+        rows = set(rows)
+        return ItemTable.from_items(self[row] for row in range(len(self)) if row not in rows)
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "ItemTable":
+        """Returns the table stored by columns(). The arrays are used as they are, without copying them."""
+        table = cls()
+        table.barcodes = columns["barcodes"]
+        table.old_numbers = PackedStrings.from_columns(prefixed_columns(columns, "old_numbers"))
+        table.new_numbers = PackedStrings.from_columns(prefixed_columns(columns, "new_numbers"))
+        # The distinct names and colors are few, so they are decoded once instead of on every lookup.
+        table.item_names = list(PackedStrings.from_columns(prefixed_columns(columns, "item_names")))
+        table.item_name_codes = columns["item_name_codes"]
+        table.colors = list(PackedStrings.from_columns(prefixed_columns(columns, "colors")))
+        table.color_codes = columns["color_codes"]
+        return table
+
+    def columns(self) -> dict:
+        """Returns the arrays the table is made of, by name, for storing it in a catalog snapshot."""
+        columns = {
+            "barcodes": self.barcodes,
+            "item_name_codes": self.item_name_codes,
+            "color_codes": self.color_codes
+        }
+        for name, strings in (("old_numbers", self.old_numbers), ("new_numbers", self.new_numbers),
+                              ("item_names", PackedStrings.from_strings(self.item_names)),
+                              ("colors", PackedStrings.from_strings(self.colors))):
+            columns.update(prefix_columns(strings.columns(), name))
+        return columns
+
+    @staticmethod
+    def encode(value: str, codes: dict, values: list) -> int:
+        """Returns the code of the value, adding it to values if it's new."""
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.barcodes)
+
+    def __getitem__(self, row: int) -> Cushion:
+        """Returns the item in the given row."""
+        return Cushion.from_fields(self.old_numbers[row], self.item_names[self.item_name_codes[row]],
+                                   self.colors[self.color_codes[row]], self.barcode(row), self.new_numbers[row])
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def barcode(self, row: int) -> str:
+        """Returns the EAN-13 barcode of the item in the given row."""
+        return f"{self.barcodes[row]:013d}"
+
+    def iter_barcodes(self):
+        """Yields the barcode of every item, in table order, without building the items."""
+        for value in self.barcodes:
+            yield f"{value:013d}"
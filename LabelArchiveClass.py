@@ -0,0 +1,301 @@
+import ctypes
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from PyQt6 import sip
+from PyQt6.QtGui import QImage
+
+try:
+    import fcntl
+except ImportError:
+    # Windows.
+    fcntl = None
+    import msvcrt
+
+# On Windows, a single byte far beyond the end of the archive is locked, since a locked range can't be read by others.
+WINDOWS_LOCK_OFFSET = 1 << 40
+# Seconds to wait for the lock before giving up, and between tries. Writers only hold it while appending a batch.
+LOCK_TIMEOUT = 60
+LOCK_RETRY_INTERVAL = 0.05
+
+
+def lock_file(locked_file, timeout: float = None) -> None:
+    """
+    Waits for an exclusive lock on the file, shared with the other processes and stations using it. Raises OSError if
+    the lock isn't free within timeout seconds, e.g. because a writer on another station hangs while holding it.
+    """
+    if timeout is None:
+        timeout = LOCK_TIMEOUT
+    deadline = time.monotonic() + timeout
+    if fcntl is None:
+        locked_file.seek(WINDOWS_LOCK_OFFSET)
+    while True:
+        try:
+            if fcntl is not None:
+                fcntl.flock(locked_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(locked_file.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise OSError(f"Etiketarkivet har været låst af en anden station i over {timeout:.0f} sekunder.")
+            time.sleep(LOCK_RETRY_INTERVAL)
+
+
+def unlock_file(locked_file) -> None:
+    if fcntl is not None:
+        fcntl.flock(locked_file.fileno(), fcntl.LOCK_UN)
+        return
+    locked_file.seek(WINDOWS_LOCK_OFFSET)
+    msvcrt.locking(locked_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class LabelArchive:
+    """
+    Holds all the PNG labels in a single file, so that reading a label costs no file open or stat, which is slow on
+    a network share. The file starts with a short header, followed by one record per label: the barcode, the length
+    of the PNG data and the data itself. Labels are only ever appended; a newer record for a barcode replaces the
+    older one, and a record without data removes the label. compact() rewrites the file without the replaced and
+    removed records. The file is memory-mapped, and labels are decoded straight from the mapped file.
+    Writers, in this or another process or station, take a lock on the file, so that their records never overlap.
+    """
+    file_header = b"HSLABELS\x01\x00\x00\x00"
+    # The barcode, as 13 ASCII digits, and the length of the PNG data.
+    record_header = struct.Struct("<13sI")
+    # Marks a record that only covers the unreadable remains of a record cut short by a crash.
+    filler_barcode = b"\0" * 13
+
+    def __init__(self, path: str = "Data/labels.pack"):
+        self.path = path
+        # The index - barcodes as keys, the offset and length of the label's PNG data as values - and the mapped file
+        # the offsets point into. They are only ever replaced together, so that a reader never pairs the offsets of
+        # one refresh with the map of another.
+        self._state = ({}, None)
+        self._state_lock = threading.Lock()
+        # The end of the last record read into the index.
+        self.end = 0
+        # The status of the mapped file, to notice when another station has replaced it by compacting it.
+        self._file_stat = None
+        # Held by writers and while refreshing; readers only need self._state_lock.
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @property
+    def index(self) -> dict:
+        """The current index. Must not be changed."""
+        with self._state_lock:
+            return self._state[0]
+
+    def _get_state(self) -> tuple:
+        with self._state_lock:
+            return self._state
+
+    def __contains__(self, barcode: str) -> bool:
+        return barcode in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def barcodes(self) -> list:
+        return list(self.index)
+
+    def refresh(self) -> list:
+        """
+        Maps the file again and reads the records added since the last time, e.g. by another station. A missing
+        file counts as an empty archive. Returns the barcodes of the labels added, replaced or removed by those
+        records. Raises ValueError if the file isn't a label archive.
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> list:
+        """Does the work of refresh(). Needs self._lock."""
+        index, label_map = self._get_state()
+        changed = []
+        try:
+            with open(self.path, "rb") as archive_file:
+                file_stat = os.fstat(archive_file.fileno())
+                size = file_stat.st_size
+                if self._file_stat is not None and not os.path.samestat(file_stat, self._file_stat):
+                    # The archive has been compacted; every label has moved.
+                    changed.extend(index)
+                    index, label_map = {}, None
+                    self.end = 0
+                    self._file_stat = None
+                if size <= len(self.file_header):
+                    self._set_state(index, label_map)
+                    return changed
+                # A copy-on-write map is writable as far as Python is concerned, which ctypes needs to get the
+                # address of the data; nothing is ever written to it.
+                label_map = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except FileNotFoundError:
+            return changed
+        if label_map[:len(self.file_header)] != self.file_header:
+            raise ValueError(f"{self.path} is not a label archive.")
+        # The new records go into a copy, so that readers keep using the published index until the new one is ready.
+        index = dict(index)
+        offset = max(self.end, len(self.file_header))
+        while offset + self.record_header.size <= size:
+            barcode, length = self.record_header.unpack_from(label_map, offset)
+            data_offset = offset + self.record_header.size
+            # A record cut short, e.g. by a crash while appending, ends the archive; the next append covers it.
+            if data_offset + length > size:
+                break
+            offset = data_offset + length
+            if barcode == self.filler_barcode:
+                continue
+            barcode = barcode.decode("ascii")
+            if length > 0:
+                index[barcode] = (data_offset, length)
+            else:
+                index.pop(barcode, None)
+            changed.append(barcode)
+        self.end = offset
+        self._file_stat = file_stat
+        # Labels being decoded keep using the previous map, which is closed once they are done with it.
+        self._set_state(index, label_map)
+        return list(dict.fromkeys(changed))
+
+    def _set_state(self, index: dict, label_map) -> None:
+        with self._state_lock:
+            self._state = (index, label_map)
+
+    def _locate(self, barcode: str) -> tuple:
+        """Returns the map holding the label and the offset and length of its data, or None if it's missing."""
+        index, label_map = self._get_state()
+        location = index.get(barcode)
+        if location is None or label_map is None:
+            return None
+        offset, length = location
+        # Never reads past the end of the map, whatever the index says.
+        if offset + length > len(label_map):
+            return None
+        return label_map, offset, length
+
+    def get_image(self, barcode: str) -> QImage:
+        """Decodes the label, without copying its data out of the mapped file. Returns a null image if it's missing."""
+        location = self._locate(barcode)
+        if location is None:
+            return QImage()
+        label_map, offset, length = location
+        data_pointer = ctypes.c_char.from_buffer(label_map, offset)
+        data = sip.voidptr(ctypes.addressof(data_pointer), length).asarray(length)
+        try:
+            return QImage.fromData(data, "PNG")
+        finally:
+            del data, data_pointer
+
+    def get_data(self, barcode: str) -> bytes:
+        """Returns a copy of the label's PNG data, or None if it's missing."""
+        location = self._locate(barcode)
+        if location is None:
+            return None
+        label_map, offset, length = location
+        return label_map[offset:offset + length]
+
+    @contextmanager
+    def _locked_file(self):
+        """Opens the archive, creating it if it's missing, and holds the lock shared by all writers while in use."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        while True:
+            archive_file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)), "r+b")
+            try:
+                lock_file(archive_file)
+            except OSError:
+                archive_file.close()
+                raise
+            # compact() may have replaced the file while this process was waiting for the lock.
+            if os.path.samestat(os.fstat(archive_file.fileno()), os.stat(self.path)):
+                break
+            unlock_file(archive_file)
+            archive_file.close()
+        try:
+            yield archive_file
+        finally:
+            unlock_file(archive_file)
+            archive_file.close()
+
+    @contextmanager
+    def writer_lock(self):
+        """Holds the lock shared by all writers, e.g. while updating a file kept next to the archive."""
+        with self._lock, self._locked_file():
+            yield
+
+    def append(self, labels: dict) -> None:
+        """
+        Adds labels, with barcodes as keys and PNG data as values, replacing any older versions. None as the data
+        removes the label.
+        """
+        if not labels:
+            return
+        with self._lock, self._locked_file() as archive_file:
+            # Reads the records other stations have appended, so that the new ones go after them.
+            self._refresh()
+            size = os.fstat(archive_file.fileno()).st_size
+            if self.end == 0:
+                archive_file.seek(0)
+                archive_file.write(self.file_header)
+            else:
+                archive_file.seek(self.end)
+            for barcode, data in labels.items():
+                data = data or b""
+                archive_file.write(self.record_header.pack(barcode.encode("ascii"), len(data)))
+                archive_file.write(data)
+            # Anything past the last complete record was left by a writer that crashed, since writers hold the lock
+            # until they are done. If the new records don't cover it, a filler record does; the file is never
+            # shortened, which Windows doesn't allow while other stations have it mapped.
+            position = archive_file.tell()
+            if position < size:
+                filler_length = max(size - position - self.record_header.size, 0)
+                archive_file.write(self.record_header.pack(self.filler_barcode, filler_length))
+                archive_file.write(bytes(filler_length))
+            archive_file.flush()
+            self._refresh()
+
+    def remove(self, barcodes) -> None:
+        """Removes the labels with the given barcodes."""
+        self.append({barcode: None for barcode in barcodes if barcode in self.index})
+
+    def wasted_bytes(self) -> int:
+        """Returns the number of bytes taken up by replaced and removed labels, which compact() would free."""
+        used = len(self.file_header) + sum(self.record_header.size + length for _, length in self.index.values())
+        return self.end - used
+
+    def compact(self) -> tuple:
+        """
+        Rewrites the archive with only the current version of each label, in barcode order. The new file replaces
+        the old one in a single step, so readers see either the old or the new archive. On Windows, a mapped file
+        can't be replaced, so this must be run while the program is closed on all stations. Returns the file size
+        before and after.
+        """
+        temporary_path = self.path + ".tmp"
+        with self._lock, self._locked_file():
+            self._refresh()
+            size_before = self.end
+            with open(temporary_path, "wb") as archive_file:
+                archive_file.write(self.file_header)
+                for barcode in sorted(self.index):
+                    data = self.get_data(barcode)
+                    archive_file.write(self.record_header.pack(barcode.encode("ascii"), len(data)))
+                    archive_file.write(data)
+            # Replaced while the lock is held; writers waiting for it notice that the file has changed. Readers keep
+            # using the old map until the refresh notices it too and publishes the new index and map together.
+            os.replace(temporary_path, self.path)
+            self._refresh()
+        return size_before, self.end
+
+    def import_png_folder(self, png_folder: str) -> list:
+        """Adds every PNG label in the folder that isn't in the archive yet. Returns their barcodes."""
+        labels = {}
+        for file_name in sorted(os.listdir(png_folder)):
+            barcode, extension = os.path.splitext(file_name)
+            if extension.lower() == ".png" and barcode not in self.index:
+                with open(os.path.join(png_folder, file_name), "rb") as png_file:
+                    labels[barcode] = png_file.read()
+        self.append(labels)
+        return list(labels)
@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+
+from LabelArchiveClass import LabelArchive
+from TracerClass import tracer
+
+
+class LabelCache(QObject):
+    """
+    Holds decoded label images. Labels are decoded from the label archive on first access, on a background thread, and
+    kept in memory up to a set number of labels and/or bytes; the least recently used label is evicted first.
+    """
+    # Emitted (from a worker thread) with the barcode when a requested label has finished decoding.
+    label_decoded = pyqtSignal(str)
+
+    def __init__(self, max_labels: int = 32, max_bytes: int = None, archive: LabelArchive = None,
+                 workers: int = 2):
+        super().__init__()
+        self.max_labels = max_labels
+        self.max_bytes = max_bytes
+        self.archive = archive if archive is not None else LabelArchive()
+        # A function drawing the label for a barcode that isn't in the archive, or None to treat such labels as missing.
+        self.render_missing = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        # Barcodes as keys and decoded QImages as values, ordered from least to most recently used.
+        self._images = OrderedDict()
+        # Decodes that have been started but not yet finished, by barcode.
+        self._pending = {}
+        # How many times each label, and the whole cache, has been invalidated. A decode finishing after its label was
+        # invalidated is not stored, since it may have read the old label.
+        self._invalidations = {}
+        self._clear_count = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="label-decoder")
+
+    def peek(self, barcode: str) -> QImage:
+        """Returns the decoded label if it is in the cache, or None. Never decodes anything."""
+        with self._lock:
+            image = self._images.get(barcode)
+            if image is not None:
+                self._images.move_to_end(barcode)
+                self.hits += 1
+            return image
+
+    def request(self, barcode: str) -> Future:
+        """Starts decoding the label in the background, unless it is already cached or being decoded."""
+        with self._lock:
+            if barcode in self._pending:
+                return self._pending[barcode]
+            if barcode in self._images:
+                future = Future()
+                future.set_result(self._images[barcode])
+                return future
+            self.misses += 1
+            future = self._executor.submit(self._decode, barcode, self._generation(barcode))
+            self._pending[barcode] = future
+        future.add_done_callback(lambda _: self.label_decoded.emit(barcode))
+        return future
+
+    def get_image(self, barcode: str) -> QImage:
+        """Returns the decoded label, waiting for it to be decoded if necessary."""
+        image = self.peek(barcode)
+        if image is not None:
+            return image
+        return self.request(barcode).result()
+
+    def get_pixmap(self, barcode: str) -> QPixmap:
+        """Returns the label as a QPixmap. Must be called from the GUI thread."""
+        return QPixmap.fromImage(self.get_image(barcode))
+
+    def invalidate(self, barcode: str) -> None:
+        """
+        Removes the label from the cache, so that it will be decoded again on next access. A decode that is still
+        running is forgotten; its result isn't stored.
+        """
+        with self._lock:
+            self._invalidations[barcode] = self._invalidations.get(barcode, 0) + 1
+            self._pending.pop(barcode, None)
+            image = self._images.pop(barcode, None)
+            if image is not None:
+                self.current_bytes -= image.sizeInBytes()
+
+    def clear(self) -> None:
+        """Removes all labels from the cache and forgets the decodes that are still running."""
+        with self._lock:
+            self._clear_count += 1
+            self._pending.clear()
+            self._images.clear()
+            self.current_bytes = 0
+
+    @property
+    def stats(self) -> dict:
+        """Returns the cache counters, for sizing the cache."""
+        with self._lock:
+            return {
+                "labels": len(self._images),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _generation(self, barcode: str) -> tuple:
+        """Returns a value that changes whenever the label is invalidated or the cache is cleared. Needs the lock."""
+        return self._clear_count, self._invalidations.get(barcode, 0)
+
+    def _decode(self, barcode: str, generation: tuple) -> QImage:
+        """
+        Decodes the label from the archive, or draws the label if it isn't archived, and stores the result in the
+        cache unless the label has been invalidated in the meantime. Runs on a worker thread.
+        """
+        try:
+            if self.render_missing is not None and barcode not in self.archive:
+                with tracer.span("label.render", barcode=barcode):
+                    image = self.render_missing(barcode)
+            else:
+                with tracer.span("label.decode", barcode=barcode):
+                    image = self.archive.get_image(barcode)
+        finally:
+            # Also done if decoding fails, so that the next request tries again instead of getting the failed decode.
+            with self._lock:
+                if self._generation(barcode) == generation:
+                    self._pending.pop(barcode, None)
+        with self._lock:
+            if image.isNull() or self._generation(barcode) != generation:
+                return image
+            self._images[barcode] = image
+            self.current_bytes += image.sizeInBytes()
+            self._evict()
+        return image
+
+    def _evict(self) -> None:
+        """Evicts the least recently used labels until the cache is within its limits. Always keeps one label."""
+        while len(self._images) > 1 and (
+                (self.max_labels is not None and len(self._images) > self.max_labels)
+                or (self.max_bytes is not None and self.current_bytes > self.max_bytes)):
+            _, image = self._images.popitem(last=False)
+            self.current_bytes -= image.sizeInBytes()
+            self.evictions += 1
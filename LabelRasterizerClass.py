@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from LabelArchiveClass import LabelArchive
+
+
+def file_hash(path: str) -> str:
+    """Returns the SHA-256 hash of the file's contents."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as in_file:
+        for chunk in iter(lambda: in_file.read(1 << 16), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def render_pdf_to_png(pdf_path: str, dpi: int) -> bytes:
+    """Renders the first page of a PDF into PNG data. Runs in a worker process."""
+    import pymupdf
+    label_pdf = pymupdf.open(pdf_path)
+    label = label_pdf.load_page(0)
+    label_pix = label.get_pixmap(dpi=dpi)
+    png_data = label_pix.tobytes("png")
+    label_pdf.close()
+    return png_data
+
+
+class LabelRasterizer:
+    """
+    Keeps the labels in the label archive in sync with the PDF labels. A manifest next to the archive stores the hash
+    of the PDF each label was rendered from, so that a replaced PDF gets re-rendered. Rendering runs on a pool of
+    worker processes.
+    """
+    # Rendered labels are added to the archive in batches of this many, so that an interrupted run keeps its work.
+    append_batch_size = 100
+
+    def __init__(self, pdf_folder: str = "Data/PDF", archive: LabelArchive = None, dpi: int = 300,
+                 workers: int = None):
+        self.pdf_folder = pdf_folder
+        self.archive = archive if archive is not None else LabelArchive()
+        self.dpi = dpi
+        self.workers = workers
+        self.manifest_path = os.path.splitext(self.archive.path)[0] + "-manifest.json"
+        # Barcodes as keys; the source PDF's size, modification time and hash as values.
+        self.manifest = self.load_manifest()
+        # Barcodes for which neither an archived label nor a PDF exists.
+        self.missing = []
+        # Barcodes whose PDF couldn't be rendered, with the error message.
+        self.failed = {}
+
+    def pdf_path(self, barcode: str) -> str:
+        return f"{self.pdf_folder}/{barcode}.pdf"
+
+    def load_manifest(self) -> dict:
+        """Loads the manifest; a missing or unreadable manifest is treated as empty."""
+        try:
+            with open(self.manifest_path, "r") as in_file:
+                return json.load(in_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, changes: dict) -> None:
+        """
+        Adds the changed entries to the manifest on disk. Other stations may be rendering labels too, so the manifest
+        is read again and written while holding the archive's writer lock, and only the changed entries replace the
+        ones read; the file is replaced in a single step, so that it's never seen half written.
+        """
+        if not changes:
+            return
+        temporary_path = self.manifest_path + ".tmp"
+        try:
+            with self.archive.writer_lock():
+                self.manifest = self.load_manifest()
+                self.manifest.update(changes)
+                with open(temporary_path, "w") as out_file:
+                    json.dump(self.manifest, out_file, indent=1, sort_keys=True)
+                os.replace(temporary_path, self.manifest_path)
+        except OSError:
+            self.manifest.update(changes)
+
+    def pdf_fingerprint(self, barcode: str) -> dict:
+        """
+        Returns the size, modification time and content hash of the barcode's PDF. The hash is only computed if the
+        size or modification time differs from the one in the manifest.
+        """
+        stat = os.stat(self.pdf_path(barcode))
+        known = self.manifest.get(barcode)
+        if known is not None and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+            return known
+        return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": file_hash(self.pdf_path(barcode))}
+
+    def find_outdated(self, barcodes) -> list:
+        """
+        Returns the barcodes whose label is missing from the archive or was rendered from a different PDF than the
+        current one. A label without a PDF is kept as it is. A label with a PDF but no manifest entry, e.g. one
+        imported from the old PNG folder, is rendered again, since there is no telling which PDF it was made from.
+        """
+        outdated = []
+        self.missing = []
+        # Manifest entries to save, for labels whose PDF was touched without changing.
+        changes = {}
+        for barcode in barcodes:
+            label_exists = barcode in self.archive
+            if not os.path.isfile(self.pdf_path(barcode)):
+                if not label_exists:
+                    self.missing.append(barcode)
+                continue
+            known = self.manifest.get(barcode)
+            if not label_exists or known is None:
+                outdated.append(barcode)
+                continue
+            fingerprint = self.pdf_fingerprint(barcode)
+            if known["sha256"] != fingerprint["sha256"]:
+                outdated.append(barcode)
+            elif known != fingerprint:
+                changes[barcode] = fingerprint
+        self.save_manifest(changes)
+        return outdated
+
+    def render(self, barcodes: list, progress=None) -> list:
+        """
+        Renders the PDFs for the given barcodes, in parallel, adds the labels to the archive and updates the manifest.
+        Calls progress(done, total, barcode) after each label. Returns the barcodes that were rendered.
+        """
+        self.failed = {}
+        rendered = []
+        total = len(barcodes)
+        if total == 0:
+            return rendered
+        fingerprints = {barcode: self.pdf_fingerprint(barcode) for barcode in barcodes}
+        # Rendered labels waiting to be added to the archive.
+        batch = {}
+
+        def store_batch() -> None:
+            self.archive.append(batch)
+            rendered.extend(batch)
+            batch.clear()
+
+        # A single label isn't worth the cost of starting worker processes.
+        if total == 1:
+            barcode = barcodes[0]
+            try:
+                batch[barcode] = render_pdf_to_png(self.pdf_path(barcode), self.dpi)
+            except Exception as error:
+                self.failed[barcode] = str(error)
+            if progress is not None:
+                progress(1, total, barcode)
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {
+                    executor.submit(render_pdf_to_png, self.pdf_path(barcode), self.dpi): barcode
+                    for barcode in barcodes
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    barcode = futures[future]
+                    try:
+                        batch[barcode] = future.result()
+                    except Exception as error:
+                        self.failed[barcode] = str(error)
+                    if len(batch) >= self.append_batch_size:
+                        store_batch()
+                    if progress is not None:
+                        progress(done, total, barcode)
+        store_batch()
+        self.save_manifest({barcode: fingerprints[barcode] for barcode in rendered})
+        return rendered
+
+    def update(self, barcodes, progress=None) -> list:
+        """Renders the labels that are missing from the archive or outdated. Returns the barcodes that were rendered."""
+        return self.render(self.find_outdated(barcodes), progress)
+
+    def all_pdf_barcodes(self) -> list:
+        """Returns the barcodes of all the PDF files in the PDF folder."""
+        return sorted(
+            os.path.splitext(file_name)[0] for file_name in os.listdir(self.pdf_folder)
+            if file_name.lower().endswith(".pdf")
+        )
@@ -0,0 +1,155 @@
+import copy
+import json
+import re
+import string
+from PyQt6.QtCore import QRect, Qt
+from PyQt6.QtGui import QColor, QFont, QImage, QPainter
+
+from CushionClass import Cushion
+
+# The bar patterns of each digit in the three EAN-13 code sets; 1 is a bar and 0 a space.
+L_CODES = ("0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011")
+R_CODES = tuple(code.translate(str.maketrans("01", "10")) for code in L_CODES)
+G_CODES = tuple(code[::-1] for code in R_CODES)
+# The first digit isn't drawn as bars; it decides which of the left-hand digits use the L or the G code set.
+PARITY_PATTERNS = ("LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG", "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL")
+
+
+def ean13_modules(barcode: str) -> str:
+    """Returns the 95 modules of the EAN-13 barcode as a string of "1" (bar) and "0" (space)."""
+    parity = PARITY_PATTERNS[int(barcode[0])]
+    left_half = "".join((L_CODES if code_set == "L" else G_CODES)[int(digit)]
+                        for code_set, digit in zip(parity, barcode[1:7]))
+    right_half = "".join(R_CODES[int(digit)] for digit in barcode[7:13])
+    return "101" + left_half + "01010" + right_half + "101"
+
+
+class LabelRenderer:
+    """
+    Draws an item's label from its catalog fields and a layout template, so that a new item needs no label file.
+    The template places text fields and the barcode on the label, in pixels at the label's resolution. A different
+    layout can be put in Data/label_template.json; otherwise the default one, matching the old PDF labels, is used.
+    """
+    template_path = "Data/label_template.json"
+    # The item fields that a text element can use, as {item_name}.
+    field_names = ("item_name", "color", "old_number", "new_number", "ean_13")
+    # The modules where the start, middle and end guard bars begin.
+    guard_bar_positions = {0, 2, 46, 48, 92, 94}
+    default_template = {
+        "width": 976,
+        "height": 473,
+        "font_family": "Verdana",
+        "elements": [
+            {"type": "text", "text": "{item_name}", "x": 54, "y": 30, "width": 760, "height": 120, "font_size": 38,
+             "bold": True},
+            {"type": "text", "text": "{color}", "x": 54, "y": 230, "width": 400, "height": 40, "font_size": 20,
+             "bold": True},
+            {"type": "text", "text": "ITEM NO.:", "x": 54, "y": 295, "width": 400, "height": 50, "font_size": 28,
+             "bold": True},
+            {"type": "text", "text": "{new_number}", "x": 54, "y": 358, "width": 420, "height": 50, "font_size": 28},
+            {"type": "barcode", "x": 452, "y": 230, "module_width": 4, "height": 170, "guard_extension": 20,
+             "font_size": 26}
+        ]
+    }
+
+    def __init__(self, template: dict = None):
+        # Why the template file can't be used, if it can't; the default template is used instead.
+        self.template_error = None
+        if template is not None:
+            self.check_template(template)
+        else:
+            template = self.load_template()
+            try:
+                self.check_template(template)
+            except ValueError as error:
+                self.template_error = str(error)
+                template = copy.deepcopy(self.default_template)
+        self.template = template
+
+    @classmethod
+    def load_template(cls) -> dict:
+        """Loads the template file, or returns the default template if there is none or it can't be read."""
+        try:
+            with open(cls.template_path, "r", encoding="utf-8") as template_file:
+                return json.load(template_file)
+        except (OSError, ValueError):
+            return copy.deepcopy(cls.default_template)
+
+    @classmethod
+    def check_template(cls, template: dict) -> None:
+        """
+        Checks that every text element only uses known item fields, so that a bad template is found when it's loaded
+        rather than when a label is drawn. Raises ValueError naming the problem.
+        """
+        for element in template.get("elements", []):
+            if element.get("type") != "text":
+                continue
+            try:
+                fields = [field for _, field, _, _ in string.Formatter().parse(element["text"]) if field is not None]
+            except ValueError as error:
+                raise ValueError(f"Teksten \"{element['text']}\" i etiketskabelonen er ugyldig: {error}")
+            for field in fields:
+                if field not in cls.field_names:
+                    raise ValueError(f"Etiketskabelonen bruger det ukendte felt {{{field}}}; "
+                                     f"de kendte felter er {', '.join(cls.field_names)}.")
+
+    def render(self, cushion: Cushion) -> QImage:
+        """Returns the item's label as an image. Can be called from any thread."""
+        image = QImage(self.template["width"], self.template["height"], QImage.Format.Format_RGB32)
+        image.fill(QColor("white"))
+        fields = {
+            "item_name": cushion.item_name,
+            "color": cushion.color,
+            "old_number": cushion.old_number,
+            "new_number": cushion.new_number,
+            "ean_13": cushion.ean_13
+        }
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+        try:
+            for element in self.template["elements"]:
+                if element["type"] == "text":
+                    self.draw_text(painter, element, element["text"].format(**fields))
+                elif element["type"] == "barcode":
+                    self.draw_barcode(painter, element, cushion.ean_13)
+        finally:
+            painter.end()
+        return image
+
+    def font(self, element: dict) -> QFont:
+        font = QFont(element.get("font_family", self.template["font_family"]))
+        # Sizes are in pixels, since the label is drawn at the printer's resolution rather than the screen's.
+        font.setPixelSize(element["font_size"])
+        font.setBold(element.get("bold", False))
+        return font
+
+    def draw_text(self, painter: QPainter, element: dict, text: str) -> None:
+        """Draws the text in the element's box, wrapped at word boundaries."""
+        painter.setFont(self.font(element))
+        painter.drawText(QRect(element["x"], element["y"], element["width"], element["height"]),
+                         Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop | Qt.TextFlag.TextWordWrap, text)
+
+    def draw_barcode(self, painter: QPainter, element: dict, barcode: str) -> None:
+        """Draws the EAN-13 barcode with its digits below it; the first digit goes to the left of the bars."""
+        module_width = element["module_width"]
+        height = element["height"]
+        guard_extension = element.get("guard_extension", 0)
+        # Room is left for the first digit, which is printed in front of the bars.
+        bars_x = element["x"] + 9 * module_width
+        y = element["y"]
+        modules = ean13_modules(barcode)
+        black = QColor("black")
+        # Neighbouring bar modules are drawn as one wide bar. The guard bars are single modules and run longer.
+        for bar in re.finditer("1+", modules):
+            bar_height = height + guard_extension if bar.start() in self.guard_bar_positions else height
+            painter.fillRect(bars_x + bar.start() * module_width, y, (bar.end() - bar.start()) * module_width,
+                             bar_height, black)
+        painter.setFont(self.font({"font_size": element["font_size"], "bold": True, **element}))
+        text_flags = Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop
+        text_y = y + height
+        text_height = element["font_size"] + guard_extension
+        painter.drawText(QRect(element["x"], text_y, 9 * module_width, text_height), text_flags, barcode[0])
+        for first_module, digits in ((3, barcode[1:7]), (50, barcode[7:13])):
+            for i, digit in enumerate(digits):
+                digit_x = bars_x + (first_module + 7 * i) * module_width
+                painter.drawText(QRect(digit_x, text_y, 7 * module_width, text_height), text_flags, digit)
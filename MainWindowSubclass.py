@@ -1,29 +1,55 @@
 import os
-import sys
+import subprocess
 from PyQt6.QtGui import QIcon, QGuiApplication, QAction, QActionGroup
-from PyQt6.QtWidgets import QMainWindow, QTabWidget
+from PyQt6.QtWidgets import QMainWindow, QTabWidget, QProgressBar, QLabel
 
-from AboutWindowSubclass import AboutWindow
+from CatalogWatcherClass import CatalogWatcher
 from DataLoaderClass import DataLoader
 from FontsSizesClass import Fonts, Sizes
 from ManualTabSubclass import ManualTab
-from PrintingClass import Printing
-from PrintLoggerClass import PrintLogger
+from PrintingClass import Printing, PrintError
+from PrintSpoolClass import PrintJob, PrintSpool
 from ScannerTabSubclass import ScannerTab
+from StartupLoaderClass import StartupLoader
+from StartupTimerClass import startup_timer
+from TracerClass import tracer
 from warning_messagebox import show_warning
 
 
 class MainWindow(QMainWindow):
-    """Main window, with a tabbed interface."""
-    def __init__(self, fonts: Fonts, sizes: Sizes, printers: Printing, item_data: DataLoader):
+    """
+    Main window, with a tabbed interface. item_data is either a DataLoader, or a RemoteCatalog on a station using the
+    catalog server, in which case print_spool must send the jobs to the server.
+    """
+    def __init__(self, fonts: Fonts, sizes: Sizes, printers: Printing, item_data: DataLoader, print_spool=None):
         super().__init__()
         self.sizes = sizes
         self.printers = printers
         self.item_data = item_data
+        # A station using the catalog server has neither the catalog files nor a printer of its own.
+        self.uses_server = not isinstance(item_data, DataLoader)
         self.set_window_properties()
-        self.scanner_tab = ScannerTab(fonts, sizes, item_data, printers)
-        self.manuel_tab = ManualTab(fonts, sizes, item_data, printers)
+        # Prints on a worker thread, so that scanning can continue while a job is spooling.
+        self.print_spool = print_spool if print_spool is not None else PrintSpool(printers, item_data.labels)
+        self.print_spool.job_status_changed.connect(self.show_print_job_status)
+        self.scanner_tab = ScannerTab(fonts, sizes, item_data, self.print_spool)
+        self.manuel_tab = ManualTab(fonts, sizes, item_data, self.print_spool)
         self.setup_tabbed_interface()
+        # Created once the catalog has been loaded.
+        self.catalog_watcher = None
+        self.startup_loader = None
+        # Shows the loading progress in the status bar while the catalog is loading.
+        self.loading_progress_bar = QProgressBar()
+        self.loading_progress_bar.setMaximumWidth(160)
+        self.loading_progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.loading_progress_bar)
+        # Shows why the print log can't be written for as long as that lasts; the log is written in the background,
+        # so nothing else would tell the user.
+        self.log_error_label = QLabel()
+        self.log_error_label.hide()
+        self.statusBar().addPermanentWidget(self.log_error_label)
+        if not self.uses_server:
+            self.print_spool.log_error_changed.connect(self.show_log_error)
         # Creates a "Default printer" menu item and its associated action.
         # When selected, it will set the Windows default printer as the printer to use.
         self.default_printer_action = QAction("Windows Standardprinter", self, checkable=True)
@@ -55,14 +81,23 @@ class MainWindow(QMainWindow):
         Puts a checkmark next to the selected printer's name.
         """
         file_menu = menu.addMenu("&Fil")
-        printer_submenu = file_menu.addMenu("Vælg &printer")
-        printer_submenu.addAction(self.default_printer_action)
-        printer_submenu.addSeparator()
-        self.add_printers_to_menu(printer_submenu)
-        self.set_printer_menu_items_checked_status()
+        self.printer_submenu = file_menu.addMenu("Vælg &printer")
+        self.printer_submenu.addAction(self.default_printer_action)
+        self.printer_submenu.addSeparator()
+        self.printer_submenu.setEnabled(not self.uses_server)
+        # If the printers haven't been found yet, they are added once the startup loading is done.
+        if self.printers.is_set_up:
+            self.add_printers_to_menu(self.printer_submenu)
+            self.set_printer_menu_items_checked_status()
+        file_menu.addSeparator()
+        # In continuous mode, each scan is printed right away, without confirming the quantity.
+        continuous_scan_action = QAction("&Kontinuerlig scanning", self, checkable=True)
+        continuous_scan_action.setShortcut("Ctrl+K")
+        continuous_scan_action.toggled.connect(self.scanner_tab.set_continuous_mode)
+        file_menu.addAction(continuous_scan_action)
         file_menu.addSeparator()
         exit_action = QAction("&Afslut", self)
-        exit_action.triggered.connect(sys.exit)
+        exit_action.triggered.connect(self.close)
         exit_action.setShortcut("Ctrl+Q")
         file_menu.addAction(exit_action)
 
@@ -97,6 +132,9 @@ class MainWindow(QMainWindow):
         open_database_action.triggered.connect(self.open_bartender_file)
         open_corrections_action.triggered.connect(self.open_corrections_file)
         open_logfile_action.triggered.connect(self.open_log_file)
+        # The files are on the server.
+        for action in (open_database_action, open_corrections_action, open_logfile_action):
+            action.setEnabled(not self.uses_server)
 
     def setup_help_menu(self, menu) -> None:
         """Sets up the Help menu."""
@@ -107,6 +145,23 @@ class MainWindow(QMainWindow):
         about_action.triggered.connect(self.open_about_window)
         help_menu.addAction(manual_action)
         help_menu.addAction(about_action)
+        help_menu.addSeparator()
+        self.setup_trace_submenu(help_menu)
+
+    def setup_trace_submenu(self, help_menu) -> None:
+        """Sets up a submenu for recording where the time goes, for finding out why a station is slow."""
+        trace_submenu = help_menu.addMenu("&Fejlfinding")
+        trace_action = QAction("&Registrér tidsforbrug", self, checkable=True)
+        trace_action.setChecked(tracer.enabled)
+        trace_action.toggled.connect(tracer.set_enabled)
+        save_trace_action = QAction("&Gem tidsforbrug...", self)
+        save_trace_action.triggered.connect(self.save_trace)
+        profile_action = QAction("&Profilering", self, checkable=True)
+        profile_action.toggled.connect(self.toggle_profiling)
+        trace_submenu.addAction(trace_action)
+        trace_submenu.addAction(save_trace_action)
+        trace_submenu.addSeparator()
+        trace_submenu.addAction(profile_action)
 
     def setup_tabbed_interface(self) -> None:
         """Creates a QTabWidget, adds the two tab-widgets to it and sets it as the window's central widget."""
@@ -136,6 +191,172 @@ class MainWindow(QMainWindow):
             if printer_action.text() == printer_name:
                 printer_action.setChecked(True)
 
+    def start_loading(self) -> None:
+        """
+        Loads the catalog and finds the printers in the background, showing the progress in the status bar.
+        Does the remaining setup right away if that has already been done.
+        """
+        if self.item_data.is_loaded and (self.printers.is_set_up or self.uses_server):
+            self.finish_loading()
+            return
+        self.loading_progress_bar.show()
+        self.startup_loader = StartupLoader(self.item_data, find_printers=not self.uses_server)
+        self.startup_loader.progress.connect(self.show_loading_progress)
+        self.startup_loader.loaded.connect(self.on_startup_loaded)
+        self.startup_loader.failed.connect(self.on_startup_failed)
+        self.startup_loader.start()
+
+    def show_loading_progress(self, message: str, done: int, total: int) -> None:
+        """Shows the startup loading progress; a busy indicator is shown if the number of steps is unknown."""
+        self.statusBar().showMessage(message)
+        self.loading_progress_bar.setMaximum(total)
+        self.loading_progress_bar.setValue(done)
+
+    def on_startup_loaded(self, available_printer_names: list, default_printer_name: str) -> None:
+        """Sets up the printers found in the background, then finishes the setup."""
+        if self.uses_server:
+            self.finish_loading()
+            return
+        try:
+            self.printers.setup(available_printer_names, default_printer_name)
+        except PrintError as error:
+            show_warning("Fejl", str(error))
+            QGuiApplication.exit(1)
+            return
+        self.add_printers_to_menu(self.printer_submenu)
+        self.set_printer_menu_items_checked_status()
+        self.finish_loading()
+
+    def on_startup_failed(self, message: str) -> None:
+        """Shows why the loading failed and closes the program."""
+        show_warning("Fejl", message)
+        QGuiApplication.exit(1)
+
+    def finish_loading(self) -> None:
+        """Fills the tabs with the loaded catalog, starts watching the catalog files and handles waiting scans."""
+        self.loading_progress_bar.hide()
+        self.statusBar().showMessage(f"{len(self.item_data.cushions)} varer indlæst.", 5000)
+        self.manuel_tab.refresh_items()
+        # Reloads the catalog whenever the BarTender file or the corrections file is edited, or, on a station using
+        # the catalog server, whenever the server has reloaded it.
+        if self.uses_server:
+            # Imported here, like the other remote modules in main.py, so that only a station using the server loads it.
+            from RemoteCatalogWatcherClass import RemoteCatalogWatcher
+            self.catalog_watcher = RemoteCatalogWatcher(self.item_data)
+        else:
+            self.catalog_watcher = CatalogWatcher(self.item_data)
+        self.catalog_watcher.catalog_reloaded.connect(self.on_catalog_reloaded)
+        self.catalog_watcher.reload_failed.connect(self.show_reload_error)
+        self.scanner_tab.on_catalog_loaded()
+        self.show_catalog_errors()
+        startup_timer.mark("catalog loaded")
+        try:
+            startup_timer.save()
+        except OSError:
+            pass
+
+    def show_print_job_status(self, job: PrintJob, status: str) -> None:
+        """Shows the status of a print job in the status bar; shows a warning if the job failed."""
+        status_texts = {
+            PrintJob.QUEUED: "i kø",
+            PrintJob.SPOOLING: "sendes til printeren",
+            PrintJob.DONE: "færdig",
+            PrintJob.FAILED: "fejlet"
+        }
+        message = (f"Printjob {job.job_id}: {job.copy_count} x {job.cushion.item_name}, {job.cushion.color} - "
+                   f"{status_texts[status]}")
+        waiting_job_count = self.print_spool.pending_count()
+        if waiting_job_count > 0:
+            message += f" ({waiting_job_count} i kø)"
+        if status == PrintJob.FAILED and self.scanner_tab.continuous_mode:
+            # A message box would take the keystrokes of the scans that follow, so the error is only shown here.
+            message += f": {job.error}"
+        self.statusBar().showMessage(message)
+        if status == PrintJob.FAILED and not self.scanner_tab.continuous_mode:
+            show_warning("Fejl", job.error)
+
+    def show_log_error(self, message: str) -> None:
+        """Shows why the print log can't be written, or hides the message once it can and no records were lost."""
+        self.log_error_label.setText(message)
+        self.log_error_label.setToolTip(message)
+        self.log_error_label.setVisible(bool(message))
+
+    def closeEvent(self, event) -> None:
+        """Lets the print queue finish before the window closes."""
+        self.print_spool.shutdown()
+        if tracer.enabled and tracer.events:
+            self.save_trace()
+        if tracer.is_profiling:
+            tracer.stop_profiling()
+        super().closeEvent(event)
+
+    def save_trace(self) -> None:
+        """Writes the recorded time spans to a trace file in the Data folder and starts a new recording."""
+        try:
+            path = tracer.save()
+        except OSError:
+            show_warning("Fejl", "Sporingsfilen kan ikke gemmes.")
+            return
+        tracer.clear()
+        self.statusBar().showMessage(f"Tidsforbrug gemt i {path}", 10000)
+
+    def toggle_profiling(self, enabled: bool) -> None:
+        """Starts profiling the user interface, or stops it and writes the results to a file in the Data folder."""
+        if enabled:
+            tracer.start_profiling()
+            self.statusBar().showMessage("Profilering startet.", 10000)
+            return
+        try:
+            path = tracer.stop_profiling()
+        except OSError:
+            show_warning("Fejl", "Profileringsfilen kan ikke gemmes.")
+            return
+        self.statusBar().showMessage(f"Profilering gemt i {path}", 10000)
+
+    def on_catalog_reloaded(self, changes: dict) -> None:
+        """Refreshes the item list in the Manual tab and reports what changed in the status bar."""
+        self.manuel_tab.refresh_items()
+        if self.printers.zpl_printer is not None:
+            for barcode in changes["updated"] + changes["removed"] + changes["changed_labels"]:
+                self.printers.zpl_printer.invalidate(barcode)
+        self.statusBar().showMessage(
+            f"Varedata genindlæst: {len(changes['added'])} nye, {len(changes['updated'])} ændrede, "
+            f"{len(changes['removed'])} fjernede varer.", 10000)
+        self.show_catalog_errors()
+
+    def show_reload_error(self, message: str) -> None:
+        """Tells the user why the catalog couldn't be reloaded; the previously loaded catalog stays in use."""
+        if self.scanner_tab.continuous_mode:
+            # A message box would take the keystrokes of the scans that follow, so the error is only shown here.
+            self.statusBar().showMessage(f"Varedata kan ikke genindlæses: {message}")
+        else:
+            show_warning("Fejl", message)
+
+    def show_catalog_errors(self) -> None:
+        """
+        Tells the user which lines of the BarTender file were skipped because they are invalid, which correction
+        rules can't be followed and why the label template can't be used, if any.
+        """
+        catalog_errors = self.item_data.catalog_errors
+        correction_errors = self.item_data.correction_errors
+        summaries, details = [], []
+        if catalog_errors:
+            summaries.append(f"{len(catalog_errors)} linjer i HyndeData.txt er ugyldige og er sprunget over.")
+            details.append(summaries[-1] + "\n" + self.item_data.catalog_error_report())
+        if correction_errors:
+            summaries.append(f"{len(correction_errors)} rettelser i Rettelser.txt kan ikke bruges.")
+            details.append(summaries[-1] + "\n" + "\n".join(correction_errors[:10]))
+        if self.item_data.label_template_error:
+            summaries.append("Etiketskabelonen kan ikke bruges; standardskabelonen bruges i stedet.")
+            details.append(summaries[-1] + "\n" + self.item_data.label_template_error)
+        if not summaries:
+            return
+        if self.scanner_tab.continuous_mode:
+            # A message box would take the keystrokes of the scans that follow, so the error is only shown here.
+            self.statusBar().showMessage(" ".join(summaries), 10000)
+        else:
+            show_warning("Fejl i varedata", "\n\n".join(details))
+
     def open_bartender_file(self) -> None:
         """Tells Windows to open the BarTender file."""
         os.startfile(self.item_data.bartender_file_path.replace("/", "\\"))
@@ -144,13 +365,21 @@ class MainWindow(QMainWindow):
         """Tells Windows to open the corrections file."""
         os.startfile(self.item_data.corrections_file_path.replace("/", "\\"))
 
-    @staticmethod
-    def open_log_file() -> None:
-        """Tells Windows to open the log file."""
-        try:
-            os.startfile(PrintLogger.path.replace("/", "\\"))
-        except FileNotFoundError:
+    def open_log_file(self) -> None:
+        """Tells Windows to open the log file, after writing any buffered records to it."""
+        self.print_spool.logger.flush()
+        log_path = self.print_spool.logger.path.replace("/", "\\")
+        if not os.path.isfile(log_path):
             show_warning("Fejl", "Logfilen kan ikke findes.")
+            return
+        try:
+            os.startfile(log_path)
+        except OSError:
+            # .jsonl files usually have no program associated with them, so they are opened in Notepad instead.
+            try:
+                subprocess.Popen(["notepad.exe", log_path])
+            except OSError:
+                show_warning("Fejl", "Logfilen kan ikke åbnes.")
 
     def open_manual(self) -> None:
         """Tells Windows to open the manual."""
@@ -161,5 +390,6 @@ class MainWindow(QMainWindow):
 
     def open_about_window(self) -> None:
         """Opens the 'About' dialog window."""
+        from AboutWindowSubclass import AboutWindow
         about_window = AboutWindow(self.sizes)
         about_window.exec()
@@ -1,22 +1,23 @@
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap
+from PyQt6.QtCore import Qt, QStringListModel
 from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout, QComboBox
 
 from CommonCustomWidgetSubclasses import Button, NumberInputEntryBox, LabelPreview
 from DataLoaderClass import DataLoader
 from FontsSizesClass import Fonts, Sizes
-from PrintingClass import Printing
 from ManualCustomWidgetSubclasses import SearchEntryBox, OldNewRadioButtons
-from PrintLoggerClass import PrintLogger
+from PrintSpoolClass import PrintSpool
+from TracerClass import tracer
 
 
 class ManualTab(QWidget):
     """An interface for manually choosing the type and number of labels to be printed."""
-    def __init__(self, fonts: Fonts, sizes: Sizes, item_data: DataLoader, printers: Printing):
+    def __init__(self, fonts: Fonts, sizes: Sizes, item_data: DataLoader, print_spool: PrintSpool):
         super().__init__()
         self.items = item_data
-        self.printers = printers
+        self.print_spool = print_spool
         self.selected_number_type = item_data.old_number_combobox_entry_list
+        # "old" or "new", depending on which item numbers are shown in the combobox.
+        self.number_type = "old"
         layout = QVBoxLayout(self)
         # "Choose type" label
         choose_type_label = QLabel("Vælg type:")
@@ -32,6 +33,9 @@ class ManualTab(QWidget):
         self.combobox.setMinimumWidth(sizes.combobox_width)
         self.combobox.setMinimumHeight(sizes.combobox_height)
         self.combobox.setFont(fonts.combobox)
+        # The combobox entries are held in a list model, so that a new search result replaces them in one reset.
+        self.combobox_model = QStringListModel()
+        self.combobox.setModel(self.combobox_model)
         self.combobox.currentIndexChanged.connect(self.update_preview)
         # Print button
         self.print_manual_button = Button("Print", fonts, sizes)
@@ -55,49 +59,77 @@ class ManualTab(QWidget):
     def change_number_type(self) -> None:
         """Changes the item list to use for the combobox according to which radio button is checked."""
         current_index = self.combobox.currentIndex()
-        if self.old_new_radio_buttons.old_radio_button.isChecked():
-            self.selected_number_type = self.items.old_number_combobox_entry_list
-        elif self.old_new_radio_buttons.new_radio_button.isChecked():
-            self.selected_number_type = self.items.new_number_combobox_entry_list
-        self.reset_combobox()
+        self.select_number_type()
         self.update_combobox()
         self.combobox.setCurrentIndex(current_index)
 
+    def select_number_type(self) -> None:
+        """Sets the item list to use for the combobox according to which radio button is checked."""
+        if self.old_new_radio_buttons.new_radio_button.isChecked():
+            self.number_type = "new"
+            self.selected_number_type = self.items.new_number_combobox_entry_list
+        else:
+            self.number_type = "old"
+            self.selected_number_type = self.items.old_number_combobox_entry_list
+
+    def refresh_items(self) -> None:
+        """
+        Rebuilds the combobox after the catalog has been reloaded, keeping the search filter and, if the item still
+        exists, the current selection.
+        """
+        selected_barcode = self.get_selected_item_barcode()
+        self.select_number_type()
+        self.update_combobox()
+        for i in range(self.combobox.count()):
+            item = self.items.get_item_by_item_number(self.combobox.itemText(i).split(" ")[0], self.number_type)
+            if item is not None and item.ean_13 == selected_barcode:
+                self.combobox.setCurrentIndex(i)
+                break
+
     def reset_combobox(self) -> None:
         """Resets the combobox to its default state, with all item types present."""
-        number_list = self.selected_number_type
-        self.combobox.clear()
-        for entry in number_list:
-            self.combobox.addItem(entry)
+        self.combobox_model.setStringList(list(self.selected_number_type))
 
     def update_combobox(self) -> None:
-        """Removes items from the Combobox if they don't contain all the words entered into the search field."""
-        self.reset_combobox()
-        search_words = self.search_entry_box.search_box.text().split(" ")
-        # Iterates backwards to avoid index shifting.
-        for i in range(self.combobox.count(), -1, -1):
-            for word in search_words:
-                if word.lower() not in self.combobox.itemText(i).lower():
-                    self.combobox.removeItem(i)
+        """Shows only the items in the combobox where every word entered into the search field begins a word."""
+        query = self.search_entry_box.search_box.text()
+        with tracer.span("manual.search", query=query):
+            search_index = self.items.get_search_index(self.number_type)
+            matching_positions = search_index.search(query)
+        with tracer.span("manual.fill_combobox", items=len(matching_positions)):
+            self.combobox_model.setStringList([self.selected_number_type[i] for i in matching_positions])
 
     def get_selected_item_barcode(self) -> str:
         """Returns the barcode number of the currently selected item in the combobox."""
         item_number = self.combobox.currentText().split(" ")[0]
-        for item in self.items.cushions:
-            if item_number in [item.old_number, item.new_number]:
-                return item.ean_13
+        item = self.items.get_item_by_item_number(item_number, self.number_type)
+        if item is not None:
+            return item.ean_13
 
     def update_preview(self) -> None:
         """In the label preview box, displays the label for the item selected in the combobox."""
         barcode = self.get_selected_item_barcode()
         if barcode is not None:
             self.label_preview.update_image_preview(barcode)
+            self.label_preview.prefetch(self.get_neighbor_barcodes())
+
+    def get_neighbor_barcodes(self, distance: int = 2) -> list:
+        """Returns the barcodes of the items up to distance rows above and below the selected one, nearest first."""
+        current_index = self.combobox.currentIndex()
+        barcodes = []
+        for offset in range(1, distance + 1):
+            for index in (current_index + offset, current_index - offset):
+                if 0 <= index < self.combobox.count():
+                    item = self.items.get_item_by_item_number(self.combobox.itemText(index).split(" ")[0],
+                                                              self.number_type)
+                    if item is not None:
+                        barcodes.append(item.ean_13)
+        return barcodes
 
     def print(self) -> None:
-        """Prints labels for the selected item."""
+        """Sends labels for the selected item to the print queue."""
         copy_count = self.number_input_entry_box.value
         selected_item_barcode = self.get_selected_item_barcode()
-        image_to_print = QPixmap(f"Data/PNG/{selected_item_barcode}.png")
-        self.printers.print(image_to_print, copy_count)
         selected_item = self.items.get_item_by_barcode(selected_item_barcode)
-        PrintLogger.write_to_log_file(selected_item, copy_count, "Manuel")
+        if selected_item is not None:
+            self.print_spool.submit(selected_item, copy_count, "Manuel")
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, QSize, Qt, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from LabelCacheClass import LabelCache
+from TracerClass import tracer
+
+
+class PreviewCache(QObject):
+    """
+    Holds labels scaled down to preview size, per preview size, so that showing a preview is only a lookup.
+    Previews are scaled on a background thread, either on request or ahead of time for labels likely to be shown next.
+    """
+    # Emitted (from a worker thread) with the barcode when a preview has been scaled.
+    preview_ready = pyqtSignal(str)
+
+    def __init__(self, labels: LabelCache, max_previews: int = 64, workers: int = 2):
+        super().__init__()
+        self.labels = labels
+        self.max_previews = max_previews
+        # (barcode, width, height) as keys and scaled QImages as values, from least to most recently used.
+        self._previews = OrderedDict()
+        self._pending = set()
+        # How many times each label, and the whole cache, has been invalidated, as in LabelCache. A preview finishing
+        # after its label was invalidated is not stored, since it may have been scaled from the old label.
+        self._invalidations = {}
+        self._clear_count = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview-scaler")
+
+    def peek(self, barcode: str, size: QSize) -> QImage:
+        """Returns the preview of the label at the given size, or None if it hasn't been scaled yet."""
+        key = (barcode, size.width(), size.height())
+        with self._lock:
+            preview = self._previews.get(key)
+            if preview is not None:
+                self._previews.move_to_end(key)
+            return preview
+
+    def request(self, barcode: str, size: QSize) -> None:
+        """Starts scaling the label to the given size in the background, unless it's already done or under way."""
+        key = (barcode, size.width(), size.height())
+        with self._lock:
+            if key in self._previews or key in self._pending:
+                return
+            self._pending.add(key)
+            generation = self._generation(barcode)
+        self._executor.submit(self._scale, key, generation)
+
+    def prefetch(self, barcodes, size: QSize) -> None:
+        """Scales the labels likely to be shown next, so that switching to them doesn't have to wait."""
+        for barcode in barcodes:
+            self.request(barcode, size)
+
+    def invalidate(self, barcode: str) -> None:
+        """Removes all previews of a label that has changed. Previews still being scaled are scaled again."""
+        with self._lock:
+            self._invalidations[barcode] = self._invalidations.get(barcode, 0) + 1
+            for key in [key for key in self._previews if key[0] == barcode]:
+                del self._previews[key]
+            self._pending = {key for key in self._pending if key[0] != barcode}
+
+    def clear(self) -> None:
+        """Removes every preview, e.g. when it's unknown which labels have changed."""
+        with self._lock:
+            self._clear_count += 1
+            self._previews.clear()
+            self._pending.clear()
+
+    def _generation(self, barcode: str) -> tuple:
+        """Returns a value that changes whenever the label is invalidated or the cache is cleared. Needs the lock."""
+        return self._clear_count, self._invalidations.get(barcode, 0)
+
+    def make_preview(self, barcode: str, width: int, height: int) -> QImage:
+        """Returns the label scaled down to fit the size, or a null image if it's missing. Runs on a worker thread."""
+        label_image = self.labels.get_image(barcode)
+        if label_image.isNull():
+            return label_image
+        with tracer.span("preview.scale", barcode=barcode):
+            return label_image.scaled(
+                width,
+                height,
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation)
+
+    def _scale(self, key: tuple, generation: tuple) -> None:
+        """
+        Scales a label down to preview size and stores it, unless the label has been invalidated in the meantime.
+        Runs on a worker thread.
+        """
+        barcode, width, height = key
+        preview = None
+        try:
+            preview = self.make_preview(barcode, width, height)
+        finally:
+            with self._lock:
+                is_current = self._generation(barcode) == generation
+                if is_current:
+                    self._pending.discard(key)
+                    # A missing label is left out, so that peek() keeps returning None for it.
+                    if preview is not None and not preview.isNull():
+                        self._previews[key] = preview
+                        while len(self._previews) > self.max_previews:
+                            self._previews.popitem(last=False)
+            if is_current:
+                # Also emitted if scaling failed, so that a waiting preview shows the label as missing instead of
+                # loading forever.
+                self.preview_ready.emit(barcode)
+            else:
+                # The waiting preview gets the new label instead.
+                self.request(barcode, QSize(width, height))
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+
+
+class PrintHistory:
+    """
+    An indexed store of all print jobs, in an SQLite database. Print logs, both the JSON Lines logs and the old
+    text logs, are imported into it, and totals per item, day or mode can be queried without reading the logs.
+    Importing is idempotent: each log line is stored once, however many times it's imported.
+    """
+    # Stored in the database's user_version. 2: records are keyed on their position in the log, so that identical
+    # records are all counted.
+    schema_version = 2
+    # A timestamp at the start of each record in the old text log; records are sometimes not separated by newlines.
+    legacy_record_start = re.compile(r"(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2}): ")
+    legacy_record = re.compile(r"(\d*) x (.*?)\s*(?:\((\w+)\))?\s*$")
+    group_columns = {
+        "item": "COALESCE(new_number, item_name)",
+        "day": "day",
+        "mode": "mode",
+        "station": "station"
+    }
+
+    def __init__(self, database_path: str = "Data/history.sqlite"):
+        self.database_path = database_path
+        self.connection = sqlite3.connect(database_path)
+        self.connection.row_factory = sqlite3.Row
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        with self.connection:
+            if version < self.schema_version:
+                # The records are keyed differently, so they are imported again from the logs.
+                self.connection.executescript("DROP TABLE IF EXISTS prints; DROP TABLE IF EXISTS imported_files;")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS prints (
+                    id INTEGER PRIMARY KEY,
+                    record_key TEXT NOT NULL UNIQUE,
+                    timestamp TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    station TEXT,
+                    mode TEXT,
+                    scanned_barcode TEXT,
+                    printed_barcode TEXT,
+                    item_name TEXT,
+                    color TEXT,
+                    old_number TEXT,
+                    new_number TEXT,
+                    copies INTEGER,
+                    printer TEXT,
+                    latency_ms INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS prints_day ON prints (day);
+                CREATE INDEX IF NOT EXISTS prints_printed_barcode ON prints (printed_barcode, day);
+                CREATE INDEX IF NOT EXISTS prints_scanned_barcode ON prints (scanned_barcode);
+                CREATE INDEX IF NOT EXISTS prints_old_number ON prints (old_number, day);
+                CREATE INDEX IF NOT EXISTS prints_new_number ON prints (new_number, day);
+                CREATE INDEX IF NOT EXISTS prints_mode ON prints (mode, day);
+                CREATE TABLE IF NOT EXISTS imported_files (
+                    path TEXT PRIMARY KEY,
+                    imported_bytes INTEGER NOT NULL,
+                    head_hash TEXT NOT NULL
+                );
+            """)
+            self.connection.execute(f"PRAGMA user_version = {self.schema_version}")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def record_key(station: str, offset: int, record: str) -> str:
+        """
+        Returns the key identifying a log record, so that it's only stored once. The record's position in the log is
+        part of the key, since two jobs can have identical records; a log that is renamed keeps its keys.
+        """
+        return hashlib.sha1(f"{station}\n{offset}\n{record}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def head_hash(path: str) -> str:
+        """Returns a hash of the beginning of a file, used to notice if it has been replaced rather than appended to."""
+        with open(path, "rb") as in_file:
+            return hashlib.sha1(in_file.read(4096)).hexdigest()
+
+    def parse_json_line(self, line: str, station: str, offset: int) -> dict:
+        """
+        Converts a line from a JSON Lines log, starting at offset in the file, into a row; returns None if it's not
+        a valid record.
+        """
+        try:
+            record = json.loads(line)
+            timestamp = record["timestamp"].replace("T", " ")
+        except (ValueError, KeyError, AttributeError):
+            return None
+        station = record.get("station", station)
+        return {
+            "record_key": self.record_key(station, offset, line),
+            "timestamp": timestamp,
+            "day": timestamp[:10],
+            "station": station,
+            "mode": record.get("mode"),
+            "scanned_barcode": record.get("scanned_barcode"),
+            "printed_barcode": record.get("printed_barcode"),
+            "item_name": record.get("item_name"),
+            "color": record.get("color"),
+            "old_number": record.get("old_number"),
+            "new_number": record.get("new_number"),
+            "copies": record.get("copies"),
+            "printer": record.get("printer"),
+            "latency_ms": record.get("latency_ms")
+        }
+
+    def parse_legacy_line(self, line: str, station: str, offset: int):
+        """
+        Converts a line from the old text log, starting at offset in the file, into rows; yields one row per record,
+        since several records are sometimes fused into one line. Records without a copy count get None as their count.
+        """
+        starts = list(self.legacy_record_start.finditer(line))
+        for i, start in enumerate(starts):
+            end = starts[i + 1].start() if i + 1 < len(starts) else len(line)
+            record_text = line[start.start():end]
+            match = self.legacy_record.match(line, start.end(), end)
+            if match is None:
+                continue
+            copies, description, mode = match.groups()
+            fields = description.split(", ")
+            if len(fields) == 4:
+                item_name, color, old_number, new_number = fields
+            else:
+                item_name, color, old_number, new_number = description, None, None, None
+            timestamp = f"{start.group(1)} {start.group(2)}"
+            yield {
+                "record_key": self.record_key(station, offset + start.start(), record_text),
+                "timestamp": timestamp,
+                "day": start.group(1),
+                "station": station,
+                "mode": mode.capitalize() if mode else None,
+                "scanned_barcode": None,
+                "printed_barcode": None,
+                "item_name": item_name,
+                "color": color,
+                "old_number": old_number,
+                "new_number": new_number,
+                "copies": int(copies) if copies else None,
+                "printer": None,
+                "latency_ms": None
+            }
+
+    def import_log(self, path: str, station: str = None, batch_size: int = 5000) -> int:
+        """
+        Streams a log file into the database, a batch at a time. A file that has only grown since it was last
+        imported is read from where the last import stopped. Returns the number of new rows.
+        """
+        if station is None:
+            station = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        path_key = os.path.abspath(path)
+        size = os.path.getsize(path)
+        head_hash = self.head_hash(path)
+        known = self.connection.execute(
+            "SELECT imported_bytes, head_hash FROM imported_files WHERE path = ?", (path_key,)).fetchone()
+        offset = 0
+        if known is not None and known["head_hash"] == head_hash and known["imported_bytes"] <= size:
+            offset = known["imported_bytes"]
+        columns = ("record_key, timestamp, day, station, mode, scanned_barcode, printed_barcode, item_name, color, "
+                   "old_number, new_number, copies, printer, latency_ms")
+        statement = (f"INSERT OR IGNORE INTO prints ({columns}) VALUES "
+                     f"({', '.join(':' + column.strip() for column in columns.split(','))})")
+        inserted = 0
+        batch = []
+        with open(path, "rb") as log_file:
+            log_file.seek(offset)
+            for raw_line in log_file:
+                # Leaves a last line without a newline for the next import; it may still be being written.
+                if not raw_line.endswith(b"\n"):
+                    break
+                line_offset = offset
+                offset += len(raw_line)
+                line = raw_line.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                if line.startswith("{"):
+                    row = self.parse_json_line(line, station, line_offset)
+                    if row is not None:
+                        batch.append(row)
+                else:
+                    batch.extend(self.parse_legacy_line(line, station, line_offset))
+                if len(batch) >= batch_size:
+                    inserted += self.insert_batch(statement, batch)
+                    batch = []
+        inserted += self.insert_batch(statement, batch)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO imported_files (path, imported_bytes, head_hash) VALUES (?, ?, ?)",
+                (path_key, offset, head_hash))
+        return inserted
+
+    def insert_batch(self, statement: str, batch: list) -> int:
+        """Inserts a batch of rows in one transaction; returns the number of rows that weren't already stored."""
+        if not batch:
+            return 0
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(statement, batch)
+            return self.connection.total_changes - before
+
+    def totals(self, group_by: str = "item", since: str = None, until: str = None, barcode: str = None,
+               item_number: str = None, mode: str = None, search: str = None) -> list:
+        """
+        Returns the number of jobs and copies printed, grouped by "item", "day", "mode" or "station".
+        since and until are dates (YYYY-MM-DD), until being exclusive. barcode matches the printed or scanned
+        barcode, item_number the old or new item number, and every word of search must appear in the item name or
+        color. Records with an unknown copy count are counted as jobs but not as copies.
+        """
+        conditions, parameters = [], []
+        if since is not None:
+            conditions.append("day >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("day < ?")
+            parameters.append(until)
+        if barcode is not None:
+            conditions.append("(printed_barcode = ? OR scanned_barcode = ?)")
+            parameters += [barcode, barcode]
+        if item_number is not None:
+            conditions.append("(old_number = ? OR new_number = ?)")
+            parameters += [item_number, item_number]
+        if mode is not None:
+            conditions.append("mode = ?")
+            parameters.append(mode.capitalize())
+        for word in (search or "").split():
+            conditions.append("(item_name || ' ' || COALESCE(color, '')) LIKE ?")
+            parameters.append(f"%{word}%")
+        group_column = self.group_columns[group_by]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = (f"SELECT {group_column} AS key, MIN(item_name) AS item_name, MIN(color) AS color, "
+                 f"COUNT(*) AS jobs, COALESCE(SUM(copies), 0) AS copies "
+                 f"FROM prints {where} GROUP BY key ORDER BY key")
+        return [dict(row) for row in self.connection.execute(query, parameters)]
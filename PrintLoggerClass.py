@@ -1,20 +1,159 @@
+import json
+import os
+import socket
+import threading
+import time
 from datetime import datetime
+
 from CushionClass import Cushion
 
 
 class PrintLogger:
-    """Writes each print job details to a log file."""
-    path = "Data/log.txt"
+    """
+    Writes the details of each print job to a log file, as one JSON object per line. Records are collected in memory
+    and written by a background thread once enough have been collected or enough time has passed, so that logging
+    never waits for the disk. The file is synced to disk at most every fsync_interval seconds, and rotated when it
+    grows beyond max_bytes or when the day changes.
+    """
+    path = "Data/log.jsonl"
+
+    def __init__(self, path: str = None, max_bytes: int = 5_000_000, flush_records: int = 50,
+                 flush_interval: float = 2.0, fsync_interval: float = 30.0, max_buffered: int = 10_000):
+        if path is not None:
+            self.path = path
+        self.max_bytes = max_bytes
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_buffered = max_buffered
+        # Identifies the computer in the records, since several stations may share the Data folder.
+        self.station = socket.gethostname()
+        # Records waiting to be written.
+        self.buffer = []
+        # The number of records dropped because they couldn't be written and the buffer was full.
+        self.dropped = 0
+        # Why the last write failed, or None if it succeeded.
+        self.last_error = None
+        # Called from the background thread with error_message() when writing starts failing, when records are
+        # dropped and once writing works again; the message is then None unless records were lost.
+        self.on_error = None
+        self._last_fsync = time.monotonic()
+        self._stopping = False
+        self._condition = threading.Condition()
+        # Held while records are being written, so that flush() and the background thread don't write at once.
+        self._write_lock = threading.Lock()
+        self.worker = threading.Thread(target=self.run, name="print-logger", daemon=True)
+        self.worker.start()
+
+    def write(self, cushion: Cushion, copy_count: int, mode: str, scanned_barcode: str = None,
+              printer: str = None, latency: float = None, station: str = None) -> None:
+        """
+        Adds a record of a print job to the buffer. Never touches the disk. The station defaults to this computer;
+        jobs sent through the catalog server are recorded with the station that sent them.
+        """
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "station": station if station is not None else self.station,
+            "mode": mode,
+            "scanned_barcode": scanned_barcode if scanned_barcode is not None else cushion.ean_13,
+            "printed_barcode": cushion.ean_13,
+            "item_name": cushion.item_name,
+            "color": cushion.color,
+            "old_number": cushion.old_number,
+            "new_number": cushion.new_number,
+            "copies": copy_count,
+            "printer": printer,
+            "latency_ms": round(latency * 1000) if latency is not None else None
+        }
+        with self._condition:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.flush_records:
+                self._condition.notify()
+
+    def run(self) -> None:
+        """Writes the buffered records every flush_interval seconds, or sooner if enough have been collected."""
+        while True:
+            with self._condition:
+                # After a failed write, waits the full interval before retrying, however many records are waiting.
+                if not self._stopping and (len(self.buffer) < self.flush_records or self.last_error is not None):
+                    self._condition.wait(self.flush_interval)
+                records, self.buffer = self.buffer, []
+                stopping = self._stopping
+            if records:
+                with self._write_lock:
+                    self.write_records(records)
+            if stopping:
+                return
 
-    @classmethod
-    def write_to_log_file(cls, cushion: Cushion, number: int, mode: str) -> None:
-        log_file_line = str(datetime.now())[:-7]
-        log_file_line += f": {number} x "
-        log_file_line += f"{cushion.item_name}, {cushion.color}, {cushion.old_number}, {cushion.new_number}"
-        log_file_line += f" ({mode})\n"
+    def write_records(self, records: list) -> None:
+        """
+        Appends the records to the log file. If that fails, puts them back into the buffer to be retried, dropping the
+        oldest records if there are more than max_buffered, and reports the failure through on_error.
+        """
+        failed_before = self.last_error
+        try:
+            self.rotate_if_needed()
+            with open(self.path, "a", encoding="utf-8") as log_file:
+                log_file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+                log_file.flush()
+                if time.monotonic() - self._last_fsync >= self.fsync_interval or self._stopping:
+                    os.fsync(log_file.fileno())
+                    self._last_fsync = time.monotonic()
+            self.last_error = None
+        except OSError as error:
+            self.last_error = str(error)
+            with self._condition:
+                self.buffer[:0] = records
+                overflow = len(self.buffer) - self.max_buffered
+                if overflow > 0:
+                    del self.buffer[:overflow]
+                    self.dropped += overflow
+            if self.on_error is not None and (failed_before is None or overflow > 0):
+                self.on_error(self.error_message())
+            return
+        if failed_before is not None and self.on_error is not None:
+            self.on_error(self.error_message())
+
+    def error_message(self) -> str:
+        """Describes why the log file can't be written and how many records have been lost, or returns None."""
+        if self.last_error is None and self.dropped == 0:
+            return None
+        message = f"Logfilen kan ikke skrives: {self.last_error}." if self.last_error is not None else ""
+        if self.dropped:
+            message += f" {self.dropped} printjob er ikke blevet logget."
+        return message.strip()
 
+    def rotate_if_needed(self) -> None:
+        """
+        Renames the log file to log-<date>-<time>.jsonl if it has grown beyond max_bytes or was last written on an
+        earlier day, so that a new file is started.
+        """
         try:
-            with open(cls.path, "a+") as log_file:
-                log_file.write(log_file_line)
-        except OSError:
-            pass
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        last_written = datetime.fromtimestamp(stat.st_mtime)
+        if stat.st_size < self.max_bytes and last_written.date() == datetime.now().date():
+            return
+        root, extension = os.path.splitext(self.path)
+        rotated_path = f"{root}-{last_written:%Y%m%d-%H%M%S}{extension}"
+        suffix = 1
+        while os.path.exists(rotated_path):
+            rotated_path = f"{root}-{last_written:%Y%m%d-%H%M%S}-{suffix}{extension}"
+            suffix += 1
+        os.replace(self.path, rotated_path)
+
+    def flush(self) -> None:
+        """Writes the buffered records now, in the calling thread. Used before the log file is opened."""
+        with self._write_lock:
+            with self._condition:
+                records, self.buffer = self.buffer, []
+            if records:
+                self.write_records(records)
+
+    def close(self) -> None:
+        """Writes the remaining records, syncs the file and stops the background thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.worker.join()
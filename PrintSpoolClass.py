@@ -0,0 +1,172 @@
+import itertools
+import queue
+import threading
+import time
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from CushionClass import Cushion
+from LabelCacheClass import LabelCache
+from PrintingClass import Printing, PrintError
+from PrintLoggerClass import PrintLogger
+from TracerClass import tracer
+
+
+class PrintJob:
+    """A single print job: a number of copies of one item's label."""
+    QUEUED = "queued"
+    SPOOLING = "spooling"
+    DONE = "done"
+    FAILED = "failed"
+
+    _ids = itertools.count(1)
+
+    def __init__(self, cushion: Cushion, copy_count: int, mode: str, scanned_barcode: str = None,
+                 station: str = None):
+        self.job_id = next(self._ids)
+        self.cushion = cushion
+        # The barcode that was scanned, if it differs from the item's (corrected) barcode.
+        self.scanned_barcode = scanned_barcode
+        # The station that sent the job, if it came through the catalog server.
+        self.station = station
+        self.copy_count = copy_count
+        self.mode = mode
+        self.status = PrintJob.QUEUED
+        self.error = None
+        self.submitted_at = time.monotonic()
+
+
+class PrintSpool(QObject):
+    """
+    Sends print jobs to the printer on a worker thread, so that the user interface stays responsive while a job is
+    spooling. Jobs that are waiting when the printer becomes free are merged into a single document, so that a burst
+    of scans or a list of labels costs one printer session instead of one per item. Labels are taken from the label
+    cache, where they are usually already decoded.
+    """
+    # Emitted with the job and its new status each time the status changes. The status is passed along because
+    # slots in the GUI thread are called later, when the job may have moved on.
+    job_status_changed = pyqtSignal(object, str)
+    # Emitted with the logger's error message when the print log can't be written, and again when it can; the message
+    # is then empty unless records were lost.
+    log_error_changed = pyqtSignal(str)
+    # The most jobs merged into one document; a failed document fails all of its jobs.
+    max_merged_jobs = 50
+
+    def __init__(self, printers: Printing, labels: LabelCache, logger: PrintLogger = None):
+        super().__init__()
+        self.printers = printers
+        self.labels = labels
+        self.logger = logger if logger is not None else PrintLogger()
+        self.logger.on_error = lambda message: self.log_error_changed.emit(message or "")
+        # Lists of jobs submitted together, or None to stop the worker.
+        self.jobs = queue.Queue()
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        self.worker = threading.Thread(target=self.run, name="print-spool", daemon=True)
+        self.worker.start()
+
+    def submit(self, cushion: Cushion, copy_count: int, mode: str, scanned_barcode: str = None,
+               station: str = None) -> PrintJob:
+        """Adds a job to the queue and returns it."""
+        return self.submit_many([(cushion, copy_count)], mode, scanned_barcode, station)[0]
+
+    def submit_many(self, labels: list, mode: str, scanned_barcode: str = None, station: str = None) -> list:
+        """
+        Adds a job for each (item, copy count) in labels to the queue, to be printed together as one document.
+        Returns the jobs.
+        """
+        jobs = [PrintJob(cushion, copy_count, mode, scanned_barcode, station) for cushion, copy_count in labels]
+        for job in jobs:
+            self.job_status_changed.emit(job, job.status)
+        with self._pending_lock:
+            self._pending_count += len(jobs)
+        self.jobs.put(jobs)
+        return jobs
+
+    def pending_count(self) -> int:
+        """Returns the number of jobs waiting to be printed."""
+        with self._pending_lock:
+            return self._pending_count
+
+    def set_status(self, job: PrintJob, status: str) -> None:
+        job.status = status
+        self.job_status_changed.emit(job, status)
+
+    def take_jobs(self) -> tuple:
+        """
+        Waits for jobs, then takes every job waiting, up to max_merged_jobs unless they were submitted together.
+        Returns the jobs and whether the worker should stop afterwards.
+        """
+        jobs = self.jobs.get()
+        if jobs is None:
+            return [], True
+        jobs = list(jobs)
+        stop = False
+        while len(jobs) < self.max_merged_jobs:
+            try:
+                more_jobs = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if more_jobs is None:
+                stop = True
+                break
+            jobs.extend(more_jobs)
+        with self._pending_lock:
+            self._pending_count -= len(jobs)
+        return jobs, stop
+
+    def run(self) -> None:
+        """Prints the queued jobs until a None job is received. Runs on the worker thread."""
+        while True:
+            jobs, stop = self.take_jobs()
+            if jobs:
+                try:
+                    self.print_jobs(jobs)
+                except Exception as error:
+                    # Any error fails the batch rather than the worker, which would leave every later job queued.
+                    for job in jobs:
+                        if job.status not in (PrintJob.DONE, PrintJob.FAILED):
+                            job.error = f"Uventet fejl: {error!r}"
+                            self.set_status(job, PrintJob.FAILED)
+            if stop:
+                return
+
+    def print_jobs(self, jobs: list) -> None:
+        """
+        Prints the jobs as one document. Jobs whose label can't be loaded fail on their own. Runs on the worker
+        thread.
+        """
+        labels = []
+        printable_jobs = []
+        for job in jobs:
+            self.set_status(job, PrintJob.SPOOLING)
+            image = None
+            if self.printers.needs_label_image:
+                with tracer.span("print.get_label", barcode=job.cushion.ean_13):
+                    image = self.labels.get_image(job.cushion.ean_13)
+                if image.isNull():
+                    job.error = f"Etiketten for {job.cushion.ean_13} kan ikke indlæses."
+                    self.set_status(job, PrintJob.FAILED)
+                    continue
+            labels.append((job.cushion, image, job.copy_count))
+            printable_jobs.append(job)
+        if not printable_jobs:
+            return
+        try:
+            with tracer.span("print.send", jobs=len(printable_jobs),
+                             copies=sum(job.copy_count for job in printable_jobs)):
+                self.printers.print_labels(labels)
+        except PrintError as error:
+            for job in printable_jobs:
+                job.error = str(error)
+                self.set_status(job, PrintJob.FAILED)
+            return
+        for job in printable_jobs:
+            self.logger.write(job.cushion, job.copy_count, job.mode, job.scanned_barcode,
+                              self.printers.target_name, time.monotonic() - job.submitted_at, job.station)
+            self.set_status(job, PrintJob.DONE)
+
+    def shutdown(self) -> None:
+        """Lets the worker finish the queued jobs, then stops it and writes the remaining log records."""
+        self.jobs.put(None)
+        self.worker.join()
+        self.logger.close()
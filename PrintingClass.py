@@ -1,74 +1,220 @@
 import json
 import sys
-from PyQt6.QtCore import QSizeF, Qt
-from PyQt6.QtGui import QPixmap, QPainter, QPageLayout, QPageSize
-from PyQt6.QtPrintSupport import QPrinter, QPrinterInfo
+from PyQt6.QtGui import QImage, QPainter
 
+from CushionClass import Cushion
+from TracerClass import tracer
 from warning_messagebox import show_warning
+from ZplPrinterClass import ZplError, ZplPrinter
+
+
+class PrintError(Exception):
+    """Raised when a print job can't be sent to the printer. The message is shown to the user."""
 
 
 class Printing:
-    def __init__(self):
-        self.available_printer_names = [printer.printerName() for printer in QPrinterInfo.availablePrinters()]
-        if len(self.available_printer_names) <= 0:
-            show_warning("Fejl", "Der er ingen printerenheder tilgængelige.\n"
-                                 "Programmet lukker nu.")
-            sys.exit(1)
+    settings_path = "Data/printer.json"
+
+    def __init__(self, detect_printers: bool = True):
+        self.available_printer_names = []
         self.selected_printer_name = None
-        self.default_printer_name = QPrinterInfo.defaultPrinter().printerName()
+        self.default_printer_name = None
+        # Set once setup() has run.
+        self.is_set_up = False
+        # The optional ZPL backend, sending labels straight to a Zebra printer instead of through the Windows driver.
+        self.zpl_settings = None
+        self.zpl_printer = None
+        # Called with a title and a message to tell the user about a problem; a message box by default.
+        self.warn = show_warning
+        if detect_printers:
+            try:
+                self.setup(*self.find_printers())
+            except PrintError as error:
+                self.warn("Fejl", str(error))
+                sys.exit(1)
+
+    @staticmethod
+    def find_printers() -> tuple:
+        """
+        Returns the names of all available printers and the name of the Windows default printer. This can take a
+        while, but doesn't use any widgets, so it can run on a worker thread.
+        """
+        # QtPrintSupport is only imported once it's needed, so that it doesn't slow down the program's start.
+        from PyQt6.QtPrintSupport import QPrinterInfo
+        available_printer_names = [printer.printerName() for printer in QPrinterInfo.availablePrinters()]
+        return available_printer_names, QPrinterInfo.defaultPrinter().printerName()
+
+    def setup(self, available_printer_names: list, default_printer_name: str) -> None:
+        """
+        Loads the printer settings and selects the printer to use among the found printers.
+        Raises PrintError if there is nothing to print on.
+        """
+        self.available_printer_names = available_printer_names
+        self.default_printer_name = default_printer_name
+        self.zpl_printer = self.load_zpl_settings()
+        if len(self.available_printer_names) <= 0 and self.zpl_printer is None:
+            raise PrintError("Der er ingen printerenheder tilgængelige.\n"
+                             "Programmet lukker nu.")
         self.load_printer_settings()
         if self.selected_printer_name not in self.available_printer_names:
             self.selected_printer_name = self.default_printer_name
+        self.is_set_up = True
+
+    def print(self, image_to_print: QImage, copy_count: int) -> None:
+        """
+        Prints the specified QImage a set number of times. Doesn't use any widgets, so it can run on a worker thread.
+        Raises PrintError if there is no printer selected or the printer can't be opened.
+        """
+        self.print_pages([(image_to_print, copy_count)])
+
+    def print_pages(self, pages) -> int:
+        """
+        Prints the pages, given as (image, copy count), as a single document: one printer session and one job in the
+        Windows print queue, however many labels it holds. Pages are drawn as they are taken from the iterable, so
+        the images don't all have to be in memory at once. Returns the number of pages printed.
+        Raises PrintError if there is no printer selected or the printer can't be opened.
+        """
+        printer_name = self.selected_printer_name
+        if printer_name is None:
+            raise PrintError("Kan ikke printe: ingen printer valgt.")
+        printer = None
+        painter = None
+        page_count = 0
+        try:
+            for image, copy_count in pages:
+                with tracer.span("print.draw_pages", copies=copy_count):
+                    for _ in range(copy_count):
+                        if painter is None:
+                            printer, painter = self.open_printer(printer_name)
+                        else:
+                            printer.newPage()
+                        painter.drawImage(0, 0, image)
+                        page_count += 1
+        except BaseException:
+            # Nothing is printed if the pages can't all be drawn, e.g. because the caller's iterable failed.
+            if printer is not None:
+                printer.abort()
+            raise
+        finally:
+            if painter is not None:
+                with tracer.span("print.spool", pages=page_count):
+                    painter.end()
+        return page_count
 
-    def print(self, image_to_print: QPixmap, copy_count: int) -> None:
-        """Prints the specified QPixmap a set number of times."""
-        printer = QPrinter()
-        if self.selected_printer_name is not None:
-            printer.setPrinterName(self.selected_printer_name)
+    @staticmethod
+    def open_printer(printer_name: str) -> tuple:
+        """Opens the printer for drawing. Returns the QPrinter and its QPainter. Raises PrintError if that fails."""
+        with tracer.span("print.open_printer", printer=printer_name):
+            from PyQt6.QtPrintSupport import QPrinter
+            printer = QPrinter()
+            printer.setPrinterName(printer_name)
             printer.setResolution(300)
-            painter = QPainter(printer)
-            for i in range(copy_count):
-                painter.drawPixmap(0, 0, image_to_print)
-                if i < copy_count - 1:
-                    printer.newPage()
-            painter.end()
-        else:
-            show_warning("Fejl", "Kan ikke printe: ingen printer valgt.")
+            painter = QPainter()
+            if not painter.begin(printer):
+                raise PrintError(f"Kan ikke printe: printeren \"{printer_name}\" kan ikke åbnes.")
+        return printer, painter
+
+    @property
+    def target_name(self) -> str:
+        """Returns the name of what labels are printed on: the ZPL target or the selected printer."""
+        if self.zpl_printer is not None:
+            return self.zpl_printer.target
+        return self.selected_printer_name
+
+    @property
+    def needs_label_image(self) -> bool:
+        """Returns True if print_label and print_labels need the decoded label images."""
+        return self.zpl_printer is None or self.zpl_printer.needs_label_image
+
+    def print_label(self, cushion: Cushion, label_image: QImage, copy_count: int) -> None:
+        """
+        Prints copy_count copies of the item's label, through the ZPL backend if one is configured and through the
+        selected printer's driver otherwise. Raises PrintError if that fails.
+        """
+        self.print_labels([(cushion, label_image, copy_count)])
+
+    def print_labels(self, labels) -> None:
+        """
+        Prints several labels, given as (item, label image, copy count), as a single document, in the same way as
+        print_label. The per-document overhead of the driver or the ZPL connection is paid only once.
+        Raises PrintError if that fails; then none of the labels can be assumed printed.
+        """
+        if self.zpl_printer is None:
+            self.print_pages((label_image, copy_count) for _, label_image, copy_count in labels)
+            return
+        try:
+            self.zpl_printer.print_batch(labels)
+        except ZplError as error:
+            raise PrintError(str(error))
 
     def save_printer_settings(self) -> None:
-        """Saves the selected printer to a file."""
+        """Saves the selected printer, and the ZPL backend settings if there are any, to a file."""
+        printer_settings = {"printer": self.selected_printer_name}
+        if self.zpl_settings is not None:
+            printer_settings["zpl"] = self.zpl_settings
         try:
-            with open("Data/printer.json", "w") as out_file:
-                json.dump({"printer": self.selected_printer_name}, out_file)
+            with open(self.settings_path, "w") as out_file:
+                json.dump(printer_settings, out_file)
         except OSError:
-            show_warning("Fejl", "Indstillingen kan i øjeblikket ikke gemmes.")
+            self.warn("Fejl", "Indstillingen kan i øjeblikket ikke gemmes.")
 
     def load_printer_settings(self) -> None:
         """
         Attempts to load the selected printer data from the file. If the file or the printer doesn't exist,
-        uses Windows default printer instead.
+        uses Windows default printer instead. Needs load_zpl_settings() to have run: a missing printer is only reported
+        if there is no ZPL printer to print on instead.
         """
         try:
-            with open("Data/printer.json", "r") as in_file:
+            with open(self.settings_path, "r") as in_file:
                 printer_settings = json.load(in_file)
                 loaded_printer_name = printer_settings.get("printer")
                 if loaded_printer_name in self.available_printer_names:
                     self.selected_printer_name = loaded_printer_name
+                elif self.zpl_printer is not None:
+                    self.select_default_printer()
                 else:
-                    show_warning("Printer fejl", "Den foretrukne printer er ikke tilgængelig.\n"
-                                                 "Skifter til Windows standardprinter.")
+                    self.warn("Printer fejl", "Den foretrukne printer er ikke tilgængelig.\n"
+                                              "Skifter til Windows standardprinter.")
                     self.select_default_printer()
         except FileNotFoundError:
             self.select_default_printer()
             self.save_printer_settings()
 
+    def load_zpl_settings(self):
+        """
+        Sets up the ZPL backend if the settings file has a "zpl" section, e.g.
+        {"target": "tcp://192.168.1.50:9100", "mode": "graphic"} or {"target": "file:label.zpl", "mode": "template"}.
+        "mode" is optional and defaults to "graphic"; "template_file" optionally points to a ZPL template, in which
+        the item fields must be preceded by ^FH, as in ZplPrinter.default_template.
+        Returns None if there is no such section.
+        """
+        try:
+            with open(self.settings_path, "r") as in_file:
+                self.zpl_settings = json.load(in_file).get("zpl")
+        except (OSError, ValueError):
+            return None
+        if self.zpl_settings is None:
+            return None
+        try:
+            template = None
+            if "template_file" in self.zpl_settings:
+                with open(self.zpl_settings["template_file"], "r", encoding="utf-8") as template_file:
+                    template = template_file.read()
+            zpl_printer = ZplPrinter(self.zpl_settings["target"], self.zpl_settings.get("mode", "graphic"), template)
+            zpl_printer.check_template()
+            return zpl_printer
+        except (OSError, KeyError, ValueError, ZplError):
+            self.warn("Printer fejl", "ZPL-indstillingerne i printer.json er ugyldige.\n"
+                                      "Printer via Windows i stedet.")
+            return None
+
     def set_selected_printer(self, printer_name: str) -> None:
         """Writes the selected printer name to the file."""
         if printer_name in self.available_printer_names:
             self.selected_printer_name = printer_name
             self.save_printer_settings()
         else:
-            show_warning("Fejl", "Den valgte printer er i øjeblikket ikke tilgængelig.\n")
+            self.warn("Fejl", "Den valgte printer er i øjeblikket ikke tilgængelig.\n")
 
     def select_default_printer(self) -> None:
         """Selects the Windows default printer."""
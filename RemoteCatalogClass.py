@@ -0,0 +1,143 @@
+from PyQt6.QtGui import QImage
+
+from BarcodeIndexClass import BarcodeIndex, Resolution
+from CatalogClientClass import CatalogClient, ServerError
+from CatalogParserClass import CatalogError
+from CushionClass import Cushion
+from ItemTableClass import ItemTable, PackedStrings
+from PreviewCacheClass import PreviewCache
+from SearchIndexClass import SearchIndex
+from TracerClass import tracer
+
+
+class RemotePreviewCache(PreviewCache):
+    """Holds label previews fetched from the catalog server, which scales them; the station never decodes a label."""
+    def __init__(self, client: CatalogClient, max_previews: int = 64, workers: int = 2):
+        super().__init__(None, max_previews, workers)
+        self.client = client
+
+    def make_preview(self, barcode: str, width: int, height: int) -> QImage:
+        with tracer.span("preview.fetch", barcode=barcode):
+            try:
+                return self.client.get_preview(barcode, width, height)
+            except ServerError:
+                # Shown as a missing label; the scans show why the server can't be used.
+                return QImage()
+
+
+class RemoteCatalog:
+    """
+    Gives the tabs the same view of the catalog as DataLoader, but takes it from a catalog server instead of the
+    catalog files, so that a station needs neither the files nor the labels. Scans are resolved by the server, with
+    its correction rules. The items and the combobox entries are copied from the server once, and again when its
+    catalog changes, so that the Manual tab searches and looks up items without asking the server.
+    """
+    def __init__(self, client: CatalogClient):
+        self.client = client
+        self.manual_file_path = "Brugervejledning.html"
+        # The server's copy of the catalog, in a column-wise table like DataLoader's.
+        self.cushions = ItemTable()
+        # The server reports the errors in its catalog files itself.
+        self.catalog_errors = []
+        self.correction_errors = []
+        self.label_template_error = None
+        self.old_number_combobox_entry_list = PackedStrings()
+        self.new_number_combobox_entry_list = PackedStrings()
+        # Only used for item lookups; the correction rules stay on the server.
+        self.index = BarcodeIndex(self.cushions, {}, {})
+        # Search indices over the combobox entries, by number type, built on the thread fetching the catalog.
+        self.search_indices = {"old": SearchIndex(self.old_number_combobox_entry_list),
+                               "new": SearchIndex(self.new_number_combobox_entry_list)}
+        self.previews = RemotePreviewCache(client)
+        # The server's catalog version that the copy was taken from.
+        self.version = None
+        self.is_loaded = False
+
+    def load(self, progress=None) -> None:
+        """
+        Copies the catalog from the server. Calls progress(message, done, total) like DataLoader.load(). Raises
+        CatalogError if the server can't be reached.
+        """
+        if progress is not None:
+            progress("Henter varedata fra serveren...", 0, 0)
+        self.apply_reload(self.prepare_reload())
+        self.is_loaded = True
+
+    def prepare_reload(self) -> dict:
+        """
+        Fetches the server's catalog. Doesn't change the copy, so it can run on a worker thread. Returns the update to
+        pass to apply_reload(). Raises CatalogError if the server can't be reached.
+        """
+        try:
+            with tracer.span("catalog.fetch"):
+                catalog = self.client.get_catalog()
+        except ServerError as error:
+            raise CatalogError(str(error))
+        with tracer.span("catalog.pack", items=len(catalog["items"])):
+            catalog["items"] = ItemTable.from_items(catalog["items"])
+            for key in ("old_number_entries", "new_number_entries"):
+                catalog[key] = PackedStrings.from_strings(catalog[key])
+        with tracer.span("catalog.index", items=len(catalog["items"])):
+            catalog["index"] = BarcodeIndex(catalog["items"], {}, {})
+        with tracer.span("catalog.search_index", items=len(catalog["items"])):
+            catalog["search_indices"] = {"old": SearchIndex(catalog["old_number_entries"]),
+                                         "new": SearchIndex(catalog["new_number_entries"])}
+        return catalog
+
+    def check_for_update(self) -> dict:
+        """
+        Returns the update from prepare_reload() if the server's catalog has changed since the copy was taken, or None
+        if it hasn't. Raises CatalogError if the server can't be reached.
+        """
+        try:
+            version = self.client.status()["version"]
+        except ServerError as error:
+            raise CatalogError(str(error))
+        return self.prepare_reload() if version != self.version else None
+
+    def apply_reload(self, update: dict) -> dict:
+        """
+        Swaps a fetched catalog in. Must run on the thread using the catalog. Returns the barcodes of the added,
+        updated and removed items, as DataLoader.reload() does; which labels changed isn't known.
+        """
+        added, updated = [], []
+        # Set for each row of the copied table whose item is still in the catalog.
+        kept_rows = bytearray(len(self.cushions))
+        for cushion in update["items"]:
+            old_row = self.index.find_row(cushion.ean_13)
+            if old_row is None:
+                added.append(cushion.ean_13)
+                continue
+            kept_rows[old_row] = 1
+            if self.cushions[old_row] != cushion:
+                updated.append(cushion.ean_13)
+        removed = [self.cushions.barcode(row) for row, kept in enumerate(kept_rows) if not kept]
+        self.cushions = update["items"]
+        self.old_number_combobox_entry_list = update["old_number_entries"]
+        self.new_number_combobox_entry_list = update["new_number_entries"]
+        self.index = update["index"]
+        self.search_indices = update["search_indices"]
+        self.version = update["version"]
+        # A label can change without its item changing, so none of the previews can be trusted.
+        self.previews.clear()
+        return {"added": added, "updated": updated, "removed": removed, "changed_labels": []}
+
+    def get_search_index(self, number_type: str) -> SearchIndex:
+        """Returns the search index over the combobox entries using either old or new item numbers."""
+        return self.search_indices["new" if number_type == "new" else "old"]
+
+    def get_item_by_barcode(self, barcode: str) -> Cushion:
+        """Returns the item with the given barcode, or None if it is unknown."""
+        return self.index.get(barcode)
+
+    def get_item_by_item_number(self, item_number: str, number_type: str = None) -> Cushion:
+        """Returns the item with the given old or new item number, as in BarcodeIndex."""
+        return self.index.get_by_item_number(item_number, number_type)
+
+    def resolve(self, barcode: str) -> Resolution:
+        """Resolves a scanned barcode on the server. Raises ServerError if the server can't be reached."""
+        return self.client.resolve(barcode)
+
+    def find_misread(self, barcode: str) -> str:
+        """Asks the server for the barcode the scan was probably misread from. Raises ServerError if that fails."""
+        return self.client.find_misread(barcode)
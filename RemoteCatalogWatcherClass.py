@@ -0,0 +1,62 @@
+import threading
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from CatalogParserClass import CatalogError
+from RemoteCatalogClass import RemoteCatalog
+
+
+class RemoteCatalogWatcher(QObject):
+    """
+    Asks the catalog server at regular intervals whether its catalog has changed, and copies it again if it has, so
+    that a station using the server sees the same edits as the server. Has the signals of CatalogWatcher. The server
+    is asked on a worker thread; only swapping in the result happens on the watcher's thread.
+    """
+    # Emitted with the dict returned by RemoteCatalog.apply_reload() after the catalog has been copied again.
+    catalog_reloaded = pyqtSignal(dict)
+    # Emitted with an error message when the server can no longer be reached; the copied catalog stays in use.
+    reload_failed = pyqtSignal(str)
+    # Emitted from the worker thread with the update from RemoteCatalog.check_for_update(), and an error message.
+    update_prepared = pyqtSignal(object, str)
+
+    def __init__(self, item_data: RemoteCatalog, interval_ms: int = 10000):
+        super().__init__()
+        self.item_data = item_data
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.check)
+        self.update_prepared.connect(self.apply_update)
+        self.worker = None
+        # Cleared while the server can't be reached, so that the problem is only reported once.
+        self.server_reachable = True
+        self.timer.start()
+
+    def check(self) -> None:
+        """Starts asking the server on a worker thread, unless the previous check is still running."""
+        if self.worker is not None:
+            return
+        self.worker = threading.Thread(target=self.prepare_update, name="catalog-check", daemon=True)
+        self.worker.start()
+
+    def prepare_update(self) -> None:
+        """Fetches the catalog if it has changed. Runs on the worker thread."""
+        try:
+            update = self.item_data.check_for_update()
+        except CatalogError as error:
+            self.update_prepared.emit(None, str(error))
+            return
+        except Exception as error:
+            self.update_prepared.emit(None, f"Varedata kunne ikke hentes fra serveren:\n{error!r}")
+            return
+        self.update_prepared.emit(update, "")
+
+    def apply_update(self, update, error_message: str) -> None:
+        """Swaps the fetched catalog in, or reports that the server can't be reached."""
+        self.worker = None
+        if error_message:
+            if self.server_reachable:
+                self.server_reachable = False
+                self.reload_failed.emit(error_message)
+            return
+        self.server_reachable = True
+        if update is not None:
+            self.catalog_reloaded.emit(self.item_data.apply_reload(update))
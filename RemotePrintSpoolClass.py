@@ -0,0 +1,110 @@
+import queue
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from CatalogClientClass import CatalogClient, ServerError
+from CushionClass import Cushion
+from PrintSpoolClass import PrintJob
+
+
+class RemotePrintSpool(QObject):
+    """
+    Sends print jobs to the catalog server's print queue instead of a printer, with the interface of PrintSpool. The
+    jobs are sent, and followed until the server has printed them, on a worker thread, so that a slow server doesn't
+    hold up scanning. The server logs the printed jobs.
+    """
+    # Emitted with the job and its new status each time the status changes, as in PrintSpool.
+    job_status_changed = pyqtSignal(object, str)
+    # Seconds between asking the server about the jobs that haven't been printed yet.
+    poll_interval = 0.2
+
+    def __init__(self, client: CatalogClient):
+        super().__init__()
+        self.client = client
+        # Lists of jobs submitted together, or None to stop the worker.
+        self.jobs = queue.Queue()
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        self.worker = threading.Thread(target=self.run, name="remote-print-spool", daemon=True)
+        self.worker.start()
+
+    def submit(self, cushion: Cushion, copy_count: int, mode: str, scanned_barcode: str = None,
+               station: str = None) -> PrintJob:
+        """Adds a job to the queue and returns it. The server is told which station sent it by the client."""
+        return self.submit_many([(cushion, copy_count)], mode, scanned_barcode)[0]
+
+    def submit_many(self, labels: list, mode: str, scanned_barcode: str = None, station: str = None) -> list:
+        """Adds a job for each (item, copy count) in labels to the queue. Returns the jobs."""
+        jobs = [PrintJob(cushion, copy_count, mode, scanned_barcode, self.client.station)
+                for cushion, copy_count in labels]
+        for job in jobs:
+            self.job_status_changed.emit(job, job.status)
+        with self._pending_lock:
+            self._pending_count += len(jobs)
+        self.jobs.put(jobs)
+        return jobs
+
+    def pending_count(self) -> int:
+        """Returns the number of jobs that haven't been printed yet."""
+        with self._pending_lock:
+            return self._pending_count
+
+    def set_status(self, job: PrintJob, status: str) -> None:
+        if status == job.status:
+            return
+        job.status = status
+        if status in (PrintJob.DONE, PrintJob.FAILED):
+            with self._pending_lock:
+                self._pending_count -= 1
+        self.job_status_changed.emit(job, status)
+
+    def send(self, job: PrintJob) -> int:
+        """Sends a job to the server. Returns the server's id for it, or None if the job failed."""
+        try:
+            server_job = self.client.submit_print(job.cushion.ean_13, job.copy_count, job.mode, job.scanned_barcode)
+        except ServerError as error:
+            job.error = str(error)
+            self.set_status(job, PrintJob.FAILED)
+            return None
+        job.error = server_job["error"]
+        self.set_status(job, server_job["status"])
+        return server_job["job_id"]
+
+    def follow(self, job: PrintJob, server_job_id: int) -> bool:
+        """Updates the job's status from the server. Returns True once the job is done or has failed."""
+        try:
+            server_job = self.client.get_job(server_job_id)
+        except ServerError as error:
+            if error.status != 404:
+                # The server may only be unreachable for a moment; the job is asked about again later.
+                return False
+            job.error = "Serveren kender ikke længere printjobbet; det er måske ikke blevet printet."
+            self.set_status(job, PrintJob.FAILED)
+            return True
+        job.error = server_job["error"]
+        self.set_status(job, server_job["status"])
+        return job.status in (PrintJob.DONE, PrintJob.FAILED)
+
+    def run(self) -> None:
+        """Sends the queued jobs until a None job is received, and follows the sent ones. Runs on the worker thread."""
+        # The jobs sent to the server and not printed yet, with the server's ids for them.
+        sent_jobs = []
+        while True:
+            try:
+                jobs = self.jobs.get(timeout=self.poll_interval if sent_jobs else None)
+            except queue.Empty:
+                jobs = []
+            if jobs is None:
+                # The server prints the sent jobs whether or not the station is still following them.
+                return
+            for job in jobs:
+                server_job_id = self.send(job)
+                if server_job_id is not None and job.status not in (PrintJob.DONE, PrintJob.FAILED):
+                    sent_jobs.append((job, server_job_id))
+            sent_jobs = [(job, server_job_id) for job, server_job_id in sent_jobs
+                         if not self.follow(job, server_job_id)]
+
+    def shutdown(self) -> None:
+        """Sends the queued jobs to the server, then stops the worker."""
+        self.jobs.put(None)
+        self.worker.join()
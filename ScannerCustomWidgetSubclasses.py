@@ -79,24 +79,14 @@ class MultipleBarcodeSelection(QDialog):
     Spawns a dialog box asking the user to identify the scanned item.
     This is necessary if several different item types have been labeled with the same barcode by mistake.
     """
-    def __init__(self, barcode_list: list, items: DataLoader, sizes: Sizes) -> None:
+    def __init__(self, candidates: list, sizes: Sizes) -> None:
         super().__init__()
         self.setWindowIcon(QIcon(".\\Data\\barcode-scan.ico"))
         # Disables the window closing "X" - the window can't be dismissed without selecting an item.
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowType.WindowCloseButtonHint)
-        self.item_data = items
-        combobox_entries = []
-        # Identifies the items' names by the supplied barcodes, then compares those names to the ones in
-        # items.new_number_combobox_entry_list; If there's a match, adds the text to this window's combobox.
-        for item_text in items.new_number_combobox_entry_list:
-            for barcode in barcode_list:
-                item = self.item_data.get_item_by_barcode(barcode)
-                # Ignores unknown barcodes - this is useful if the same wrong barcode has been used for several items.
-                # An unknown barcode will not show up in the combobox.
-                if item is None:
-                    continue
-                if item.new_number in item_text:
-                    combobox_entries.append(item_text)
+        # The possible items, looked up when the correction rules were loaded; the combobox lists them in order.
+        self.candidates = candidates
+        combobox_entries = [DataLoader.build_combobox_entry(item, "new") for item in candidates]
         self.setWindowTitle("Vælg vare")
         layout = QVBoxLayout(self)
         label = QLabel("Der er flere varer, der pga. fejl er mærket med denne stregkode.\n"
@@ -114,11 +104,8 @@ class MultipleBarcodeSelection(QDialog):
         layout.setSpacing(16)
         layout.setContentsMargins(20, 20, 20, 20)
 
-    def get_selected_item_barcode(self) -> str:
-        """Returns the barcode of the selected item."""
-        # Gets the new item number from the currently selected combobox entry.
-        item_number = self.combobox.currentText().split(" ")[0]
-        # Returns the value of .ean_13 property of the object where the .new_number property matches the selected line.
-        for item in self.item_data.cushions:
-            if item_number == item.new_number:
-                return item.ean_13
+    def get_selected_item(self) -> Cushion:
+        """Returns the selected item, or None if there is nothing to select."""
+        index = self.combobox.currentIndex()
+        if index >= 0:
+            return self.candidates[index]
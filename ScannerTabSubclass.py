@@ -1,25 +1,28 @@
+from collections import deque
 from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap
 from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout, QLineEdit, QDialog
 
 from CommonCustomWidgetSubclasses import Button, NumberInputEntryBox, LabelPreview
+from BarcodeIndexClass import Resolution
+from CatalogParserClass import is_valid_ean13
 from CushionClass import Cushion
 from DataLoaderClass import DataLoader
 from FontsSizesClass import Fonts, Sizes
 from ScannerCustomWidgetSubclasses import ItemDataDisplayBox, MultipleBarcodeSelection
-from PrintingClass import Printing
-from PrintLoggerClass import PrintLogger
-from warning_messagebox import show_warning
+from ServerErrorClass import ServerError
+from PrintSpoolClass import PrintSpool
+from TracerClass import tracer
+from warning_messagebox import ask_question, show_warning
 
 
 class ScannerTab(QWidget):
     """An interface for entering a barcode and choosing the number of labels to be printed."""
-    def __init__(self, fonts: Fonts, sizes: Sizes, item_data: DataLoader, printers: Printing):
+    def __init__(self, fonts: Fonts, sizes: Sizes, item_data: DataLoader, print_spool: PrintSpool):
         super().__init__()
         layout = QVBoxLayout(self)
         # "Scan an item" label
-        scan_prompt_label = QLabel("Scan en stregkode:")
-        scan_prompt_label.setFont(fonts.prompt)
+        self.scan_prompt_label = QLabel("Scan en stregkode:")
+        self.scan_prompt_label.setFont(fonts.prompt)
         # Scan entry box
         self.scan_entry_box = QLineEdit()
         self.scan_entry_box.setFixedSize(*sizes.scan_entry_box)
@@ -36,7 +39,7 @@ class ScannerTab(QWidget):
         # Label preview box
         self.label_preview = LabelPreview(fonts, sizes, item_data)
         # Adds the widgets to the layout
-        layout.addWidget(scan_prompt_label, alignment=Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.scan_prompt_label, alignment=Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.scan_entry_box, alignment=Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.number_input_entry_box, alignment=Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.print_button, alignment=Qt.AlignmentFlag.AlignCenter)
@@ -45,49 +48,183 @@ class ScannerTab(QWidget):
         # Item data
         self.sizes = sizes
         self.item_data = item_data
-        self.printers = printers
+        self.print_spool = print_spool
         self.scanned_item = None
+        # The barcode as scanned, which may differ from the scanned item's barcode if it has been corrected.
+        self.scanned_barcode = None
+        # Barcodes scanned while the catalog was still loading, waiting to be handled in order.
+        self.pending_scans = deque()
+        # In continuous mode, every scan is printed right away in the quantity set in the number entry box.
+        self.continuous_mode = False
+        # Scans put aside in continuous mode because their barcodes can be several items, as (barcode, candidates).
+        self.unresolved_scans = deque()
+        if not item_data.is_loaded:
+            self.scan_entry_box.setPlaceholderText("Indlæser...")
 
     def validate_and_set_barcode(self) -> None:
         """
         Checks if the barcode is valid. If yes, sets self.scanned_item to the item corresponding to the scanned barcode.
         If the scanned barcode is known to be incorrect, looks up the correct one and uses it instead.
         For items where the same barcode has been used for several items, asks the user for clarification.
+        If the barcode has a wrong check digit or is unknown, offers the known barcode it was probably misread from.
         """
         entered_barcode = self.scan_entry_box.text()
+        # Until the catalog has been loaded, scans are only queued; the box is cleared right away for the next one.
+        if not self.item_data.is_loaded:
+            if entered_barcode:
+                self.pending_scans.append(entered_barcode)
+                self.scan_entry_box.setPlaceholderText(f"Indlæser... ({len(self.pending_scans)} i kø)")
+            self.scan_entry_box.clear()
+            return
+        if self.continuous_mode:
+            self.scan_entry_box.clear()
+            self.print_scan(entered_barcode)
+            return
         if entered_barcode.isnumeric() and len(entered_barcode) == 13:
+            try:
+                # The correction rules are applied first, since a barcode printed with a wrong check digit can have
+                # one.
+                with tracer.span("scan.resolve", barcode=entered_barcode):
+                    resolution = self.item_data.resolve(entered_barcode)
+                # If the barcode is unknown, asks the user if the barcode it was probably misread from is meant.
+                # The suggestion is only used to look the item up; the barcode actually scanned is the one shown and
+                # logged, so that a misprinted label can be traced.
+                if resolution.correction == Resolution.UNKNOWN:
+                    misread_barcode = self.ask_for_misread_barcode(entered_barcode)
+                    if misread_barcode is None:
+                        return
+                    resolution = self.item_data.resolve(misread_barcode)
+            except ServerError as error:
+                # Only on a station using the catalog server.
+                show_warning("Fejl", str(error))
+                return
             # If the barcode is known to have been put on several different items, asks user for clarification.
-            if self.item_data.multiple_replacements_exist(entered_barcode):
-                self.scanned_item = self.get_item_info_from_user(entered_barcode)
-            # If the barcode is correct, uses it to identify the item.
-            elif self.item_data.item_exists(entered_barcode):
-                self.scanned_item = self.item_data.get_item_by_barcode(entered_barcode)
-            # If the barcode is known to be incorrect and only used for one item type, looks up the correct barcode.
-            elif self.item_data.barcode_must_be_replaced(entered_barcode):
-                corrected_barcode = self.item_data.get_replacement_barcode(entered_barcode)
-                self.scanned_item = self.item_data.get_item_by_barcode(corrected_barcode)
-            # If the barcode is unknown, displays an error message.
+            if resolution.correction == Resolution.MULTIPLE:
+                self.scanned_item = self.get_item_info_from_user(resolution.candidates)
+            # If the barcode is correct, or known to be incorrect and only used for one item type, uses the
+            # resolved item.
             else:
-                show_warning("Ukendt stregkode", "Stregkoden er ukendt.")
+                self.scanned_item = resolution.item
+            if self.scanned_item is None:
                 return
         else:
             show_warning("Ugyldig stregkode", "Stregkoden er ikke gyldig.")
             return
+        self.scanned_barcode = entered_barcode
         # Populates the item info box with data, displays a preview of the label and moves focus to the next widget.
-        self.item_data_display_box.load_data(self.scanned_item, entered_barcode)
+        with tracer.span("scan.show_item"):
+            self.item_data_display_box.load_data(self.scanned_item, entered_barcode)
         self.label_preview.update_image_preview(self.scanned_item.ean_13)
         self.number_input_entry_box.entry_box.setFocus()
         self.number_input_entry_box.entry_box.selectAll()
 
-    def get_item_info_from_user(self, entered_barcode: str) -> Cushion:
+    def print_scan(self, entered_barcode: str) -> None:
+        """
+        Sends a scanned item straight to the print queue, in continuous mode. Never opens a dialog, since the next
+        scan may already be arriving: problems are shown in the scan entry box, and barcodes that can be several
+        items are put aside until the user resolves them with the Print button.
+        """
+        if not (entered_barcode.isnumeric() and len(entered_barcode) == 13):
+            self.scan_entry_box.setPlaceholderText(f"Ugyldig: {entered_barcode}")
+            return
+        try:
+            with tracer.span("scan.resolve", barcode=entered_barcode):
+                resolution = self.item_data.resolve(entered_barcode)
+            if resolution.correction == Resolution.MULTIPLE:
+                self.unresolved_scans.append((entered_barcode, resolution.candidates))
+                self.update_print_button()
+                self.scan_entry_box.setPlaceholderText(f"Flere varer: {entered_barcode}")
+                return
+            if resolution.item is None:
+                problem = "Ukendt" if is_valid_ean13(entered_barcode) else "Forkert kontrolciffer"
+                self.scan_entry_box.setPlaceholderText(
+                    f"{problem}: {entered_barcode}{self.misread_hint(entered_barcode)}")
+                return
+        except ServerError:
+            # Only on a station using the catalog server.
+            self.scan_entry_box.setPlaceholderText(f"Serverfejl: {entered_barcode}")
+            return
+        self.print_spool.submit(resolution.item, self.number_input_entry_box.value, "Scanner", entered_barcode)
+        self.scan_entry_box.setPlaceholderText("")
+        self.item_data_display_box.load_data(resolution.item, entered_barcode)
+        self.label_preview.update_image_preview(resolution.item.ean_13)
+
+    def ask_for_misread_barcode(self, entered_barcode: str) -> str:
+        """
+        Looks for the known barcode that an unknown or invalid barcode was probably misread from and asks the user if
+        it is the right one. Returns it if the user says yes; otherwise returns None, after a warning if none exists.
+        """
+        if is_valid_ean13(entered_barcode):
+            title, problem = "Ukendt stregkode", "Stregkoden er ukendt."
+        else:
+            title, problem = "Ugyldig stregkode", "Stregkoden har et forkert kontrolciffer og er blevet læst forkert."
+        with tracer.span("scan.find_misread", barcode=entered_barcode):
+            misread_barcode = self.item_data.find_misread(entered_barcode)
+        if misread_barcode is None:
+            show_warning(title, problem)
+            return None
+        item = self.item_data.resolve(misread_barcode).item
+        description = misread_barcode if item is None else f"{misread_barcode} ({item.item_name}, {item.color})"
+        if ask_question(title, f"{problem}\nMente du {description}?"):
+            return misread_barcode
+        return None
+
+    def misread_hint(self, entered_barcode: str) -> str:
+        """Returns a hint about the known barcode that the barcode was probably misread from, for continuous mode."""
+        misread_barcode = self.item_data.find_misread(entered_barcode)
+        return f" (mente du {misread_barcode}?)" if misread_barcode is not None else ""
+
+    def resolve_unresolved_scans(self) -> None:
+        """Asks the user to choose the item for each scan put aside in continuous mode, and prints the chosen ones."""
+        while self.unresolved_scans:
+            entered_barcode, candidates = self.unresolved_scans.popleft()
+            item = self.get_item_info_from_user(candidates)
+            if item is not None:
+                self.print_spool.submit(item, self.number_input_entry_box.value, "Scanner", entered_barcode)
+        self.update_print_button()
+        self.scan_entry_box.setFocus()
+
+    def set_continuous_mode(self, enabled: bool) -> None:
+        """Turns continuous mode on or off."""
+        self.continuous_mode = enabled
+        self.scanned_item = None
+        self.scan_prompt_label.setText("Kontinuerlig scanning:" if enabled else "Scan en stregkode:")
+        if self.item_data.is_loaded:
+            self.scan_entry_box.setPlaceholderText("")
+        self.scan_entry_box.clear()
+        self.item_data_display_box.reset()
+        self.label_preview.reset()
+        self.update_print_button()
+        self.scan_entry_box.setFocus()
+
+    def update_print_button(self) -> None:
+        """In continuous mode, the Print button shows how many scans wait to be resolved."""
+        if self.continuous_mode:
+            self.print_button.setText(f"Afklar ({len(self.unresolved_scans)})")
+            self.print_button.setEnabled(len(self.unresolved_scans) > 0)
+        else:
+            self.print_button.setText("Print")
+            self.print_button.setEnabled(True)
+
+    def get_item_info_from_user(self, candidates: list) -> Cushion:
         """Spawns a dialog box asking the user to select the correct item from a list."""
-        item_selection_dialog = MultipleBarcodeSelection(
-            self.item_data.multiple_choice_replacements[entered_barcode],
-            self.item_data,
-            self.sizes)
-        if item_selection_dialog.exec() == QDialog.DialogCode.Accepted:
-            corrected_barcode = item_selection_dialog.get_selected_item_barcode()
-            return self.item_data.get_item_by_barcode(corrected_barcode)
+        with tracer.span("scan.selection_dialog.build", candidates=len(candidates)):
+            item_selection_dialog = MultipleBarcodeSelection(candidates, self.sizes)
+        with tracer.span("scan.selection_dialog.wait_for_user"):
+            dialog_result = item_selection_dialog.exec()
+        if dialog_result == QDialog.DialogCode.Accepted:
+            return item_selection_dialog.get_selected_item()
+
+    def on_catalog_loaded(self) -> None:
+        """Starts handling the barcodes that were scanned while the catalog was loading."""
+        self.scan_entry_box.setPlaceholderText("")
+        self.process_pending_scans()
+
+    def process_pending_scans(self) -> None:
+        """Handles the next waiting scan, unless an item is already waiting to be printed."""
+        while self.pending_scans and self.scanned_item is None:
+            self.scan_entry_box.setText(self.pending_scans.popleft())
+            self.validate_and_set_barcode()
 
     def clear_and_reset(self) -> None:
         """Clears all data and resets the tab in preparation for new input."""
@@ -96,15 +233,18 @@ class ScannerTab(QWidget):
         self.item_data_display_box.reset()
         self.label_preview.reset()
         self.scan_entry_box.setFocus()
+        self.process_pending_scans()
 
     def print(self) -> None:
-        """Prints the scanned item."""
+        """Sends the scanned item to the print queue; the tab is ready for the next scan right away."""
+        if self.continuous_mode:
+            self.resolve_unresolved_scans()
+            return
         copy_count = self.number_input_entry_box.value
         if self.scanned_item is not None:
-            image_to_print = QPixmap(f"Data/PNG/{self.scanned_item.ean_13}.png")
-            self.printers.print(image_to_print, copy_count)
+            self.print_spool.submit(self.scanned_item, copy_count, "Scanner", self.scanned_barcode)
+            self.scanned_item = None
             self.clear_and_reset()
-            PrintLogger.write_to_log_file(self.scanned_item, copy_count, "Scanner")
         else:
             show_warning("Fejl", "Du skal scanne en vare, før du printer.")
             self.scan_entry_box.clear()
@@ -0,0 +1,105 @@
+import re
+from array import array
+
+from ItemTableClass import PackedStrings, prefix_columns, prefixed_columns
+
+
+class SearchIndex:
+    """
+    A token/prefix index over a list of combobox entries. A search returns the positions of the entries where every
+    search word is the beginning of one of the entry's words. Entry words are split on spaces, and item numbers
+    like "005-812094/1009000" also on the punctuation inside them, so both "005-81" and "1009" match.
+    When a search only extends the previous one, the previous result is narrowed instead of searching everything.
+    The index is kept in flat arrays: every distinct word, sorted, and the positions of the entries containing each
+    word, laid out in the same order, so that all the positions for a prefix form one contiguous slice.
+    """
+    sub_token_separators = re.compile(r"[^0-9a-zæøå]+")
+
+    def __init__(self, entries):
+        self.entries = entries
+        token_positions = {}
+        for position, entry in enumerate(entries):
+            for token in self.tokenize(entry):
+                token_positions.setdefault(token, []).append(position)
+        self.sorted_tokens = PackedStrings.from_strings(sorted(token_positions))
+        # The positions of the entries containing sorted_tokens[i] are positions[starts[i]:starts[i + 1]].
+        self.starts = array("I", [0])
+        self.positions = array("I")
+        for token in self.sorted_tokens:
+            self.positions.extend(token_positions.pop(token))
+            self.starts.append(len(self.positions))
+        self.last_query = None
+        self.last_result = None
+
+    @classmethod
+    def from_columns(cls, entries, columns: dict) -> "SearchIndex":
+        """Returns the index over the entries stored by columns(), without tokenizing the entries again."""
+        index = cls.__new__(cls)
+        index.entries = entries
+        index.sorted_tokens = PackedStrings.from_columns(prefixed_columns(columns, "tokens"))
+        index.starts = columns["starts"]
+        index.positions = columns["positions"]
+        index.last_query = None
+        index.last_result = None
+        return index
+
+    def columns(self) -> dict:
+        """Returns the arrays of the index, by name, for storing it in a catalog snapshot."""
+        columns = prefix_columns(self.sorted_tokens.columns(), "tokens")
+        columns.update(starts=self.starts, positions=self.positions)
+        return columns
+
+    @classmethod
+    def tokenize(cls, entry: str) -> frozenset:
+        """Returns the lowercase words of an entry, including the parts of words containing punctuation."""
+        tokens = set()
+        for word in entry.lower().split():
+            tokens.add(word)
+            tokens.update(part for part in cls.sub_token_separators.split(word) if part)
+        return frozenset(tokens)
+
+    def find_token(self, prefix: str) -> int:
+        """Returns the position in sorted_tokens of the first word that isn't less than the prefix."""
+        low, high = 0, len(self.sorted_tokens)
+        while low < high:
+            middle = (low + high) // 2
+            if self.sorted_tokens[middle] < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def positions_for_prefix(self, prefix: str) -> set:
+        """Returns the positions of all the entries with a word starting with the prefix."""
+        # The words starting with the prefix are those from the prefix up to the prefix with its last letter raised.
+        first = self.find_token(prefix)
+        end = self.find_token(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        return set(self.positions[self.starts[first]:self.starts[end]])
+
+    def matching_positions(self, words: list) -> set:
+        """Returns the positions of the entries where every word is the beginning of one of the entry's words."""
+        matches = None
+        # Longer words usually match fewer entries, so the intersection shrinks fastest starting with them.
+        for word in sorted(set(words), key=len, reverse=True):
+            positions = self.positions_for_prefix(word)
+            matches = positions if matches is None else matches & positions
+            if not matches:
+                break
+        return matches
+
+    def search(self, query: str) -> list:
+        """Returns the positions, in ascending order, of the entries matching all the words of the query."""
+        query = query.lower()
+        words = query.split()
+        if not words:
+            result = list(range(len(self.entries)))
+        elif self.last_query and self.last_query.split() and query.startswith(self.last_query):
+            # Extending the query can only lengthen its last word or add new words, so only the entries
+            # matching the previous query need to be checked, and only against the words that changed.
+            matches = self.matching_positions(words[len(self.last_query.split()) - 1:])
+            result = [position for position in self.last_result if position in matches]
+        else:
+            result = sorted(self.matching_positions(words))
+        self.last_query = query
+        self.last_result = result
+        return result
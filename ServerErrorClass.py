@@ -0,0 +1,9 @@
+class ServerError(Exception):
+    """
+    Raised when the catalog server can't be reached or answers with an error. The message is shown to the user. Kept
+    apart from CatalogClient, so that the tabs can catch it without importing the HTTP client on every station.
+    """
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        # The HTTP status of the error response, or None if the server couldn't be reached.
+        self.status = status
@@ -0,0 +1,49 @@
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from DataLoaderClass import CatalogError, DataLoader
+from PrintingClass import Printing
+from TracerClass import tracer
+
+
+class StartupLoader(QObject):
+    """
+    Loads the catalog, prepares the labels and finds the available printers on a worker thread, so that the main
+    window can be shown right away. Reports its progress and the results through signals, handled in the GUI thread.
+    """
+    # Emitted with a message, the number of steps done and the total number of steps (0 if unknown).
+    progress = pyqtSignal(str, int, int)
+    # Emitted with the printer names and the default printer name once everything has been loaded.
+    loaded = pyqtSignal(list, str)
+    # Emitted with an error message if the catalog, the labels or the printers can't be loaded.
+    failed = pyqtSignal(str)
+
+    def __init__(self, item_data: DataLoader, find_printers: bool = True):
+        super().__init__()
+        self.item_data = item_data
+        # A station printing through the catalog server doesn't use its own printers.
+        self.find_printers = find_printers
+        self.worker = threading.Thread(target=self.run, name="startup-loader", daemon=True)
+
+    def start(self) -> None:
+        self.worker.start()
+
+    def run(self) -> None:
+        """Does the loading. Runs on the worker thread."""
+        try:
+            with tracer.span("startup.load_catalog"):
+                self.item_data.load(self.progress.emit)
+            available_printer_names, default_printer_name = [], ""
+            if self.find_printers:
+                self.progress.emit("Finder printere...", 0, 0)
+                with tracer.span("startup.find_printers"):
+                    available_printer_names, default_printer_name = Printing.find_printers()
+        except CatalogError as error:
+            self.failed.emit(str(error))
+            return
+        except Exception as error:
+            # Anything else, e.g. an unreadable label archive, must also end the loading, or the window would be
+            # left waiting forever.
+            self.failed.emit(f"Programmet kunne ikke indlæse sine data:\n{error!r}")
+            return
+        self.loaded.emit(available_printer_names, default_printer_name)
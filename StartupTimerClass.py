@@ -0,0 +1,141 @@
+import json
+import sys
+import threading
+import time
+from importlib.abc import MetaPathFinder
+
+
+class ImportTimer(MetaPathFinder):
+    """
+    Measures how long each module takes to import, by wrapping the loaders found by the other import finders.
+    Records both the total time and the time spent in the module itself, not counting the modules it imports.
+    """
+    def __init__(self):
+        # Module names as keys; (total seconds, own seconds) as values, in the order the imports finished.
+        self.import_times = {}
+        # Per thread, the time spent in nested imports of each module being imported.
+        self._local = threading.local()
+        self._finding = set()
+
+    def find_spec(self, name, path, target=None):
+        # Asks the other finders for the module; guards against being asked again while they search.
+        if name in self._finding:
+            return None
+        self._finding.add(name)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.discard(name)
+        loader = spec.loader
+        # Built-in and frozen modules are imported by classes shared by all such modules; they are left alone.
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+        original_create_module = getattr(loader, "create_module", None)
+        original_exec_module = loader.exec_module
+        stack = self._local.__dict__.setdefault("stack", [])
+        start = None
+
+        # Extension modules do their work when they are created, so the time is measured from creation to execution.
+        def timed_create_module(module_spec):
+            nonlocal start
+            stack.append(0.0)
+            start = time.perf_counter()
+            return original_create_module(module_spec)
+
+        def timed_exec_module(module):
+            nonlocal start
+            if start is None:
+                stack.append(0.0)
+                start = time.perf_counter()
+            try:
+                original_exec_module(module)
+            finally:
+                total = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += total
+                self.import_times[name] = (total, total - children)
+                # Loaders can be shared between modules, so the loader's own methods are put back.
+                for method_name in ("create_module", "exec_module"):
+                    try:
+                        delattr(loader, method_name)
+                    except AttributeError:
+                        pass
+
+        try:
+            if original_create_module is not None:
+                loader.create_module = timed_create_module
+            loader.exec_module = timed_exec_module
+        except AttributeError:
+            pass
+        return spec
+
+
+class StartupTimer:
+    """
+    Measures the program's start: how long each module takes to import and how long it takes until the main window
+    is on screen. The report is written to Data/startup.json on every start and can be checked against a budget.
+    """
+    report_path = "Data/startup.json"
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # (name, seconds since start) for each step of the startup, in order.
+        self.marks = []
+        self.import_timer = None
+
+    def install_import_hook(self) -> None:
+        """Starts measuring imports. Only imports done after this are measured."""
+        if self.import_timer is None:
+            self.import_timer = ImportTimer()
+            sys.meta_path.insert(0, self.import_timer)
+
+    def remove_import_hook(self) -> None:
+        if self.import_timer is not None and self.import_timer in sys.meta_path:
+            sys.meta_path.remove(self.import_timer)
+
+    def mark(self, name: str) -> None:
+        """Records that a step of the startup has been reached."""
+        self.marks.append((name, time.perf_counter() - self.start))
+
+    def elapsed(self, name: str) -> float:
+        """Returns the time from the start to the given mark, or None if it hasn't been reached."""
+        for mark_name, seconds in self.marks:
+            if mark_name == name:
+                return seconds
+        return None
+
+    def slowest_imports(self, count: int = 15) -> list:
+        """Returns the modules that took the longest to import by themselves, as (name, total, own) tuples."""
+        if self.import_timer is None:
+            return []
+        import_times = [(name, total, own) for name, (total, own) in self.import_timer.import_times.items()]
+        return sorted(import_times, key=lambda import_time: import_time[2], reverse=True)[:count]
+
+    def report(self) -> str:
+        """Returns a readable summary of the startup."""
+        lines = [f"{name}: {seconds * 1000:.0f} ms" for name, seconds in self.marks]
+        lines.append("Slowest imports (own / total):")
+        lines += [f"  {name}: {own * 1000:.1f} / {total * 1000:.1f} ms" for name, total, own in self.slowest_imports()]
+        return "\n".join(lines)
+
+    def save(self, path: str = None) -> None:
+        """Writes the marks and the import times of all modules to a JSON file."""
+        import_times = self.import_timer.import_times if self.import_timer is not None else {}
+        with open(path or self.report_path, "w", encoding="utf-8") as out_file:
+            json.dump({
+                "marks": {name: round(seconds * 1000, 1) for name, seconds in self.marks},
+                "imports": {name: {"total_ms": round(total * 1000, 2), "own_ms": round(own * 1000, 2)}
+                            for name, (total, own) in import_times.items()}
+            }, out_file, indent=1)
+
+
+# Created when this module is first imported, which main.py does before anything else.
+startup_timer = StartupTimer()
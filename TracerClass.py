@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+
+class Tracer:
+    """
+    Records timed spans of the scan and print path, for finding out where the time goes on a slow station.
+    Tracing is off unless the HYNDESCANNER_TRACE environment variable is set or it's turned on in the menu; while
+    off, a span costs only a method call. The spans are saved in the Chrome trace format, which can be opened in
+    chrome://tracing or ui.perfetto.dev. The GUI thread can also be profiled with cProfile on demand.
+    """
+    trace_folder = "Data"
+
+    def __init__(self, max_events: int = 200_000):
+        self.enabled = bool(os.environ.get("HYNDESCANNER_TRACE"))
+        self.max_events = max_events
+        self.events = []
+        self.profiler = None
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def span(self, name: str, **details):
+        """Returns a context manager that records the time spent inside it, with optional details."""
+        if not self.enabled:
+            return nullcontext()
+        return self._record(name, details)
+
+    @contextmanager
+    def _record(self, name: str, details: dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - self._start) * 1_000_000,
+                "dur": (end - start) * 1_000_000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {key: str(value) for key, value in details.items()}
+            }
+            with self._lock:
+                if len(self.events) < self.max_events:
+                    self.events.append(event)
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+    def save(self, path: str = None) -> str:
+        """Writes the recorded spans to a trace file, by default Data/trace-<date>-<time>.json. Returns its path."""
+        if path is None:
+            path = os.path.join(self.trace_folder, f"trace-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with self._lock:
+            events = list(self.events)
+        thread_names = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident, "args": {"name": thread.name}}
+            for thread in threading.enumerate()
+        ]
+        with open(path, "w", encoding="utf-8") as out_file:
+            json.dump({"traceEvents": thread_names + events, "displayTimeUnit": "ms"}, out_file)
+        return path
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events = []
+
+    @property
+    def is_profiling(self) -> bool:
+        return self.profiler is not None
+
+    def start_profiling(self) -> None:
+        """Starts profiling the calling thread (normally the GUI thread)."""
+        if self.profiler is None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profiling(self, path: str = None) -> str:
+        """
+        Stops profiling and writes the statistics to a file, by default Data/profile-<date>-<time>.prof, which can
+        be read with pstats or snakeviz. Returns its path.
+        """
+        if path is None:
+            path = os.path.join(self.trace_folder, f"profile-{datetime.now():%Y%m%d-%H%M%S}.prof")
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        profiler.dump_stats(path)
+        return path
+
+
+# Shared by all modules, so that spans from every part of the program end up in the same trace.
+tracer = Tracer()
@@ -0,0 +1,251 @@
+import socket
+import threading
+from collections import OrderedDict
+from PyQt6.QtGui import QImage, qGray
+
+from CushionClass import Cushion
+from TracerClass import tracer
+
+
+class ZplError(Exception):
+    """Raised when a ZPL document can't be delivered to its target."""
+
+
+class TcpSink:
+    """Sends ZPL documents to a printer's raw TCP port (normally 9100)."""
+    def __init__(self, host: str, port: int = 9100, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, document: bytes) -> None:
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout) as connection:
+                connection.sendall(document)
+        except OSError as error:
+            raise ZplError(f"Kan ikke sende til {self.host}:{self.port}: {error}")
+
+
+class FileSink:
+    """Writes ZPL documents to a file, e.g. a shared printer port or a file for inspection."""
+    def __init__(self, path: str, append: bool = True):
+        self.path = path
+        self.append = append
+
+    def send(self, document: bytes) -> None:
+        try:
+            with open(self.path, "ab" if self.append else "wb") as out_file:
+                out_file.write(document)
+        except OSError as error:
+            raise ZplError(f"Kan ikke skrive til {self.path}: {error}")
+
+
+def escape_field_data(value: str) -> str:
+    """
+    Escapes a value for a ^FD field preceded by ^FH, so that a ^ or ~ in e.g. an item name isn't taken as a command.
+    ^FH makes _ followed by two hex digits stand for that character, so _ itself is escaped as well.
+    """
+    return value.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+
+
+def open_sink(target: str):
+    """Creates a sink from a target string: "tcp://host:port" or "file:path"."""
+    if target.startswith("tcp://"):
+        host, _, port = target[len("tcp://"):].partition(":")
+        return TcpSink(host, int(port) if port else 9100)
+    if target.startswith("file:"):
+        return FileSink(target[len("file:"):])
+    raise ValueError(f"Unknown ZPL target: {target}")
+
+
+def compress_hex_row(row: str) -> str:
+    """
+    Compresses one row of a ZPL graphic with ZPL's ASCII run-length encoding: repeated characters are preceded by
+    a count (G-Y for 1-19, g-z for multiples of 20), a row of trailing zeros ends with "," and trailing ones with "!".
+    """
+    if row.rstrip("0") == "":
+        return ","
+    output = []
+    stripped = row.rstrip("0")
+    if len(stripped) < len(row):
+        row, ending = stripped, ","
+    elif row.rstrip("F") != row:
+        row, ending = row.rstrip("F"), "!"
+    else:
+        ending = ""
+    i = 0
+    while i < len(row):
+        char = row[i]
+        run_end = i
+        while run_end < len(row) and row[run_end] == char:
+            run_end += 1
+        count = run_end - i
+        if count > 1:
+            while count >= 20:
+                twenties = min(count // 20, 20)
+                output.append(chr(ord("g") + twenties - 1))
+                count -= twenties * 20
+            if count > 0:
+                output.append(chr(ord("G") + count - 1))
+        output.append(char)
+        i = run_end
+    output.append(ending)
+    return "".join(output)
+
+
+def image_to_graphic_field(image: QImage) -> str:
+    """Converts a label image into a compressed ZPL ^GFA graphic field, black pixels printed."""
+    mono = image.convertToFormat(QImage.Format.Format_Mono)
+    width, height = mono.width(), mono.height()
+    bytes_per_row = (width + 7) // 8
+    # In Format_Mono, each bit is an index into the color table; ZPL expects 1 for black, so the bits are inverted
+    # if index 1 is the light color.
+    invert = qGray(mono.color(1)) > 127
+    data = mono.constBits().asstring(mono.sizeInBytes())
+    stride = mono.bytesPerLine()
+    # Masks out the padding bits beyond the image width in the last byte of each row.
+    padding_mask = (0xFF << (bytes_per_row * 8 - width)) & 0xFF
+    rows = []
+    previous_row = None
+    for y in range(height):
+        row_bytes = bytearray(data[y * stride:y * stride + bytes_per_row])
+        if invert:
+            row_bytes = bytearray(byte ^ 0xFF for byte in row_bytes)
+        row_bytes[-1] &= padding_mask
+        row = row_bytes.hex().upper()
+        rows.append(":" if row == previous_row else compress_hex_row(row))
+        previous_row = row
+    total_bytes = bytes_per_row * height
+    return f"^GFA,{total_bytes},{total_bytes},{bytes_per_row},{''.join(rows)}"
+
+
+class ZplPrinter:
+    """
+    Prints labels on Zebra printers by sending ZPL directly, bypassing the Windows driver. In "graphic" mode the label
+    image is sent as a compressed ZPL graphic, which is encoded once per label and cached; in "template" mode the
+    label is composed by the printer from the item's fields and an EAN-13 barcode. The copy count is sent as ^PQ,
+    so any number of copies is a single small document.
+    """
+    # The item's fields are escaped for ^FH, so every field holding one of them must be preceded by ^FH.
+    default_template = (
+        "^XA^CI28"
+        "^FO40,30^A0N,40,40^FB1100,2,0,L^FH^FD{item_name}^FS"
+        "^FO40,130^A0N,34,34^FH^FD{color}^FS"
+        "^FO40,190^A0N,30,30^FH^FD{old_number}^FS"
+        "^FO40,230^A0N,30,30^FH^FD{new_number}^FS"
+        "^FO40,290^BY3^BEN,150,Y,N^FD{ean_12}^FS"
+        "^PQ{copy_count}^XZ"
+    )
+
+    def __init__(self, target: str, mode: str = "graphic", template: str = None, max_graphics: int = 256):
+        self.target = target
+        self.sink = open_sink(target)
+        self.mode = mode
+        self.template = template if template is not None else self.default_template
+        # Encoded ^GFA graphic fields by barcode, from least to most recently used, as in LabelCache.
+        self.max_graphics = max_graphics
+        self.graphics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fill_template(self, item_name: str, color: str, old_number: str, new_number: str, ean_13: str,
+                      copy_count: int) -> str:
+        """Fills in the template's fields. Raises ZplError if the template has unknown or malformed fields."""
+        try:
+            return self.template.format(
+                item_name=escape_field_data(item_name),
+                color=escape_field_data(color),
+                old_number=escape_field_data(old_number),
+                new_number=escape_field_data(new_number),
+                # ^BE calculates the check digit itself.
+                ean_12=ean_13[:12],
+                copy_count=copy_count)
+        except (KeyError, IndexError, ValueError, AttributeError) as error:
+            raise ZplError(f"ZPL-skabelonen er ugyldig: {error!r}")
+
+    def check_template(self) -> None:
+        """Fills in the template with sample values, so that a bad template is found before anything is printed."""
+        if self.mode == "template":
+            self.fill_template("Item", "Color", "Old number", "New number", "5710441350415", 1)
+
+    @property
+    def needs_label_image(self) -> bool:
+        """Returns True if the label image is needed to print, i.e. in graphic mode."""
+        return self.mode == "graphic"
+
+    def graphic_field(self, barcode: str, label_image: QImage) -> str:
+        """Returns the ZPL graphic field for the label, encoding it only the first time."""
+        with self._lock:
+            graphic = self.graphics.get(barcode)
+            if graphic is not None:
+                self.graphics.move_to_end(barcode)
+        if graphic is None:
+            graphic = image_to_graphic_field(label_image)
+            with self._lock:
+                self.graphics[barcode] = graphic
+                while len(self.graphics) > self.max_graphics:
+                    self.graphics.popitem(last=False)
+        return graphic
+
+    def invalidate(self, barcode: str) -> None:
+        """Drops the cached graphic for a label that has changed."""
+        with self._lock:
+            self.graphics.pop(barcode, None)
+
+    def build_document(self, cushion: Cushion, label_image: QImage, copy_count: int) -> bytes:
+        """Builds the ZPL document printing copy_count copies of the item's label."""
+        if self.mode == "template":
+            document = self.fill_template(cushion.item_name, cushion.color, cushion.old_number, cushion.new_number,
+                                          cushion.ean_13, copy_count)
+        else:
+            graphic = self.graphic_field(cushion.ean_13, label_image)
+            document = f"^XA^FO0,0{graphic}^FS^PQ{copy_count}^XZ"
+        return document.encode("utf-8")
+
+    def build_batch_document(self, labels) -> bytes:
+        """
+        Builds one ZPL document printing all the labels, given as (item, label image, copy count), in order. In
+        graphic mode, a label that occurs more than once is sent once, stored in the printer's memory and recalled for
+        each occurrence; the stored graphics are deleted again at the end of the document.
+        """
+        if self.mode == "template":
+            return b"".join(self.build_document(cushion, label_image, copy_count)
+                            for cushion, label_image, copy_count in labels)
+        # Only the encoded graphics are kept, so that the label images can be freed as the labels are gone through.
+        entries = [(cushion.ean_13, self.graphic_field(cushion.ean_13, label_image), copy_count)
+                   for cushion, label_image, copy_count in labels]
+        occurrences = {}
+        for barcode, _, _ in entries:
+            occurrences[barcode] = occurrences.get(barcode, 0) + 1
+        # Barcodes of the repeated labels as keys; the name they are stored under in the printer as values.
+        stored_names = {}
+        parts = []
+        for barcode, graphic, copy_count in entries:
+            if occurrences[barcode] == 1:
+                parts.append(f"^XA^FO0,0{graphic}^FS^PQ{copy_count}^XZ")
+                continue
+            name = stored_names.get(barcode)
+            if name is None:
+                name = f"R:L{len(stored_names) + 1}.GRF"
+                stored_names[barcode] = name
+                # ~DG takes the same data as ^GFA, without the format and the repeated byte count.
+                _, total_bytes, _, bytes_per_row, data = graphic.split(",", 4)
+                parts.append(f"~DG{name},{total_bytes},{bytes_per_row},{data}")
+            parts.append(f"^XA^FO0,0^XG{name},1,1^FS^PQ{copy_count}^XZ")
+        parts.extend(f"^XA^ID{name}^FS^XZ" for name in stored_names.values())
+        return "".join(parts).encode("utf-8")
+
+    def print(self, cushion: Cushion, label_image: QImage, copy_count: int) -> None:
+        """Sends copy_count copies of the item's label to the printer. Raises ZplError if that fails."""
+        self.print_batch([(cushion, label_image, copy_count)])
+
+    def print_batch(self, labels) -> None:
+        """
+        Sends the labels, given as (item, label image, copy count), to the printer as a single document. Raises
+        ZplError if that fails.
+        """
+        with tracer.span("print.zpl.build", mode=self.mode):
+            document = self.build_batch_document(labels)
+        if not document:
+            return
+        with tracer.span("print.zpl.send", bytes=len(document)):
+            self.sink.send(document)
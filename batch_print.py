@@ -0,0 +1,230 @@
+import argparse
+import csv
+import multiprocessing
+import sys
+import time
+from PyQt6.QtWidgets import QApplication
+
+from BarcodeIndexClass import Resolution
+from CatalogClientClass import CatalogClient, ServerError
+from DataLoaderClass import CatalogError, DataLoader
+from PrintingClass import Printing, PrintError
+from PrintLoggerClass import PrintLogger
+from PrintSpoolClass import PrintJob
+
+
+def read_pick_list(path: str, barcode_column: str, quantity_column: str):
+    """
+    Reads a semicolon-separated pick list, line by line. Yields (line number, barcode, quantity), with None as the
+    quantity if it isn't a positive whole number.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as pick_list_file:
+        reader = csv.DictReader(pick_list_file, delimiter=";")
+        missing_columns = {barcode_column, quantity_column} - set(reader.fieldnames or [])
+        if missing_columns:
+            raise ValueError(f"missing column(s): {', '.join(sorted(missing_columns))}")
+        for row in reader:
+            barcode = (row[barcode_column] or "").strip()
+            if not barcode:
+                continue
+            quantity = (row[quantity_column] or "").strip()
+            yield reader.line_num, barcode, int(quantity) if quantity.isdigit() and int(quantity) > 0 else None
+
+
+def write_multiple_choice_list(path: str, lines: list) -> None:
+    """Writes the lines whose barcodes can be several items to a file, with the possible items, to be resolved later."""
+    with open(path, "w", encoding="utf-8-sig", newline="") as out_file:
+        writer = csv.writer(out_file, delimiter=";")
+        writer.writerow(["Linje", "Stregkode", "Stk", "Mulige varer"])
+        for line_number, barcode, quantity, candidates in lines:
+            writer.writerow([line_number, barcode, quantity, " | ".join(
+                f"{item.ean_13} {item.new_number} {item.item_name}, {item.color}" for item in candidates)])
+
+
+def print_progress(done: int, total: int, labels: int, elapsed_time: float) -> None:
+    """Prints a one-line progress report, overwriting the previous one."""
+    rate = labels / elapsed_time if elapsed_time > 0 else 0
+    sys.stdout.write(f"\r{done}/{total} jobs, {labels} labels, {rate:.1f} labels/s")
+    sys.stdout.flush()
+
+
+def print_summary(printed_labels: int, jobs: list, failed_jobs: list, elapsed_time: float) -> None:
+    """Prints the throughput and the failed jobs, after printing."""
+    print()
+    print(f"Printed {printed_labels} label(s) in {len(jobs) - len(failed_jobs)} job(s) in {elapsed_time:.1f} s "
+          f"({printed_labels / elapsed_time if elapsed_time > 0 else 0:.1f} labels/s, "
+          f"{elapsed_time * 1000 / max(len(jobs), 1):.0f} ms per job).")
+    for cushion, quantity, error in failed_jobs:
+        print(f"Failed: {quantity} x {cushion.ean_13} {cushion.new_number}: {error}")
+
+
+def print_through_server(client: CatalogClient, jobs: list) -> int:
+    """Sends the jobs to the catalog server's print queue, then waits for them to be printed. Returns the exit code."""
+    start_time = time.perf_counter()
+    try:
+        submitted_jobs = [(cushion, quantity, client.submit_print(cushion.ean_13, quantity, "Batch", scanned_barcode))
+                          for cushion, quantity, scanned_barcode in jobs]
+        failed_jobs = []
+        printed_labels = 0
+        for i, (cushion, quantity, job) in enumerate(submitted_jobs):
+            while job["status"] in (PrintJob.QUEUED, PrintJob.SPOOLING):
+                time.sleep(0.1)
+                job = client.get_job(job["job_id"])
+            if job["status"] == PrintJob.FAILED:
+                failed_jobs.append((cushion, quantity, job["error"]))
+            else:
+                printed_labels += quantity
+            print_progress(i + 1, len(jobs), printed_labels, time.perf_counter() - start_time)
+    except ServerError as error:
+        print()
+        print(error)
+        return 1
+    print_summary(printed_labels, jobs, failed_jobs, time.perf_counter() - start_time)
+    return 1 if failed_jobs else 0
+
+
+def main():
+    # Needed for the label rendering worker processes if the program is frozen into an executable.
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Prints the labels for every line of a pick list.")
+    parser.add_argument("pick_list", help="semicolon-separated file with a barcode and a quantity column")
+    parser.add_argument("--barcode-column", default="stregkode")
+    parser.add_argument("--quantity-column", default="stk")
+    parser.add_argument("--printer", help="printer name (default: the printer selected in the program)")
+    parser.add_argument("--multiple-choice-output", default=None,
+                        help="where to write the lines whose barcodes can be several items "
+                             "(default: <pick list>-flere.csv)")
+    parser.add_argument("--skip-unknown", action="store_true",
+                        help="print the known lines even if some barcodes are unknown")
+    parser.add_argument("--dry-run", action="store_true", help="resolve the lines, but don't print")
+    parser.add_argument("--server", help="resolve and print through a catalog server instead of loading the catalog, "
+                                         "e.g. http://127.0.0.1:8765")
+    args = parser.parse_args()
+    if args.server is not None and args.printer is not None:
+        parser.error("--printer can't be used with --server; the server prints on its own printer")
+
+    # Qt needs an application object for printing and for the message boxes of the shared classes; no window is shown.
+    app = QApplication([])
+    if args.server is not None:
+        item_data = CatalogClient(args.server)
+        try:
+            print(f"Using the catalog server at {args.server} ({item_data.status()['items']} items).")
+        except ServerError as error:
+            print(error)
+            return 1
+    else:
+        item_data = DataLoader("Data/HyndeData.txt", "Data/Rettelser.txt", load_now=False)
+        try:
+            item_data.load()
+        except CatalogError as error:
+            print(f"Failed to load the catalog: {error}")
+            return 1
+        if item_data.catalog_errors:
+            print(f"{len(item_data.catalog_errors)} invalid lines in the catalog were skipped:")
+            print(item_data.catalog_error_report())
+
+    jobs = []
+    unknown_lines = []
+    invalid_lines = []
+    multiple_choice_lines = []
+    try:
+        for line_number, barcode, quantity in read_pick_list(args.pick_list, args.barcode_column,
+                                                             args.quantity_column):
+            resolution = item_data.resolve(barcode)
+            if resolution.correction == Resolution.UNKNOWN:
+                unknown_lines.append((line_number, barcode))
+            elif quantity is None:
+                invalid_lines.append((line_number, barcode))
+            elif resolution.correction == Resolution.MULTIPLE:
+                multiple_choice_lines.append((line_number, barcode, quantity, resolution.candidates))
+            else:
+                jobs.append((resolution.item, quantity, barcode))
+    except (OSError, ValueError) as error:
+        print(f"Failed to read {args.pick_list}: {error}")
+        return 1
+    except ServerError as error:
+        print(error)
+        return 1
+
+    total_labels = sum(quantity for _, quantity, _ in jobs)
+    print(f"{len(jobs)} line(s) to print, {total_labels} label(s).")
+    for line_number, barcode in unknown_lines:
+        print(f"Unknown barcode on line {line_number}: {barcode}")
+    for line_number, barcode in invalid_lines:
+        print(f"Invalid quantity on line {line_number}: {barcode}")
+    if multiple_choice_lines:
+        multiple_choice_output = args.multiple_choice_output
+        if multiple_choice_output is None:
+            multiple_choice_output = args.pick_list.rsplit(".", 1)[0] + "-flere.csv"
+        write_multiple_choice_list(multiple_choice_output, multiple_choice_lines)
+        print(f"{len(multiple_choice_lines)} line(s) can be several items; written to {multiple_choice_output}.")
+    if (unknown_lines or invalid_lines) and not args.skip_unknown:
+        print("Nothing printed. Fix the lines above or use --skip-unknown.")
+        return 1
+    if args.dry_run or not jobs:
+        return 0
+    if args.server is not None:
+        return print_through_server(item_data, jobs)
+
+    printing = Printing(detect_printers=False)
+    printing.warn = lambda title, message: print(f"{title}: {' '.join(message.split())}")
+    try:
+        printing.setup(*Printing.find_printers())
+    except PrintError as error:
+        print(error)
+        return 1
+    if args.printer is not None:
+        if args.printer not in printing.available_printer_names:
+            print(f"Unknown printer: {args.printer}")
+            return 1
+        printing.selected_printer_name = args.printer
+    print(f"Printing on {printing.target_name}.")
+
+    logger = PrintLogger()
+    failed_jobs = []
+    start_time = time.perf_counter()
+    # Decodes the labels of the next few jobs in the background while the current one is drawn.
+    lookahead = 4
+    if printing.needs_label_image:
+        for cushion, _, _ in jobs[:lookahead]:
+            item_data.labels.request(cushion.ean_13)
+    printable_jobs = []
+
+    def labels_to_print():
+        """Yields the labels of the pick list one line at a time, leaving out the labels that can't be loaded."""
+        labels = 0
+        for i, (cushion, quantity, scanned_barcode) in enumerate(jobs):
+            image = None
+            if printing.needs_label_image:
+                if i + lookahead < len(jobs):
+                    item_data.labels.request(jobs[i + lookahead][0].ean_13)
+                image = item_data.labels.get_image(cushion.ean_13)
+                if image.isNull():
+                    failed_jobs.append((cushion, quantity, f"Etiketten for {cushion.ean_13} kan ikke indlæses."))
+                    continue
+            printable_jobs.append((cushion, quantity, scanned_barcode))
+            yield cushion, image, quantity
+            labels += quantity
+            print_progress(i + 1, len(jobs), labels, time.perf_counter() - start_time)
+
+    # The whole pick list is sent as one document, so the printer is only opened once.
+    try:
+        printing.print_labels(labels_to_print())
+    except PrintError as error:
+        failed_jobs.extend((cushion, quantity, str(error)) for cushion, quantity, _ in printable_jobs)
+        printable_jobs = []
+    elapsed_time = time.perf_counter() - start_time
+    printed_labels = 0
+    for cushion, quantity, scanned_barcode in printable_jobs:
+        logger.write(cushion, quantity, "Batch", scanned_barcode, printing.target_name, elapsed_time)
+        printed_labels += quantity
+    logger.close()
+    print_summary(printed_labels, jobs, failed_jobs, elapsed_time)
+    if logger.error_message() is not None:
+        print(logger.error_message())
+    app.quit()
+    return 1 if failed_jobs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The benchmarks build widgets, but never show them.
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QSize, Qt
+from PyQt6.QtTest import QTest
+from PyQt6.QtWidgets import QApplication
+
+from CushionClass import Cushion
+from DataLoaderClass import DataLoader
+from FontsSizesClass import Fonts, Sizes
+from LabelArchiveClass import LabelArchive
+from LabelRasterizerClass import LabelRasterizer
+from LabelRendererClass import LabelRenderer
+
+item_names = [
+    "Palissade Dining Arm Chair Quilted Cushion",
+    "Palissade Lounge Chair Low Quilted Cushion CMHR foam",
+    "Seat Cushion for Palissade-Chair and Armchair CMHR",
+    "Palissade Dining Bench Seat Cushion",
+    "Soft Quilted Cushion for Palissade-Lounge Sofa CMHR",
+    "Back Cushion for Mindo Lounge Chair",
+    "Seat Cushion for Ruby Dining Chair",
+    "Harbour Lounge Sofa Seat Cushion"
+]
+colors = [
+    "Olive textile", "Sky grey textile", "Anthracite textile FR", "Iron red textile FR", "Sand textile",
+    "Cream textile Interliner", "Black textile", "Dark green textile"
+]
+# Typed one character at a time into the Manual tab's search box.
+search_queries = ["olive dining", "sky grey lounge", "ab56", "seat cushion chair"]
+
+
+def ean13(first_twelve_digits: str) -> str:
+    """Adds the check digit to twelve digits."""
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first_twelve_digits))
+    return first_twelve_digits + str((10 - total % 10) % 10)
+
+
+def write_synthetic_catalog(folder: str, item_count: int, seed: int = 1) -> dict:
+    """
+    Writes a BarTender file and a corrections file with item_count items to the folder. About 5 % of the items get
+    a "replace" correction and 1 % a "several items" correction. Returns the paths and the barcodes of each kind.
+    """
+    rng = random.Random(seed)
+    bartender_file_path = os.path.join(folder, "HyndeData.txt")
+    corrections_file_path = os.path.join(folder, "Rettelser.txt")
+    barcodes = []
+    with open(bartender_file_path, "w", encoding="utf-8-sig") as out_file:
+        out_file.write("Gammelt Varenummer;Varenavn;Farve;Stregkode;Nyt Varenummer\n")
+        for i in range(item_count):
+            barcode = ean13(f"571{i:09d}")
+            barcodes.append(barcode)
+            out_file.write(f"005-{i:06d}/{rng.randrange(10_000_000):07d};{rng.choice(item_names)};"
+                           f"{rng.choice(colors)};{barcode};AB{560 + i % 10}-B{i // 10 % 1000:03d}-"
+                           f"{chr(65 + i // 10_000 % 26)}{chr(65 + i // 260_000 % 26)}{i % 100:02d}\n")
+    replaced_barcodes = []
+    multiple_choice_barcodes = []
+    with open(corrections_file_path, "w", encoding="utf-8") as out_file:
+        out_file.write("Fejltype;Forkert stregkode;Korrekt stregkode 1; Korrekt stregkode 2;...\n")
+        for i in range(0, item_count, 20):
+            wrong_barcode = ean13(f"572{i:09d}")
+            replaced_barcodes.append(wrong_barcode)
+            out_file.write(f"erstat;{wrong_barcode};{barcodes[i]}\n")
+        for i in range(0, item_count - 2, 100):
+            wrong_barcode = ean13(f"573{i:09d}")
+            multiple_choice_barcodes.append(wrong_barcode)
+            out_file.write(f"flere;{wrong_barcode};{barcodes[i]};{barcodes[i + 1]};{barcodes[i + 2]}\n")
+    return {
+        "bartender_file_path": bartender_file_path,
+        "corrections_file_path": corrections_file_path,
+        "barcodes": barcodes,
+        "replaced_barcodes": replaced_barcodes,
+        "multiple_choice_barcodes": multiple_choice_barcodes
+    }
+
+
+def write_synthetic_pdfs(folder: str, barcodes: list) -> None:
+    """Writes a label PDF, the size of the real ones, for each barcode."""
+    import pymupdf
+    os.makedirs(folder, exist_ok=True)
+    for barcode in barcodes:
+        document = pymupdf.open()
+        page = document.new_page(width=234, height=113)
+        page.insert_text((10, 20), "Palissade Dining Arm Chair Quilted Cushion", fontsize=7)
+        page.insert_text((10, 32), "Olive textile", fontsize=7)
+        for i, digit in enumerate(barcode * 3):
+            if int(digit) % 2:
+                page.draw_rect(pymupdf.Rect(30 + i * 4, 45, 32 + i * 4, 95), color=(0, 0, 0), fill=(0, 0, 0))
+        page.insert_text((60, 105), barcode, fontsize=8)
+        document.save(os.path.join(folder, f"{barcode}.pdf"))
+        document.close()
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def create_data_loader(catalog: dict, folder: str) -> DataLoader:
+    """Creates a DataLoader for the synthetic catalog, keeping its snapshot and labels in the folder."""
+    item_data = DataLoader(catalog["bartender_file_path"], catalog["corrections_file_path"],
+                           snapshot_path=os.path.join(folder, "catalog.snapshot"),
+                           archive_path=os.path.join(folder, "labels.pack"), legacy_png_folder=None, load_now=False)
+    item_data.rasterizer = LabelRasterizer(os.path.join(folder, "PDF"), item_data.archive)
+    return item_data
+
+
+def benchmark_loading(catalog: dict, folder: str, measure_memory: bool) -> tuple:
+    """Measures loading the catalog from the source files, from the snapshot and, optionally, the memory used."""
+    metrics = {}
+    snapshot_path = os.path.join(folder, "catalog.snapshot")
+    start_time = time.perf_counter()
+    create_data_loader(catalog, folder).load()
+    metrics["parse_s"] = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    item_data = create_data_loader(catalog, folder)
+    item_data.load()
+    metrics["snapshot_load_s"] = time.perf_counter() - start_time
+    if measure_memory:
+        os.remove(snapshot_path)
+        tracemalloc.start()
+        traced_item_data = create_data_loader(catalog, folder)
+        traced_item_data.load()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics["memory_mb"] = current / 1_000_000
+        metrics["peak_memory_mb"] = peak / 1_000_000
+        del traced_item_data
+    return item_data, metrics
+
+
+def benchmark_resolution(item_data: DataLoader, catalog: dict, samples: int = 20_000) -> dict:
+    """Measures resolving a mix of correct, replaced, several-item and unknown barcodes."""
+    rng = random.Random(2)
+    barcodes = []
+    for _ in range(samples):
+        kind = rng.random()
+        if kind < 0.4:
+            barcodes.append(rng.choice(catalog["barcodes"]))
+        elif kind < 0.7 and catalog["replaced_barcodes"]:
+            barcodes.append(rng.choice(catalog["replaced_barcodes"]))
+        elif kind < 0.8 and catalog["multiple_choice_barcodes"]:
+            barcodes.append(rng.choice(catalog["multiple_choice_barcodes"]))
+        else:
+            barcodes.append(ean13(f"579{rng.randrange(10 ** 9):09d}"))
+    latencies = []
+    for barcode in barcodes:
+        start_time = time.perf_counter_ns()
+        item_data.resolve(barcode)
+        latencies.append((time.perf_counter_ns() - start_time) / 1000)
+    return {"resolve_p50_us": percentile(latencies, 0.5), "resolve_p99_us": percentile(latencies, 0.99)}
+
+
+def benchmark_filtering(item_data: DataLoader) -> dict:
+    """Measures the Manual tab's combobox update for each keystroke typed into its search box."""
+    from ManualTabSubclass import ManualTab
+    manual_tab = ManualTab(Fonts(), Sizes(), item_data, None)
+    search_box = manual_tab.search_entry_box.search_box
+    latencies = []
+    first_keystroke = None
+    for query in search_queries:
+        search_box.clear()
+        for character in query:
+            start_time = time.perf_counter()
+            QTest.keyClicks(search_box, character)
+            latency = (time.perf_counter() - start_time) * 1000
+            # The first keystroke searches every entry; the following ones narrow the previous result.
+            if first_keystroke is None:
+                first_keystroke = latency
+            else:
+                latencies.append(latency)
+        for _ in range(3):
+            start_time = time.perf_counter()
+            QTest.keyClick(search_box, Qt.Key.Key_Backspace)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+    manual_tab.deleteLater()
+    return {
+        "filter_first_keystroke_ms": first_keystroke,
+        "filter_keystroke_p50_ms": percentile(latencies, 0.5),
+        "filter_keystroke_max_ms": max(latencies)
+    }
+
+
+def benchmark_labels(folder: str, barcodes: list, workers: int) -> dict:
+    """
+    Measures rendering the label PDFs into the label archive, decoding them from it, drawing the labels from the
+    layout template instead, and scaling the labels down to preview size.
+    """
+    pdf_folder = os.path.join(folder, "PDF")
+    write_synthetic_pdfs(pdf_folder, barcodes)
+    archive = LabelArchive(os.path.join(folder, "labels.pack"))
+    rasterizer = LabelRasterizer(pdf_folder, archive, workers=workers)
+    start_time = time.perf_counter()
+    rasterizer.render(barcodes)
+    rasterization_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    images = [archive.get_image(barcode) for barcode in barcodes]
+    decoding_time = time.perf_counter() - start_time
+    renderer = LabelRenderer(LabelRenderer.default_template)
+    items = [Cushion.from_fields(f"ON-{i}", item_names[i % len(item_names)], "Olive textile", barcode, f"NN-{i}")
+             for i, barcode in enumerate(barcodes)]
+    start_time = time.perf_counter()
+    for item in items:
+        renderer.render(item)
+    template_time = time.perf_counter() - start_time
+    preview_size = QSize(*Sizes().label_preview)
+    scaling_times = []
+    for image in images:
+        start_time = time.perf_counter()
+        image.scaled(preview_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        scaling_times.append((time.perf_counter() - start_time) * 1000)
+    return {
+        "rasterize_labels_per_s": len(barcodes) / rasterization_time,
+        "archive_decode_labels_per_s": len(barcodes) / decoding_time,
+        "template_labels_per_s": len(barcodes) / template_time,
+        "preview_scale_p50_ms": percentile(scaling_times, 0.5)
+    }
+
+
+def processor_name() -> str:
+    """Returns the processor's model name; platform.processor() is empty on most Linux systems."""
+    try:
+        with open("/proc/cpuinfo", "r") as in_file:
+            for line in in_file:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def run_size(item_count: int, args) -> dict:
+    """Runs all the benchmarks on a synthetic catalog of item_count items."""
+    folder = tempfile.mkdtemp(prefix=f"hyndescanner-benchmark-{item_count}-")
+    try:
+        catalog = write_synthetic_catalog(folder, item_count)
+        results = {}
+        item_data, metrics = benchmark_loading(catalog, folder, not args.no_memory)
+        results.update(metrics)
+        results.update(benchmark_resolution(item_data, catalog))
+        results.update(benchmark_filtering(item_data))
+        if not args.no_labels:
+            results.update(benchmark_labels(folder, catalog["barcodes"][:args.label_count], args.workers))
+        return results
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares the results with the baseline. Metrics ending in "_per_s" regress if they fall below the baseline
+    divided by the tolerance; all others if they rise above the baseline multiplied by it.
+    Returns a description of each regression.
+    """
+    regressions = []
+    for size, baseline_metrics in baseline.items():
+        for metric, baseline_value in baseline_metrics.items():
+            value = results.get(size, {}).get(metric)
+            if value is None:
+                continue
+            if metric.endswith("_per_s"):
+                regressed = value < baseline_value / tolerance
+            else:
+                regressed = value > baseline_value * tolerance
+            if regressed:
+                regressions.append(f"{size} items: {metric} = {value:.4g} (baseline {baseline_value:.4g})")
+    return regressions
+
+
+def find_unchecked(results: dict, baseline: dict) -> list:
+    """Returns "size items: metric" for each measured metric that the baseline has no value for."""
+    return [f"{size} items: {metric}" for size, metrics in results.items() for metric in metrics
+            if metric not in baseline.get(size, {})]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the program's speed on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[150, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline; record it on the station it is meant for")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="allowed slowdown factor (default: the baseline's, or 1.5)")
+    parser.add_argument("--label-count", type=int, default=100, help="number of label PDFs to render per size")
+    parser.add_argument("--workers", type=int, default=None, help="number of rendering processes")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) memory measurement")
+    parser.add_argument("--no-labels", action="store_true", help="skip rendering and scaling labels")
+    args = parser.parse_args()
+
+    app = QApplication([])
+    results = {}
+    for item_count in args.sizes:
+        print(f"{item_count} items...")
+        results[str(item_count)] = run_size(item_count, args)
+        for metric, value in results[str(item_count)].items():
+            print(f"  {metric}: {value:.4g}")
+    # The machine the numbers come from; a baseline only means something on the machine it was recorded on.
+    report = {
+        "date": time.strftime("%Y-%m-%d"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": processor_name(),
+        "cpu_count": os.cpu_count(),
+        "results": results
+    }
+    with open(args.output, "w") as out_file:
+        json.dump(report, out_file, indent=1)
+    print(f"Results written to {args.output}.")
+
+    if args.save_baseline:
+        report["tolerance"] = args.tolerance or 1.5
+        with open(args.baseline, "w") as out_file:
+            json.dump(report, out_file, indent=1)
+        print(f"Baseline written to {args.baseline}.")
+        app.quit()
+        return 0
+    try:
+        with open(args.baseline, "r") as in_file:
+            baseline = json.load(in_file)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; use --save-baseline to store one.")
+        app.quit()
+        return 0
+    if baseline.get("processor") != report["processor"] or baseline.get("cpu_count") != report["cpu_count"]:
+        print(f"The baseline was recorded on another machine ({baseline.get('processor') or 'unknown processor'}, "
+              f"{baseline.get('cpu_count')} CPUs); the comparison may be meaningless.")
+    regressions = find_regressions(results, baseline["results"], args.tolerance or baseline.get("tolerance", 1.5))
+    unchecked = find_unchecked(results, baseline["results"])
+    if unchecked:
+        print(f"Not in the baseline, so not checked: {', '.join(unchecked)}. Record a new baseline with "
+              f"--save-baseline to check them.")
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if not regressions:
+        print("No regressions against the baseline.")
+    app.quit()
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import argparse
+import multiprocessing
+import signal
+import sys
+import threading
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+
+from CatalogServerClass import CatalogServer
+from CatalogWatcherClass import CatalogWatcher
+from DataLoaderClass import CatalogError, DataLoader
+from PrintingClass import Printing, PrintError
+from PrintSpoolClass import PrintSpool
+
+
+def main():
+    # Needed for the label rendering worker processes if the program is frozen into an executable.
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(
+        description="Loads the catalog and the labels once and serves them, and the printer, to the scanning stations.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on; use 0.0.0.0 to accept other computers (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--printer", help="printer to use instead of the one in Data/printer.json")
+    parser.add_argument("--no-printing", action="store_true", help="serve lookups and previews only")
+    parser.add_argument("--label-cache", type=int, default=256, help="number of decoded labels to keep in memory")
+    parser.add_argument("--verbose", action="store_true", help="print every request")
+    args = parser.parse_args()
+
+    # Qt needs an application object for printing and decoding labels, and its event loop for watching the files.
+    app = QApplication([])
+    item_data = DataLoader("Data/HyndeData.txt", "Data/Rettelser.txt", load_now=False)
+    item_data.labels.max_labels = args.label_cache
+    try:
+        item_data.load()
+    except CatalogError as error:
+        print(f"Failed to load the catalog: {error}")
+        return 1
+    print(f"{len(item_data.cushions)} items loaded.")
+    if item_data.catalog_errors:
+        print(f"{len(item_data.catalog_errors)} invalid lines in the catalog were skipped:")
+        print(item_data.catalog_error_report())
+    if item_data.label_template_error:
+        print(f"The label template can't be used, so the default one is: {item_data.label_template_error}")
+
+    print_spool = None
+    if not args.no_printing:
+        printing = Printing(detect_printers=False)
+        printing.warn = lambda title, message: print(f"{title}: {' '.join(message.split())}")
+        try:
+            printing.setup(*Printing.find_printers())
+        except PrintError as error:
+            print(error)
+            return 1
+        if args.printer is not None:
+            if args.printer not in printing.available_printer_names:
+                print(f"Unknown printer: {args.printer}")
+                return 1
+            printing.selected_printer_name = args.printer
+        print_spool = PrintSpool(printing, item_data.labels)
+        print_spool.job_status_changed.connect(
+            lambda job, status: print(f"Job {job.job_id} from {job.station}: {job.copy_count} x "
+                                      f"{job.cushion.ean_13} - {status}" + (f": {job.error}" if job.error else "")))
+        print_spool.log_error_changed.connect(
+            lambda message: print(message if message else "The print log is being written again."))
+        print(f"Printing on {printing.target_name}.")
+
+    try:
+        server = CatalogServer((args.host, args.port), item_data, print_spool, verbose=args.verbose)
+    except OSError as error:
+        print(f"Can't listen on {args.host}:{args.port}: {error}")
+        return 1
+    # Reloads the catalog when its files are edited; requests wait while that happens.
+    catalog_watcher = CatalogWatcher(item_data, lock=server.lock)
+
+    def on_catalog_reloaded(changes: dict) -> None:
+        server.on_catalog_reloaded(changes)
+        print(f"Catalog reloaded: {len(changes['added'])} added, {len(changes['updated'])} updated, "
+              f"{len(changes['removed'])} removed.")
+
+    catalog_watcher.catalog_reloaded.connect(on_catalog_reloaded)
+    catalog_watcher.reload_failed.connect(lambda message: print(f"Reload failed: {message}"))
+
+    server_thread = threading.Thread(target=server.serve_forever, name="catalog-server", daemon=True)
+    server_thread.start()
+    print(f"Serving on http://{args.host}:{args.port} - press Ctrl+C to stop.")
+    # Qt's event loop doesn't let Python handle Ctrl+C, so the signal quits the loop instead. The timer gives Python
+    # a chance to notice the signal.
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
+    app.exec()
+    server.shutdown()
+    server.server_close()
+    if print_spool is not None:
+        print_spool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,11 @@
+# Imported first, so that the time taken by every other import is measured.
+from StartupTimerClass import startup_timer
+startup_timer.install_import_hook()
+
+import multiprocessing
+import os
+import sys
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QApplication
 
 import styles
@@ -7,18 +15,67 @@ from PrintingClass import Printing
 from MainWindowSubclass import MainWindow
 
 
+def on_window_shown(main_window: MainWindow, report_only: bool) -> None:
+    """
+    Records the time until the main window is on screen and writes the startup report. If a startup budget (in
+    seconds) is set in the HYNDESCANNER_STARTUP_BUDGET environment variable and the start took longer, says so.
+    With --startup-report, prints the report and exits instead, with exit code 1 if the budget was exceeded.
+    """
+    startup_timer.mark("window shown")
+    startup_timer.remove_import_hook()
+    try:
+        startup_timer.save()
+    except OSError:
+        pass
+    budget = float(os.environ.get("HYNDESCANNER_STARTUP_BUDGET", 0)) or None
+    over_budget = budget is not None and startup_timer.elapsed("window shown") > budget
+    if report_only:
+        print(startup_timer.report())
+        if budget is not None:
+            print(f"Budget: {budget * 1000:.0f} ms - {'exceeded' if over_budget else 'met'}")
+        main_window.close()
+        QApplication.exit(1 if over_budget else 0)
+    elif over_budget:
+        main_window.statusBar().showMessage(
+            f"Opstarten tog {startup_timer.elapsed('window shown'):.1f} s (budget: {budget:.1f} s).", 10000)
+
+
 def main():
+    startup_timer.mark("imports")
+    # Needed for the label rendering worker processes if the program is frozen into an executable.
+    multiprocessing.freeze_support()
+    report_only = "--startup-report" in sys.argv
     app = QApplication([])
     app.setStyleSheet(styles.style_sheet)
-    item_data = DataLoader("Data/HyndeData.txt", "Data/Rettelser.txt")
+    startup_timer.mark("application created")
+    # The catalog and the printers are loaded in the background once the window is shown. If the address of a
+    # catalog server is set in the HYNDESCANNER_SERVER environment variable (e.g. http://lager-pc:8765), the catalog
+    # is taken from the server and the labels are printed by it instead.
+    server_url = os.environ.get("HYNDESCANNER_SERVER")
+    print_spool = None
+    if server_url:
+        # Only imported on a station using the server, so that the other stations don't pay for the imports.
+        from CatalogClientClass import CatalogClient
+        from RemoteCatalogClass import RemoteCatalog
+        from RemotePrintSpoolClass import RemotePrintSpool
+        client = CatalogClient(server_url)
+        item_data = RemoteCatalog(client)
+        print_spool = RemotePrintSpool(client)
+    else:
+        item_data = DataLoader("Data/HyndeData.txt", "Data/Rettelser.txt", load_now=False)
     fonts = Fonts()
     sizes = Sizes()
-    printing = Printing()
-    main_window = MainWindow(fonts, sizes, printing, item_data)
+    printing = Printing(detect_printers=False)
+    main_window = MainWindow(fonts, sizes, printing, item_data, print_spool)
+    startup_timer.mark("window created")
     main_window.scanner_tab.scan_entry_box.setFocus()
     main_window.show()
-    app.exec()
+    # Runs once the event loop has started, after the window has been painted for the first time.
+    QTimer.singleShot(0, lambda: on_window_shown(main_window, report_only))
+    if not report_only:
+        main_window.start_loading()
+    return app.exec()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import argparse
+import glob
+import sys
+import time
+
+from PrintHistoryClass import PrintHistory
+
+
+def import_logs(history: PrintHistory, args) -> int:
+    paths = []
+    for pattern in args.logs:
+        paths += sorted(glob.glob(pattern)) or [pattern]
+    for path in paths:
+        start_time = time.perf_counter()
+        try:
+            inserted = history.import_log(path, args.station)
+        except OSError as error:
+            print(f"Failed: {path}: {error}")
+            return 1
+        print(f"{path}: {inserted} new record(s) in {time.perf_counter() - start_time:.2f} s.")
+    return 0
+
+
+def show_totals(history: PrintHistory, args) -> int:
+    start_time = time.perf_counter()
+    rows = history.totals(args.by, args.since, args.until, args.barcode, args.item_number, args.mode, args.search)
+    elapsed_time = time.perf_counter() - start_time
+    for row in rows:
+        label = row["key"]
+        if args.by == "item" and row["color"]:
+            label = f"{row['item_name']}, {row['color']}, {row['key']}"
+        print(f"{row['copies']:>8} copies {row['jobs']:>6} jobs  {label}")
+    print(f"{sum(row['copies'] for row in rows)} copies in {sum(row['jobs'] for row in rows)} jobs "
+          f"({elapsed_time * 1000:.1f} ms).")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports the print logs and shows print totals.")
+    parser.add_argument("--database", default="Data/history.sqlite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="import log files (log.txt or .jsonl)")
+    import_parser.add_argument("logs", nargs="*", default=["Data/log.txt", "Data/log*.jsonl"],
+                               help="files or glob patterns")
+    import_parser.add_argument("--station", default=None,
+                               help="station name for records that don't have one (default: the log's folder name)")
+    import_parser.set_defaults(handler=import_logs)
+
+    totals_parser = commands.add_parser("totals", help="show the number of copies printed")
+    totals_parser.add_argument("--by", choices=sorted(PrintHistory.group_columns), default="item")
+    totals_parser.add_argument("--since", help="first day, YYYY-MM-DD")
+    totals_parser.add_argument("--until", help="day after the last day, YYYY-MM-DD")
+    totals_parser.add_argument("--barcode")
+    totals_parser.add_argument("--item-number")
+    totals_parser.add_argument("--mode", choices=["manuel", "scanner", "batch"])
+    totals_parser.add_argument("--search", help="words that must appear in the item name or color")
+    totals_parser.set_defaults(handler=show_totals)
+    args = parser.parse_args()
+
+    history = PrintHistory(args.database)
+    try:
+        return args.handler(history, args)
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
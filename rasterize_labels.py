@@ -0,0 +1,60 @@
+import argparse
+import sys
+import time
+
+from LabelArchiveClass import LabelArchive
+from LabelRasterizerClass import LabelRasterizer
+
+
+def print_progress(done: int, total: int, barcode: str) -> None:
+    """Prints a one-line progress report, overwriting the previous one."""
+    sys.stdout.write(f"\r{done}/{total} ({done * 100 // total}%) {barcode}")
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders the PDF labels into the label archive.")
+    parser.add_argument("--all", action="store_true",
+                        help="re-render every label, not only the missing and outdated ones")
+    parser.add_argument("--pdf-folder", default="Data/PDF")
+    parser.add_argument("--archive", default="Data/labels.pack")
+    parser.add_argument("--import-png", metavar="FOLDER",
+                        help="add the PNG labels in the folder that aren't in the archive yet, then render as usual")
+    parser.add_argument("--compact", action="store_true",
+                        help="only rewrite the archive without its replaced and removed labels; close the program on "
+                             "all stations first")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    try:
+        archive = LabelArchive(args.archive)
+    except ValueError as error:
+        print(error)
+        return 1
+    if args.compact:
+        size_before, size_after = archive.compact()
+        print(f"Compacted {len(archive)} label(s) from {size_before / 1e6:.1f} MB to {size_after / 1e6:.1f} MB.")
+        return 0
+    if args.import_png is not None:
+        imported = archive.import_png_folder(args.import_png)
+        print(f"Imported {len(imported)} PNG label(s).")
+
+    rasterizer = LabelRasterizer(args.pdf_folder, archive, args.dpi, args.workers)
+    barcodes = rasterizer.all_pdf_barcodes()
+    if not args.all:
+        barcodes = rasterizer.find_outdated(barcodes)
+    print(f"{len(barcodes)} label(s) to render.")
+    start_time = time.perf_counter()
+    rendered = rasterizer.render(barcodes, print_progress)
+    elapsed_time = time.perf_counter() - start_time
+    if barcodes:
+        print()
+    print(f"Rendered {len(rendered)} label(s) in {elapsed_time:.1f} s.")
+    for barcode, error in rasterizer.failed.items():
+        print(f"Failed: {barcode}: {error}")
+    return 1 if rasterizer.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
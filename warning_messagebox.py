@@ -13,4 +13,19 @@ def show_warning(title: str, message: str) -> None:
     ok_button = message_box.addButton(QMessageBox.StandardButton.Ok)
     ok_button.setFixedSize(QSize(80, 20))
     message_box.exec()
-    
\ No newline at end of file
+    
+
+def ask_question(title: str, message: str) -> bool:
+    """Spawns a MessageBox with the given title and question; returns True if the user answers yes."""
+    message_box = QMessageBox()
+    message_box.setWindowTitle(title)
+    message_box.setText(message)
+    message_box.setIcon(QMessageBox.Icon.Question)
+    message_box.setWindowIcon(QIcon("Data/barcode-scan.ico"))
+    yes_button = message_box.addButton("Ja", QMessageBox.ButtonRole.YesRole)
+    no_button = message_box.addButton("Nej", QMessageBox.ButtonRole.NoRole)
+    for button in (yes_button, no_button):
+        button.setFixedSize(QSize(80, 20))
+    message_box.setDefaultButton(yes_button)
+    message_box.exec()
+    return message_box.clickedButton() is yes_button